@@ -0,0 +1,118 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# some of the code taken from:
+# https://github.com/NVIDIA/NeMo/blob/master/nemo/collections/asr/beam_search_decoder.py
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+"""CTC beam search with a KenLM language model over cached acoustic model
+outputs. The LM is loaded once and the (alpha, beta) grid is spread over a
+process pool, so a grid search costs one beam pass per point instead of one
+inference per point.
+"""
+
+# shared with the forked pool workers, set by LMGridSearch
+_grid_state = {}
+
+
+def grid_points(alpha, alpha_max, alpha_step, beta, beta_max, beta_step):
+    """(alpha, beta) pairs of the jasper_eval grid, max values included
+    (alpha_max/beta_max None: single value)
+    """
+    if alpha_max is None:
+        alpha_max = alpha
+    if beta_max is None:
+        beta_max = beta
+    # include alpha_max/beta_max in tuning range
+    alphas = np.arange(alpha, alpha_max + alpha_step/10.0, alpha_step)
+    betas = np.arange(beta, beta_max + beta_step/10.0, beta_step)
+    return [(float(a), float(b)) for a in alphas for b in betas]
+
+
+def unbatch_logprobs(log_probs, lengths):
+    """Per utterance float32 log-prob matrices (T x V) from the batched
+    outputs of neural_factory.infer
+    Arguments:
+      log_probs: list of batches (B x T x V) of log-probs
+      lengths: list of batches (B) of encoded lengths
+    """
+    logprobs = []
+    for batch, batch_lengths in zip(log_probs, lengths):
+        batch = batch.float().cpu().numpy()
+        for j in range(batch.shape[0]):
+            logprobs.append(batch[j, :int(batch_lengths[j])])
+    return logprobs
+
+
+def logprobs_to_probs(logprobs):
+    """float32 probabilities for the decoder from per utterance log-probs
+    (arrays, memory mapped store or pickle of jasper_eval.py)
+    """
+    return [np.exp(l, dtype=np.float32) for l in logprobs]
+
+
+def _decode_point(point):
+    alpha, beta = point
+    from ctc_decoders import ctc_beam_search_decoder_batch
+    state = _grid_state
+    scorer = state['scorer']
+    scorer.reset_params(alpha, beta)
+    res = ctc_beam_search_decoder_batch(
+        state['probs'], state['vocab'],
+        beam_size=state['beam_width'],
+        num_processes=state['num_threads'],
+        ext_scoring_func=scorer,
+        cutoff_prob=state['cutoff_prob'],
+        cutoff_top_n=state['cutoff_top_n'])
+    return point, [candidates[0][1] for candidates in res]
+
+
+class LMGridSearch(object):
+    """Beam search decoding of cached probabilities for many (alpha, beta)
+    Arguments:
+      vocab: model labels
+      lm_path: KenLM binary
+      beam_width: beam width
+      num_cpus: cpus for decoding (default all)
+      cutoff_prob: cumulative probability cutoff of the candidate characters
+      cutoff_top_n: max candidate characters per step
+    """
+
+    def __init__(self, vocab, lm_path, beam_width=128, num_cpus=None,
+                 cutoff_prob=1.0, cutoff_top_n=40):
+        from ctc_decoders import Scorer
+        self.vocab = vocab
+        self.beam_width = beam_width
+        self.num_cpus = max(num_cpus or os.cpu_count(), 1)
+        self.cutoff_prob = cutoff_prob
+        self.cutoff_top_n = cutoff_top_n
+        # parameters are reset for every grid point
+        self.scorer = Scorer(1.0, 1.0, model_path=lm_path, vocabulary=vocab)
+
+    def search(self, probs, points):
+        """Yield (alpha, beta), hypotheses for every grid point (in completion
+        order). Points are decoded in parallel, the decoder of each point gets
+        the cpus left over.
+        Arguments:
+          probs: list of T x V probability matrices (see logprobs_to_probs)
+          points: list of (alpha, beta)
+        """
+        num_workers = min(self.num_cpus, len(points))
+        _grid_state.update(
+            scorer=self.scorer, probs=probs, vocab=self.vocab,
+            beam_width=self.beam_width,
+            num_threads=max(self.num_cpus // num_workers, 1),
+            cutoff_prob=self.cutoff_prob, cutoff_top_n=self.cutoff_top_n)
+        try:
+            if num_workers == 1:
+                for point in points:
+                    yield _decode_point(point)
+            else:
+                # workers are forked, the LM and the probabilities are shared
+                # copy-on-write instead of being reloaded/pickled per point
+                with Pool(num_workers) as p:
+                    for result in p.imap_unordered(_decode_point, points):
+                        yield result
+        finally:
+            _grid_state.clear()
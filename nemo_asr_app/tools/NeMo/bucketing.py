@@ -0,0 +1,168 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import random
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Sampler
+
+import nemo
+from nemo.backends.pytorch.nm import DataLayerNM
+
+"""Duration bucketed batches for AudioToTextDataLayer: batches hold clips of
+similar length so little of the convolution compute goes to padding.
+"""
+
+
+def dataset_durations(dataset):
+    """Durations (secs) of the entries of a NeMo AudioDataset, in dataset
+    order (after the min/max duration filtering of the data layer)
+    """
+    collection = getattr(dataset, 'collection', None)
+    if collection is not None:
+        return [entry.duration for entry in collection]
+    # NeMo <= 0.10
+    manifest = getattr(dataset, 'manifest', None)
+    if manifest is not None:
+        return [entry['duration'] for entry in manifest.data]
+    raise ValueError('Cannot read the durations of {}'.format(type(dataset).__name__))
+
+
+def padding_fraction(durations, batches):
+    """Fraction of the padded batch audio that is padding"""
+    durations = np.asarray(durations)
+    total = sum(len(batch) * durations[batch].max() for batch in batches if len(batch))
+    return 1. - durations.sum() / total if total else 0.
+
+
+class BucketSampler(Sampler):
+    """Indices in an order where each run of batch_size consecutive indices is
+    a batch of clips of similar duration (the last batch may be smaller).
+    Arguments:
+      durations: duration of each dataset entry
+      batch_size: batch size
+      shuffle: False: batches sorted by duration (eval)
+               True: entries are shuffled, sorted by duration within windows of
+                     sort_window batches and the batches are shuffled (train)
+      sort_window: batches per sorted window when shuffling
+      rank, world_size: each rank gets every world_size-th batch (all ranks
+                        get the same number of batches)
+      seed: shuffling seed (the epoch is added)
+    """
+
+    def __init__(self, durations, batch_size, shuffle=False, sort_window=100,
+                 rank=0, world_size=1, seed=0):
+        self.durations = np.asarray(durations)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.sort_window = sort_window
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.epoch = 0
+        self.order = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def batches(self, epoch=0):
+        """Batches (lists of dataset indices) of this rank for an epoch"""
+        if not self.shuffle:
+            indices = np.argsort(self.durations, kind='stable')
+            batches = [indices[i:i + self.batch_size]
+                       for i in range(0, len(indices), self.batch_size)]
+        else:
+            rng = random.Random(self.seed + epoch)
+            indices = list(range(len(self.durations)))
+            rng.shuffle(indices)
+            window = self.batch_size * self.sort_window
+            batches = []
+            for start in range(0, len(indices), window):
+                chunk = sorted(indices[start:start + window], key=lambda i: self.durations[i])
+                batches.extend(chunk[i:i + self.batch_size]
+                               for i in range(0, len(chunk), self.batch_size))
+            # only the last batch may be smaller than batch_size
+            full = [b for b in batches if len(b) == self.batch_size]
+            rng.shuffle(full)
+            batches = full + [b for b in batches if len(b) != self.batch_size]
+        if self.world_size > 1:
+            num_batches = len(batches) // self.world_size * self.world_size
+            batches = batches[:num_batches][self.rank::self.world_size]
+        return [list(b) for b in batches]
+
+    def __iter__(self):
+        batches = self.batches(self.epoch)
+        self.order = [i for batch in batches for i in batch]
+        if self.shuffle:
+            # new order every epoch without distributed set_epoch calls
+            self.epoch += 1
+        return iter(self.order)
+
+    def __len__(self):
+        return sum(len(b) for b in self.batches(self.epoch))
+
+
+def restore_order(items, order):
+    """Items of a bucketed run back in dataset order
+    Arguments:
+      items: per utterance outputs in the order of the sampler
+      order: BucketSampler.order
+    """
+    restored = [None] * len(items)
+    for i, item in zip(order, items):
+        restored[i] = item
+    return restored
+
+
+class BucketingDataLayer(DataLayerNM):
+    """AudioToTextDataLayer with duration bucketed batches. The data layer
+    has no dataset so NeMo iterates its data_iterator instead of building a
+    plain DataLoader.
+    Arguments:
+      data_layer: AudioToTextDataLayer
+      shuffle: shuffled buckets (train) or sorted batches (eval, see
+               restore_order)
+      sort_window: batches per sorted window when shuffling
+      seed: shuffling seed
+    """
+
+    @property
+    def output_ports(self):
+        return self._data_layer.output_ports
+
+    def __init__(self, data_layer, shuffle=False, sort_window=100, seed=0):
+        super().__init__()
+        self._data_layer = data_layer
+        loader = data_layer.data_iterator
+        rank, world_size = 0, 1
+        if shuffle and torch.distributed.is_initialized():
+            rank = torch.distributed.get_rank()
+            world_size = torch.distributed.get_world_size()
+        self.durations = dataset_durations(data_layer._dataset)
+        self.sampler = BucketSampler(self.durations, loader.batch_size, shuffle=shuffle,
+                                     sort_window=sort_window, rank=rank,
+                                     world_size=world_size, seed=seed)
+        self._dataloader = DataLoader(
+            dataset=data_layer._dataset,
+            batch_size=loader.batch_size,
+            sampler=self.sampler,
+            collate_fn=loader.collate_fn,
+            num_workers=loader.num_workers,
+            drop_last=False)
+
+        batch_size = loader.batch_size
+        plain = [np.arange(i, min(i + batch_size, len(self.durations)))
+                 for i in range(0, len(self.durations), batch_size)]
+        nemo.logging.info('Padding fraction: {:.1%} in plain batches, {:.1%} in bucketed batches'.format(
+            padding_fraction(self.durations, plain),
+            padding_fraction(self.durations, self.sampler.batches())))
+
+    def __len__(self):
+        return len(self._data_layer)
+
+    @property
+    def dataset(self):
+        return None
+
+    @property
+    def data_iterator(self):
+        return self._dataloader
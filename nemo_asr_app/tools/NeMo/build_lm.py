@@ -1,45 +1,196 @@
 # Copyright (c) 2019 NVIDIA Corporation
-import pandas as pd
 import os
+import json
+import time
 import argparse
-import shutil
-import errno
+import subprocess
+from multiprocessing.pool import ThreadPool
+from ruamel.yaml import YAML
 from tools.System.config import cfg
 from tools.filetools import mkdir_p
+from tools.transcript_tools import vocab_normalizer
 
-if __name__ == '__main__':
+"""Build KenLM n-gram language models. The corpus (text file, or the text of
+a NeMo manifest) is normalized and streamed to the stdin of lmplz without an
+intermediate copy; several orders are built concurrently from one pass over
+the corpus. Each phase is timed and the KenLM output goes to a log file.
+"""
+
+KENLM_BIN = os.path.join(cfg.MODEL.LM.DECODERS, 'kenlm', 'build', 'bin')
+
+
+def corpus_lines(path, normalizer=None):
+  """Lines of a text corpus or transcripts of a NeMo manifest (.json)
+  Arguments:
+    path: .txt (one sentence per line) or .json manifest
+    normalizer: optional TextNormalizer applied to each line
+  """
+  is_manifest = path.endswith('.json')
+  with open(path, 'r') as f:
+    for line in f:
+      if is_manifest:
+        if not line.strip():
+          continue
+        line = json.loads(line)['text']
+      if normalizer is not None:
+        line = normalizer(line)
+      else:
+        line = line.rstrip('\n')
+      if line:
+        yield line
+
+
+def lm_paths(output_dir, project_id, suffix=''):
+  """arpa, binary LM and log paths of a build"""
+  name = os.path.join(output_dir, project_id + suffix)
+  return name + '.arpa', name + '_lm.binary', name + '.log'
+
+
+_MEMORY_UNITS = {'b': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+
+def _split_memory(memory, num_builds):
+  """lmplz -S of each of num_builds concurrent builds sharing memory
+  (percentage of the machine memory, bytes or K/M/G/T suffixed size)"""
+  memory = memory.strip()
+  if memory.endswith('%'):
+    return '{:g}%'.format(float(memory[:-1]) / num_builds)
+  unit = memory[-1].lower()
+  if unit in _MEMORY_UNITS:
+    size = float(memory[:-1]) * _MEMORY_UNITS[unit]
+  else:
+    # lmplz reads a plain number as KiB
+    size = float(memory) * _MEMORY_UNITS['k']
+  return '{}K'.format(max(int(size / num_builds) // _MEMORY_UNITS['k'], 1))
+
+
+def build_lms(text, orders, project_id, output_dir=cfg.MODEL.LM.PATH,
+              memory='80%', temp_dir=None, normalizer=None, keep_arpa=False):
+  """Build one KenLM binary per n-gram order
+  Arguments:
+    text: corpus (.txt or NeMo .json manifest)
+    orders: list of n-gram orders, built concurrently
+    project_id: used to name the models (<project_id>_lm.binary for a single
+                order, <project_id>-<n>gram_lm.binary for several)
+    output_dir: directory of the models and logs
+    memory: lmplz -S, total for all builds (e.g. 80%, 16G)
+    temp_dir: lmplz -T (default output_dir)
+    normalizer: TextNormalizer of the corpus lines
+    keep_arpa: keep the arpa files
+
+  Returns:
+    dict n -> LM binary path, dict phase -> seconds
+  """
+  mkdir_p(output_dir)
+  temp_dir = temp_dir or output_dir
+  memory = _split_memory(memory, len(orders))
+  builds = {}
+  succeeded = False
+  try:
+    for n in orders:
+      suffix = '' if len(orders) == 1 else '-{}gram'.format(n)
+      arpa, binary, log = lm_paths(output_dir, project_id, suffix)
+      log_file = open(log, 'w')
+      cmd = [os.path.join(KENLM_BIN, 'lmplz'), '-o', str(n), '-S', memory,
+             '-T', temp_dir, '--arpa', arpa]
+      print(' '.join(cmd) + ' < ' + text)
+      proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=log_file,
+                              stderr=subprocess.STDOUT, universal_newlines=True)
+      builds[n] = (proc, arpa, binary, log, log_file)
+
+    # one pass over the corpus feeds every lmplz, a build that exits early
+    # is dropped and the others keep reading
+    timings = {}
+    start = time.time()
+    num_lines = 0
+    feeding = [proc for proc, _, _, _, _ in builds.values()]
+    for line in corpus_lines(text, normalizer):
+      if not feeding:
+        break
+      for proc in list(feeding):
+        try:
+          proc.stdin.write(line + '\n')
+        except BrokenPipeError:
+          feeding.remove(proc)
+      num_lines += 1
+    for proc, _, _, _, _ in builds.values():
+      try:
+        proc.stdin.close()
+      except BrokenPipeError:
+        pass
+    timings['corpus'] = time.time() - start
+    print('Streamed {} lines in {:.1f} s'.format(num_lines, timings['corpus']))
+    start = time.time()
+    for n, (proc, _, _, log, _) in builds.items():
+      if proc.wait() != 0:
+        raise RuntimeError('lmplz -o {} failed, see {}'.format(n, log))
+    # lmplz time after the end of the corpus (the sort and arpa output)
+    timings['lmplz'] = time.time() - start
+    succeeded = True
+  finally:
+    if not succeeded:
+      for proc, arpa, _, _, log_file in builds.values():
+        if proc.poll() is None:
+          proc.kill()
+        proc.wait()
+        log_file.close()
+        if os.path.exists(arpa):
+          os.remove(arpa)
+
+  def build_binary(n):
+    proc, arpa, binary, log, log_file = builds[n]
+    cmd = [os.path.join(KENLM_BIN, 'build_binary'), 'trie', '-q', '8', '-b', '7',
+           '-a', '256', arpa, binary]
+    print(' '.join(cmd))
+    returncode = subprocess.call(cmd, stdout=log_file, stderr=subprocess.STDOUT)
+    log_file.close()
+    if returncode != 0:
+      raise RuntimeError('build_binary of {} failed, see {}'.format(arpa, log))
+    if not keep_arpa:
+      os.remove(arpa)
+    return n, binary
+
+  start = time.time()
+  with ThreadPool(len(orders)) as pool:
+    binaries = dict(pool.map(build_binary, orders))
+  timings['build_binary'] = time.time() - start
+  return binaries, timings
+
+
+def main():
   """Build Languauge Model
   Arguments:
-    text: text file with lm dataset
-    n: number of words for n-gram
+    text: text file with lm dataset (or NeMo manifest)
+    n: number of words for n-gram (comma separated orders are built concurrently)
     project_id: used to identify model
   """
-  # arguments text file
   parser = argparse.ArgumentParser(description='Build N-gram LM model from TXT files')
-  parser.add_argument('text', metavar='text', type=str, help='text file')
-  parser.add_argument('--n', type=int, help='n for n-grams', default=3)
+  parser.add_argument('text', metavar='text', type=str, help='text file or NeMo manifest (.json)')
+  parser.add_argument('--n', type=str, help='n for n-grams, e.g. 6 or 3,4,6', default='3')
   parser.add_argument('--project_id', type=str, help='project id', default='lm')
+  parser.add_argument('--memory', type=str, default='80%',
+                      help='lmplz -S memory of all builds (e.g. 80%%, 16G)')
+  parser.add_argument('--temp_dir', type=str, default=None,
+                      help='lmplz -T directory of the sort files (default: output dir)')
+  parser.add_argument('--model_config', type=str, default=None,
+                      help='normalize the corpus to the labels of this model config')
+  parser.add_argument('--keep_arpa', action='store_true')
   args = parser.parse_args()
 
-  # directories
-  output_dir = cfg.MODEL.LM.PATH
-  mkdir_p(output_dir)
-  corpus_name = os.path.join(output_dir, args.project_id + '.txt')
-  arpa_name = os.path.join(output_dir, args.project_id + '.arpa')
-  lm_name = os.path.join(output_dir, args.project_id + '_lm.binary')
-  trie_name = os.path.join(output_dir, args.project_id + '-lm.trie')
-
-  # copy training .txt to project with correct name
-  shutil.copy(args.text, corpus_name)
-
-  # build lm model
-  command = cfg.MODEL.LM.DECODERS + '/kenlm/build/bin/lmplz --text {} --arpa {} --o {}'.format(
-  corpus_name, arpa_name, args.n)
-  print(command)
-  os.system(command)
+  normalizer = None
+  if args.model_config:
+    with open(args.model_config) as f:
+      normalizer = vocab_normalizer(YAML(typ='safe').load(f)['labels'])
 
-  command = cfg.MODEL.LM.DECODERS + '/kenlm/build/bin/build_binary trie -q 8 -b 7 -a 256 {} {}'.format(arpa_name, lm_name)
-  print(command)
-  os.system(command)
+  orders = [int(n) for n in args.n.split(',')]
+  start = time.time()
+  binaries, timings = build_lms(args.text, orders, args.project_id,
+                                memory=args.memory, temp_dir=args.temp_dir,
+                                normalizer=normalizer, keep_arpa=args.keep_arpa)
+  for n, binary in sorted(binaries.items()):
+    print('{}-gram LM: {}'.format(n, binary))
+  print('Timings: ' + ', '.join('{} {:.1f} s'.format(k, v) for k, v in timings.items()) +
+        ', total {:.1f} s'.format(time.time() - start))
 
-  os.remove(arpa_name)
+if __name__ == '__main__':
+  main()
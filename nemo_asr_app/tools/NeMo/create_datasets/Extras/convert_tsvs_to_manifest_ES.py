@@ -5,27 +5,15 @@ import pandas as pd
 import subprocess
 import json
 import codecs
-import unidecode
+from tools.transcript_tools import TextNormalizer
 
 
+# vocabulary
+valid_chars = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "'", "á", "é", "í", "ó", "ú", "ñ", "ü")
+normalizer = TextNormalizer(valid_chars)
+
 def normalize_str(txt) -> str:
-    valid_chars = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "'", "á", "é", "í", "ó", "ú", "ñ", "ü")
-    new_txt = txt.lower().strip()
-    #new_txt = unidecode.unidecode(txt.lower().strip())
-    res_arr = []
-    for c in new_txt:
-        if c in valid_chars:
-            res_arr.append(c)
-        else:
-            # remove accent and see if it is valid
-            non_accent_c = unidecode.unidecode(c)
-            if non_accent_c in valid_chars:
-                res_arr.append(non_accent_c)
-            # a character we don't know
-            else:
-                res_arr.append(' ')
-    res = ''.join(res_arr).strip()
-    return ' '.join(res.split())
+    return normalizer.normalize(txt)
 
 def tsv_to_manifest(tsv_files, manifest_file, prefix):
   manifests = []
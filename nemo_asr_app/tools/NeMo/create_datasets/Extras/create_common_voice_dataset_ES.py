@@ -5,11 +5,11 @@ import pandas as pd
 import subprocess
 import json
 import codecs
-import unidecode
 import argparse
 from num2words import num2words
 from typing import List
 from tools.filetools import file_exists
+from tools.transcript_tools import vocab_normalizer
 
 #alphabet = [" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "'"]
 alphabet = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "'", "á", "é", "í", "ó", "ú", "ñ", "ü")
@@ -35,20 +35,7 @@ def nums2strings(txt):
   return ' '.join(words)
 
 def remove_non_vocab_chars(txt: str, valid_chars: List[str]) -> str:
-    res_arr = []
-    for c in txt:
-        if c in valid_chars:
-            res_arr.append(c)
-        else:
-            # remove accent and see if it is valid
-            non_accent_c = unidecode.unidecode(c)
-            if non_accent_c in valid_chars:
-                res_arr.append(non_accent_c)
-            # a character we don't know
-            else:
-                res_arr.append(' ')
-    res = ''.join(res_arr).strip()
-    return ' '.join(res.split())
+    return vocab_normalizer(valid_chars, lowercase=False).normalize(txt)
 
 def process_transcript(txt: str, vocab: List[str]) -> str:
     # Lowercase
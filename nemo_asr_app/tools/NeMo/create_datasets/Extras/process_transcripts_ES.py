@@ -1,11 +1,13 @@
 import json
-import unidecode
 import inflect
 from argparse import ArgumentParser
 from typing import List
+from tools.transcript_tools import vocab_normalizer
+from tools.manifest_tools import DurationStats, process_manifests_parallel
 parser = ArgumentParser()
 parser.add_argument("--manifests_in",  type=str, required=True, nargs="*", help="path to input manifests")
 parser.add_argument("--manifests_out", type=str, required=True, nargs="*", help="path to output manifests")
+parser.add_argument("--num_workers", type=int, default=1, help="number of worker processes (manifests are split into shards)")
 
 
 args = parser.parse_args()
@@ -19,20 +21,7 @@ def nums2strings(txt: str) -> str:
 
 
 def remove_non_vocab_chars(txt: str, valid_chars: List[str]) -> str:
-    res_arr = []
-    for c in txt:
-        if c in valid_chars:
-            res_arr.append(c)
-        else:
-            # remove accent and see if it is valid
-            non_accent_c = unidecode.unidecode(c)
-            if non_accent_c in valid_chars:
-                res_arr.append(non_accent_c)
-            # a character we don't know
-            else:
-                res_arr.append(' ')
-    res = ''.join(res_arr).strip()
-    return ' '.join(res.split())
+    return vocab_normalizer(valid_chars, lowercase=False).normalize(txt)
 
 
 def process_transcript(txt: str, vocab: List[str]) -> str:
@@ -45,45 +34,50 @@ def process_transcript(txt: str, vocab: List[str]) -> str:
     return txt
 
 
+def process_record(record: dict) -> dict:
+    """Normalize the text of a manifest entry, None if the text ends up empty"""
+    new_record = {}
+    for key, value in record.items():
+        if key == "text":
+            new_record['raw_text'] = value
+            new_text = process_transcript(value, vocab=alphabet)
+            new_record['text'] = new_text
+        else:
+            new_record[key] = value
+    if new_record['text'] == '':
+        return None
+    return new_record
+
+
 def process_json(path2json_in: str, path2json_out: str):
-    min_duration = 10000.0
-    max_duration = 0.0
-    total_duration = 0.0
+    stats = DurationStats()
     with open(path2json_out, 'w') as tgt_f:
         with open(path2json_in, 'r') as src_f:
             for line in src_f:
-                record = json.loads(line)
-                new_record = {}
-                for key, value in record.items():
-                    if key == "text":
-                        new_record['raw_text'] = value
-                        new_text = process_transcript(value, vocab=alphabet)
-                        new_record['text'] = new_text
-                    else:
-                        new_record[key] = value
-                if new_record['text'] != '':
-                    duration = new_record['duration']
-                    if duration > max_duration:
-                        max_duration = duration
-                    if duration < min_duration:
-                        min_duration = duration
-                    total_duration += duration
+                new_record = process_record(json.loads(line))
+                if new_record is not None:
+                    stats.add(new_record['duration'])
                     tgt_f.write(json.dumps(new_record, ensure_ascii=False) + '\n')
-    print(f'Processed {path2json_in} to {path2json_out}. Total duration {total_duration}, min_duration {min_duration}, max_duration {max_duration}')
-    return total_duration, min_duration, max_duration
+    return stats
 
 
 def main():
     if len(args.manifests_in) != len(args.manifests_out):
         raise ValueError('Input and output manifest names must contain the same numbers of filenames')
-    total_duration, min_duration, max_duration = 0, 100000.0, 0
-    for in_manifest, out_manifest in zip(args.manifests_in, args.manifests_out):
-        print(f'Processing pair: ({in_manifest} => {out_manifest})')
-        _total_duration, _min_duration, _max_duration = process_json(in_manifest, out_manifest)
-        total_duration += _total_duration
-        min_duration = min(min_duration, _min_duration)
-        max_duration = max(max_duration, _max_duration)
-    print(f'Combined total_duration {total_duration}, min_duration {min_duration}, max_duration {max_duration}')
+    manifest_pairs = list(zip(args.manifests_in, args.manifests_out))
+    if args.num_workers > 1:
+        print(f'Processing {len(manifest_pairs)} pairs with {args.num_workers} workers')
+        all_stats = process_manifests_parallel(process_record, manifest_pairs, args.num_workers)
+    else:
+        all_stats = []
+        for in_manifest, out_manifest in manifest_pairs:
+            print(f'Processing pair: ({in_manifest} => {out_manifest})')
+            all_stats.append(process_json(in_manifest, out_manifest))
+    combined = DurationStats()
+    for (in_manifest, out_manifest), stats in zip(manifest_pairs, all_stats):
+        print(f'Processed {in_manifest} to {out_manifest}. Total duration {stats.total}, min_duration {stats.min}, max_duration {stats.max}')
+        combined.merge(stats)
+    print(f'Combined total_duration {combined.total}, min_duration {combined.min}, max_duration {combined.max}')
 
 
 if __name__ == '__main__':
@@ -4,32 +4,21 @@ import pandas as pd
 import subprocess
 import json
 import codecs
-import unidecode
+from tools.audio_tools import convert_audio
+from tools.transcript_tools import TextNormalizer
 
 
+# vocabulary
+valid_chars = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k",
+               "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w",
+               "x", "y", "z", "'",
+               "ß","ä","ö","ü")
+normalizer = TextNormalizer(valid_chars)
+
 def normalize_str(txt) -> str:
-    valid_chars = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k",
-                   "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w",
-                   "x", "y", "z", "'",
-                   "ß","ä","ö","ü")
-    new_txt = txt.lower().strip()
-    #new_txt = unidecode.unidecode(txt.lower().strip())
-    res_arr = []
-    for c in new_txt:
-        if c in valid_chars:
-            res_arr.append(c)
-        else:
-            # remove accent and see if it is valid
-            non_accent_c = unidecode.unidecode(c)
-            if non_accent_c in valid_chars:
-                res_arr.append(non_accent_c)
-            # a character we don't know
-            else:
-                res_arr.append(' ')
-    res = ''.join(res_arr).strip()
-    return ' '.join(res.split())
+    return normalizer.normalize(txt)
 
-def tsv_to_manifest(tsv_files, manifest_file, prefix):
+def tsv_to_manifest(tsv_files, manifest_file, prefix, backend='auto'):
   manifests = []
   for tsv_file in tsv_files:
     print('Processing: {0}'.format(tsv_file))
@@ -40,11 +29,9 @@ def tsv_to_manifest(tsv_files, manifest_file, prefix):
         os.system("mkdir -p wavs/{0}".format(prefix))
         mp3_file = "clips/" + row['path'] # + ".mp3"
         wav_file = "wavs/{0}/".format(prefix) + row['path'] + ".wav"
-        subprocess.check_output("sox {0} -c 1 -r 16000 {1}".format(mp3_file, wav_file), shell=True)
-        duration = subprocess.check_output(
-          "soxi -D {0}".format(wav_file), shell=True)
+        duration = convert_audio(mp3_file, wav_file, backend=backend)
         entry['audio_filepath'] = wav_file
-        entry['duration'] = float(duration)
+        entry['duration'] = duration
         entry['text'] = normalize_str(row['sentence'])
         manifests.append(entry)
       except:
@@ -58,7 +45,9 @@ def tsv_to_manifest(tsv_files, manifest_file, prefix):
 
 def main():
   prefix = sys.argv[1]
-  tsv_to_manifest([prefix + ".tsv"], prefix+".json", prefix)
+  # optional second argument selects the audio backend: auto, python or sox
+  backend = sys.argv[2] if len(sys.argv) > 2 else 'auto'
+  tsv_to_manifest([prefix + ".tsv"], prefix+".json", prefix, backend=backend)
 
 
 if __name__ == "__main__":
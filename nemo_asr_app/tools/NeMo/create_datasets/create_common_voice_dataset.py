@@ -5,32 +5,21 @@ import pandas as pd
 import subprocess
 import json
 import argparse
-import unidecode
 from tools.filetools import file_exists
+from tools.transcript_tools import TextNormalizer
+from tools.audio_tools import convert_audio
+
+# vocabulary
+valid_chars = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k",
+               "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w",
+               "x", "y", "z", "'",
+               "ß","ä","ö","ü")
+normalizer = TextNormalizer(valid_chars, fold_all=True)
 
 def normalize_str(txt) -> str:
-    valid_chars = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k",
-                   "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w",
-                   "x", "y", "z", "'",
-                   "ß","ä","ö","ü")
-    #new_txt = txt.lower().strip()
-    new_txt = unidecode.unidecode(txt.lower().strip())
-    res_arr = []
-    for c in new_txt:
-        if c in valid_chars:
-            res_arr.append(c)
-        else:
-            # remove accent and see if it is valid
-            non_accent_c = unidecode.unidecode(c)
-            if non_accent_c in valid_chars:
-                res_arr.append(non_accent_c)
-            # a character we don't know
-            else:
-                res_arr.append(' ')
-    res = ''.join(res_arr).strip()
-    return ' '.join(res.split())
+    return normalizer.normalize(txt)
 
-def tsv_to_dataset(path, tsv_files, manifest_file):
+def tsv_to_dataset(path, tsv_files, manifest_file, backend='auto'):
   manifests = []
   for tfile in tsv_files:
     tsv_file = os.path.join(path, tfile)
@@ -46,13 +35,10 @@ def tsv_to_dataset(path, tsv_files, manifest_file):
         mp3_file = os.path.join(path, "clips", row['path'])
         wav_file = os.path.join(wav_dir, row['path'].replace(".mp3",".wav"))
 
-        if not os.path.exists(wav_file):
-          subprocess.check_output("sox -v 0.98 {0} -c 1 -r 16000 {1}".format(
-            mp3_file, wav_file), shell=True)
-        duration = subprocess.check_output("soxi -D {0}".format(wav_file),
-                                           shell=True)
+        duration = convert_audio(mp3_file, wav_file, backend=backend,
+                                 volume=0.98)
         entry['audio_filepath'] = wav_file
-        entry['duration'] = float(duration)
+        entry['duration'] = duration
         entry['text'] = normalize_str(row['sentence'])
         manifests.append(entry)
       except:
@@ -73,10 +59,12 @@ def main():
                       help='List of tsv files to convert')
   parser.add_argument('--output', type=str, required=True,
                       help='Output dataset (.json) filename')
+  parser.add_argument('--backend', type=str, default='auto',
+                      help='Audio conversion backend: auto, python or sox')
   args = parser.parse_args()
 
   tsvs=args.tsv_files.split(",")
-  tsv_to_dataset(args.path, tsvs, args.output)
+  tsv_to_dataset(args.path, tsvs, args.output, backend=args.backend)
 
 if __name__ == "__main__":
     main()
@@ -5,85 +5,96 @@ import pandas as pd
 import subprocess
 import json
 import codecs
-import unidecode
 import argparse
 from tools.filetools import file_exists
+from tools.transcript_tools import TextNormalizer
+from tools.audio_tools import convert_audio
+from tools.manifest_tools import ConversionJournal, ManifestWriter, imap_bounded
 from multiprocessing import Pool, cpu_count
-import numpy as np
 
-def normalize_str(txt) -> str:
-    # vocabulary
-    valid_chars = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "'", "á", "é", "í", "ó", "ú", "ñ", "ü")
-    # lowercase
-    new_txt = txt.lower().strip()
-    # no digits exist in MCV_ES
+# vocabulary
+valid_chars = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "'", "á", "é", "í", "ó", "ú", "ñ", "ü")
+# no digits exist in MCV_ES
+normalizer = TextNormalizer(valid_chars)
 
-    # remove characters not in vocabulary
-    res_arr = []
-    for c in new_txt:
-        if c in valid_chars:
-            res_arr.append(c)
-        else:
-            # remove accent and see if it is valid
-            non_accent_c = unidecode.unidecode(c)
-            if non_accent_c in valid_chars:
-                res_arr.append(non_accent_c)
-            else:
-                # a character we don't know
-                res_arr.append(' ')
-    res = ''.join(res_arr).strip()
-    return ' '.join(res.split())
+def normalize_str(txt) -> str:
+    return normalizer.normalize(txt)
 
 def process_df_row(args):
     try:
-        row, path, wav_dir = args
+        row, path, wav_dir, backend = args
         entry = {}
         mp3_file = os.path.join(path, "clips", row['path'])
         wav_file = os.path.join(wav_dir, row['path'].replace(".mp3",".wav"))
 
-        if not os.path.exists(wav_file):
-            subprocess.check_output("sox {0} -c 1 -r 16000 {1}".format(mp3_file, wav_file), shell=True)
-        duration = subprocess.check_output("soxi -D {0}".format(wav_file), shell=True)
-        duration = float(duration)
+        # converts only if the wav does not exist yet
+        duration = convert_audio(mp3_file, wav_file, backend=backend)
 
         entry['audio_filepath'] = wav_file
         entry['duration'] = duration
         entry['text'] = normalize_str(row['sentence'])
-        return (entry, duration)
+        return (row, entry)
     except:
         print("SOMETHING WENT WRONG - IGNORING ENTRY")
-        return (None, None)
+        return (row, None)
 
-def tsv_to_dataset(path, tsv_files, manifest_file):
-    wav_dir = os.path.join(path, "wavs")
-    os.system("mkdir -p {0}".format(wav_dir))
+def journal_to_entry(record):
+    """Manifest entry of a journal record"""
+    return {'audio_filepath': record['audio_filepath'],
+            'duration': record['duration'],
+            'text': record['text']}
 
-    tsv_rows = []
+def read_tsv_rows(path, tsv_files, wav_dir, backend, read_chunksize, journal, writer):
+    """Lazily yield worker payloads of new clips, reading each tsv file in chunks.
+    Clips already in the journal are written to the manifest directly"""
     for tfile in tsv_files:
         tsv_file = os.path.join(path, tfile)
         assert(file_exists(tsv_file))
         print('Processing: {0}'.format(tsv_file))
-        dt = pd.read_csv(tsv_file, sep='\t', encoding='utf8')
-        #creating payload for parallel functions, combining an individual dataframe row with path and wave_dir in a tuple
-        rows_list = [(row,path,wav_dir) for _, row in dt.iterrows()]
-        tsv_rows.extend(rows_list)
+        for dt in pd.read_csv(tsv_file, sep='\t', encoding='utf8',
+                              usecols=['path', 'sentence'], chunksize=read_chunksize):
+            for row in dt.itertuples(index=False):
+                record = journal.get(row.path)
+                if record is not None and os.path.exists(record['audio_filepath']):
+                    if record['sentence'] != row.sentence:
+                        # changed transcript - the audio does not need to be converted again
+                        try:
+                            record = dict(record, sentence=row.sentence,
+                                          text=normalize_str(row.sentence))
+                        except:
+                            print("SOMETHING WENT WRONG - IGNORING ENTRY")
+                            continue
+                        journal.add(row.path, record)
+                    writer.write(journal_to_entry(record))
+                    continue
+                #creating payload for parallel functions, combining an individual row with path, wave_dir and backend in a tuple
+                yield ({'path': row.path, 'sentence': row.sentence}, path, wav_dir, backend)
 
-    with Pool(cpu_count()) as p:
-        outputs = p.map(process_df_row, tsv_rows)
+def tsv_to_dataset(path, tsv_files, manifest_file, backend='auto',
+                   chunksize=64, read_chunksize=10000):
+    wav_dir = os.path.join(path, "wavs")
+    os.system("mkdir -p {0}".format(wav_dir))
 
-    manifests = [entry for entry,_ in outputs if entry is not None] #unpack manifests
-    durations = [duration for _,duration in outputs if duration is not None] #unpack durations
-    total_duration = np.sum(durations)
-    min_duration = np.min(durations)
-    max_duration = np.max(durations)
+    # finished clips are journaled so an interrupted or later run only
+    # converts new clips
+    journal = ConversionJournal(os.path.join(wav_dir, "journal.json"))
+    num_converted = 0
 
+    # entries are written as soon as they are ready (in completion order)
     manifest_file = os.path.join(path, manifest_file)
     print("Saving dataset to {}".format(manifest_file))
-    with codecs.open(manifest_file, 'w', encoding='utf-8') as fout:
-        for m in manifests:
-            fout.write(json.dumps(m, ensure_ascii=False) + '\n')
-    total_hrs = total_duration / 3600
-    print(f'Processed {tsv_files} to {manifest_file}. Total duration {total_hrs} Hrs, min_duration {min_duration} secs, max_duration {max_duration} secs')
+    with journal, ManifestWriter(manifest_file) as writer, Pool(cpu_count()) as p:
+        tsv_rows = read_tsv_rows(path, tsv_files, wav_dir, backend, read_chunksize,
+                                 journal, writer)
+        for row, entry in imap_bounded(p, process_df_row, tsv_rows, chunksize=chunksize):
+            if entry is None:
+                continue
+            journal.add(row['path'], dict(entry, sentence=row['sentence']))
+            writer.write(entry)
+            num_converted += 1
+    num_reused = writer.stats.count - num_converted
+    print(f'Processed {tsv_files} to {manifest_file}. {writer.stats}')
+    print(f'Converted {num_converted} new clips, reused {num_reused} clips from the journal')
     print('Done!')
 
 
@@ -95,10 +106,17 @@ def main():
                       help='List of tsv files to convert')
   parser.add_argument('--output', type=str, required=True,
                       help='Output dataset (.json) filename')
+  parser.add_argument('--backend', type=str, default='auto',
+                      help='Audio conversion backend: auto, python or sox')
+  parser.add_argument('--chunksize', type=int, default=64,
+                      help='Number of clips sent to a worker at once')
+  parser.add_argument('--read_chunksize', type=int, default=10000,
+                      help='Number of tsv rows read into memory at once')
   args = parser.parse_args()
 
   tsvs=args.tsv_files.split(",")
-  tsv_to_dataset(args.path, tsvs, args.output)
+  tsv_to_dataset(args.path, tsvs, args.output, backend=args.backend,
+                 chunksize=args.chunksize, read_chunksize=args.read_chunksize)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,88 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/NeMo/create_datasets/create_tarred_dataset.py --manifest=train.json --target_dir=/data/asr/train_tarred --num_shards=64
+import os
+import json
+import random
+import tarfile
+import argparse
+from multiprocessing import Pool, cpu_count
+from tools.filetools import mkdir_p
+from tools.manifest_tools import DurationStats
+
+"""Pack a NeMo manifest and its audio into large tar shards that are read
+sequentially (see tools/NeMo/tarred_dataset.py), instead of one small wav
+file per utterance.
+"""
+
+TARRED_MANIFEST = 'tarred_audio_manifest.json'
+
+def shard_path(target_dir, shard_id):
+    return os.path.join(target_dir, 'audio_{}.tar'.format(shard_id))
+
+def write_shard(args):
+    """Write the entries of one shard, returns the tarred manifest entries"""
+    target_dir, shard_id, entries = args
+    tarred_entries = []
+    with tarfile.open(shard_path(target_dir, shard_id), mode='w') as tar:
+        for idx, entry in entries:
+            member = '{}.wav'.format(idx)
+            try:
+                tar.add(entry['audio_filepath'], arcname=member)
+            except:
+                print("SOMETHING WENT WRONG - IGNORING ENTRY")
+                continue
+            tarred_entry = dict(entry, audio_filepath=member, shard_id=shard_id,
+                                original_audio_filepath=entry['audio_filepath'])
+            tarred_entries.append(tarred_entry)
+    return tarred_entries
+
+def create_tarred_dataset(manifest, target_dir, num_shards, shuffle=True, seed=0,
+                          num_workers=cpu_count()):
+    """Pack manifest into num_shards tar shards and a tarred manifest in target_dir
+    Arguments:
+      manifest: NeMo json manifest
+      target_dir: output directory
+      num_shards: number of tar shards
+      shuffle: shuffle entries before packing (shards get mixed speakers/lengths)
+      seed: shuffling seed
+      num_workers: shards written in parallel
+    """
+    with open(manifest) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    indexed = list(enumerate(entries))
+    if shuffle:
+        random.Random(seed).shuffle(indexed)
+    mkdir_p(target_dir)
+    print('Packing {} entries of {} into {} shards in {}'.format(
+        len(entries), manifest, num_shards, target_dir))
+
+    jobs = [(target_dir, shard_id, indexed[shard_id::num_shards])
+            for shard_id in range(num_shards)]
+    stats = DurationStats()
+    with Pool(num_workers) as p, \
+         open(os.path.join(target_dir, TARRED_MANIFEST), 'w') as fout:
+        for tarred_entries in p.imap(write_shard, jobs):
+            for entry in tarred_entries:
+                stats.add(entry['duration'])
+                fout.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    print('Done! {}'.format(stats))
+
+def main():
+  parser = argparse.ArgumentParser(description='Pack a NeMo dataset into tar shards')
+  parser.add_argument('--manifest', type=str, required=True,
+                      help='NeMo dataset to pack (.json)')
+  parser.add_argument('--target_dir', type=str, required=True,
+                      help='Directory of the shards and the tarred manifest')
+  parser.add_argument('--num_shards', type=int, default=64)
+  parser.add_argument('--no_shuffle', action='store_true',
+                      help='Keep the manifest order (shard i gets entries i, i+num_shards, ...)')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--num_workers', type=int, default=cpu_count())
+  args = parser.parse_args()
+
+  create_tarred_dataset(args.manifest, args.target_dir, args.num_shards,
+                        shuffle=not args.no_shuffle, seed=args.seed,
+                        num_workers=args.num_workers)
+
+if __name__ == "__main__":
+    main()
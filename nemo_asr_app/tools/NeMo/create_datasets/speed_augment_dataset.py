@@ -1,74 +1,87 @@
 # Copyright (c) 2019 NVIDIA Corporation
 import sys
 import os
-import subprocess
 import json
-import codecs
-import unidecode
 import argparse
-from itertools import chain
 from multiprocessing import Pool, cpu_count
-import numpy as np
+from tools.audio_tools import load_audio, write_audio, audio_duration, speed_perturb
+from tools.manifest_tools import ManifestWriter, imap_bounded
 
-def speed_change(data_org, speed):
+def speed_audio_file(audio_file, speed):
+    """Path of the speed augmented copy of an audio file"""
+    return audio_file.split(".wav")[0] +"_" + str(speed) + ".wav"
+
+def speed_change(data_org, speed, audio):
+    """Manifest entry of the speed augmented copy of data_org.
+    Arguments:
+      data_org: original manifest entry
+      speed: speed factor
+      audio: callable returning the decoded (signal, sample_rate) of the
+             original file
+    """
     entry = {}
-    audio_file = data_org['audio_filepath']
-    new_audio = audio_file.split(".wav")[0] +"_" + str(speed) + ".wav"
-    if not os.path.exists(new_audio):
-        subprocess.check_output("sox {0} {1} speed {2}".format(audio_file, new_audio, speed), shell=True)
-    duration = subprocess.check_output("soxi -D {0}".format(new_audio), shell=True)
+    new_audio = speed_audio_file(data_org['audio_filepath'], speed)
+    if os.path.exists(new_audio):
+        duration = audio_duration(new_audio)
+    else:
+        signal, sample_rate = audio()
+        new_signal = speed_perturb(signal, speed)
+        write_audio(new_audio, new_signal, sample_rate)
+        duration = len(new_signal) / float(sample_rate)
     entry['audio_filepath'] = new_audio
-    entry['duration'] = float(duration)
+    entry['duration'] = duration
     entry['text'] = data_org['text']
     return entry
 
-def augment_single_file(line):
+def augment_single_file(args):
+    line, speeds = args
     try:
         #original
         data_org = json.loads(line)
-        # fast
-        fast = speed_change(data_org, 1.1)
-        # slow
-        slow = speed_change(data_org, 0.9)
-        #return tuple of lists - 3 data entries ([original, fast, slow],[original_duration,fast_duration,slow_duration])
-        return ([data_org, fast, slow],[ data_org['duration'], fast['duration'], slow['duration'] ])
+        # decode the original at most once for all speeds
+        decoded = []
+        def audio():
+            if not decoded:
+                decoded.append(load_audio(data_org['audio_filepath']))
+            return decoded[0]
+        #return list of data entries, one per speed (1.0 is the original entry)
+        return [data_org if speed == 1.0 else speed_change(data_org, speed, audio)
+                for speed in speeds]
     except:
         print("SOMETHING WENT WRONG - IGNORING ENTRY")
-        return ([None,None]) #we will filter out these entries where errors occured.
-
-def dataset_augment(dataset_in, dataset_out):
-    print('Augmenting: {0}'.format(dataset_in))
-    with open(dataset_in, "r") as a_file:
-        datafiles = [line for line in a_file]
-
-    with Pool(cpu_count()) as p:
-        outputs = p.map(augment_single_file, datafiles)
-
-    #these will be lists of lists after unpacking using itertools.chain to flatten them into a normal list
-    #also filters out None values after flattening the list
-    manifests = list(chain.from_iterable([entry for entry,_ in outputs if entry is not None])) #unpack manifests
-    durations = list(chain.from_iterable([duration for _,duration in outputs if duration is not None])) #unpack durations
-    total_duration = np.sum(durations)
-    min_duration = np.min(durations)
-    max_duration = np.max(durations)
+        return None #we will filter out these entries where errors occured.
 
+def dataset_augment(dataset_in, dataset_out, speeds=(1.0, 1.1, 0.9), chunksize=16):
+    """Write the speed augmented copies of the wavs of dataset_in and their
+    manifest. To perturb the speed during training instead, without writing
+    wavs, use the SpeedPerturbation augmentor of tools/NeMo/perturb.py
+    """
+    print('Augmenting: {0} with speeds {1}'.format(dataset_in, speeds))
     print("Saving dataset to {}".format(dataset_out))
-    with codecs.open(dataset_out, 'w', encoding='utf-8') as fout:
-        for m in manifests:
-            fout.write(json.dumps(m, ensure_ascii=False) + '\n')
-    total_hrs = total_duration / 3600
-    print(f'Processed {dataset_in} to {dataset_out}. Total duration {total_hrs} Hrs, min_duration {min_duration} secs, max_duration {max_duration} secs')
+    with open(dataset_in, "r") as a_file, ManifestWriter(dataset_out) as writer, \
+         Pool(cpu_count()) as p:
+        datafiles = ((line, speeds) for line in a_file)
+        for entries in imap_bounded(p, augment_single_file, datafiles,
+                                    chunksize=chunksize, ordered=True):
+            if entries is None:
+                continue
+            for entry in entries:
+                writer.write(entry)
+    print(f'Processed {dataset_in} to {dataset_out}. {writer.stats}')
     print('Done!')
 
 def main():
-  parser = argparse.ArgumentParser(description='NeMo dataset speed augmentation 0.9 and 1.1')
+  parser = argparse.ArgumentParser(description='NeMo dataset speed augmentation')
   parser.add_argument('--dataset_in', type=str, required=True,
                       help='Original NeMo dataset to augment (.json)')
   parser.add_argument('--dataset_out', type=str, required=True,
                       help='Speed augmented output dataset (.json)')
+  parser.add_argument('--speeds', type=str, default='1.0,1.1,0.9',
+                      help='Comma separated speed factors, 1.0 keeps the original entry')
   args = parser.parse_args()
 
-  dataset_augment(args.dataset_in, args.dataset_out)
+  speeds = [float(s) for s in args.speeds.split(",")]
+  dataset_augment(args.dataset_in, args.dataset_out, speeds=speeds)
 
 if __name__ == "__main__":
     main()
@@ -1,4 +1,5 @@
 import os
+import threading
 import numpy as np
 import scipy.io.wavfile as wave
 import torch
@@ -10,128 +11,211 @@ from nemo.backends.pytorch.nm import DataLayerNM
 from nemo.core.neural_types import NeuralType, AudioSignal, LengthsType
 from ruamel.yaml import YAML
 
+
+def to_float_signal(signal):
+  """float32 signal in [-1, 1] from a wav signal (int16 PCM or float)"""
+  signal = np.asarray(signal)
+  if np.issubdtype(signal.dtype, np.integer):
+    return signal.astype(np.float32)/32768.
+  return signal.astype(np.float32)
+
+
+# AudioDataLayer
+class AudioDataLayer(DataLayerNM):
+  """Data layer fed from memory with one zero padded batch of signals"""
+
+  @property
+  def output_ports(self):
+      return {
+        'audio_signal': NeuralType(('B', 'T'), AudioSignal(freq=self._sample_rate)),
+        'a_sig_length': NeuralType(tuple('B'), LengthsType()),
+      }
+
+  def __init__(self, sample_rate):
+      super().__init__()
+      self._sample_rate = sample_rate
+      self.output = True
+
+  def __iter__(self):
+      return self
+
+  def __next__(self):
+      if not self.output:
+          raise StopIteration
+      self.output = False
+      return torch.as_tensor(self.signal, dtype=torch.float32), \
+             torch.as_tensor(self.signal_shape, dtype=torch.int64)
+
+  def set_signal(self, signal):
+      self.set_signals([signal])
+
+  def set_signals(self, signals):
+      """Set the next batch
+      Arguments:
+        signals: list of wav signals (int16 PCM or float)
+      """
+      signals = [to_float_signal(s).reshape(-1) for s in signals]
+      self.signal_shape = np.array([s.size for s in signals], dtype=np.int64)
+      self.signal = np.zeros([len(signals), self.signal_shape.max()], dtype=np.float32)
+      for i, s in enumerate(signals):
+          self.signal[i, :s.size] = s
+      self.output = True
+
+  def __len__(self):
+      return 1
+
+  @property
+  def dataset(self):
+      return None
+
+  @property
+  def data_iterator(self):
+      return self
+
+
+class InferenceSession(object):
+  """Acoustic model (and LM) loaded once and reused for every transcription
+  Arguments:
+    config: model yaml
+    encoder: encoder checkpoint
+    decoder: decoder checkpoint
+    lm_path: KenLM binary for beam search (None: greedy only)
+    beam_width, alpha, beta: beam search parameters
+    device: 'gpu' or 'cpu'
+    batch_size: max number of files per batch in transcribe_many
+  """
+
+  def __init__(self, config, encoder, decoder, lm_path=None, beam_width=200,
+               alpha=3, beta=0.1, device='gpu', batch_size=16):
+    self.lm_path = lm_path
+    self.batch_size = batch_size
+    self._lock = threading.Lock()
+
+    # get labels (vocab)
+    yaml = YAML(typ="safe")
+    with open(config) as f:
+      model_definition = yaml.load(f)
+    self.model_definition = model_definition
+    self.labels = model_definition['labels']
+    self.sample_rate = model_definition['sample_rate']
+
+    # build neural factory and neural modules
+    placement = nemo.core.DeviceType.CPU if device == 'cpu' else nemo.core.DeviceType.GPU
+    self.neural_factory = nemo.core.NeuralModuleFactory(
+      placement=placement,
+      backend=nemo.core.Backend.PyTorch)
+
+    # Instantiate necessary neural modules
+    self.data_layer = AudioDataLayer(sample_rate=self.sample_rate)
+
+    data_preprocessor = nemo_asr.AudioToMelSpectrogramPreprocessor(
+      **model_definition['AudioToMelSpectrogramPreprocessor'])
+
+    jasper_encoder = nemo_asr.JasperEncoder(
+      feat_in=model_definition['AudioToMelSpectrogramPreprocessor']['features'],
+      **model_definition['JasperEncoder'])
+
+    jasper_decoder = nemo_asr.JasperDecoderForCTC(
+      feat_in=model_definition['JasperEncoder']['jasper'][-1]['filters'],
+      num_classes=len(self.labels))
+
+    greedy_decoder = nemo_asr.GreedyCTCDecoder()
+
+    # load model
+    jasper_encoder.restore_from(encoder)
+    jasper_decoder.restore_from(decoder)
+
+    # Define inference DAG
+    audio_signal, audio_signal_len = self.data_layer()
+    processed_signal, processed_signal_len = data_preprocessor(
+      input_signal=audio_signal,
+      length=audio_signal_len)
+    encoded, encoded_len = jasper_encoder(audio_signal=processed_signal,
+                                          length=processed_signal_len)
+    log_probs = jasper_decoder(encoder_output=encoded)
+    predictions = greedy_decoder(log_probs=log_probs)
+
+    self.inf_array = [
+      log_probs,
+      predictions,
+      encoded_len]
+
+    # language model
+    if lm_path:
+      beam_search_with_lm = nemo_asr.BeamSearchDecoderWithLM(
+        vocab=self.labels,
+        beam_width=beam_width,
+        alpha=alpha,
+        beta=beta,
+        lm_path=lm_path,
+        num_cpus=max(os.cpu_count(), 1))
+      beam_predictions = beam_search_with_lm(log_probs=log_probs,
+                                             log_probs_length=encoded_len)
+      self.inf_array.append(beam_predictions)
+
+  def transcribe_batch(self, signals):
+    """Transcribe a batch of signals (padded to the longest one)
+
+    Returns:
+      list of transcribe results
+    """
+    with self._lock:
+      self.data_layer.set_signals(signals)
+      tensors = self.neural_factory.infer(self.inf_array, verbose=False)
+
+    log_probs = tensors[0][0].cpu()
+    preds = tensors[1][0].cpu()
+    lengths = tensors[2][0].cpu().numpy()
+    results = []
+    for i in range(len(signals)):
+      # drop the frames of the padding
+      result = {
+        'transcript': post_process_predictions([preds[i:i+1, :lengths[i]]], self.labels)[0],
+        'probs': log_probs[i, :lengths[i]].numpy()}
+      if self.lm_path:
+        result['beam_transcript'] = tensors[3][0][i][0][1]
+      results.append(result)
+    return results
+
+  def transcribe(self, signal):
+    """Transcribe one signal sampled at the model sample rate
+
+    Returns:
+      dict with transcript, probs (log-probs) and beam_transcript (with LM)
+    """
+    return self.transcribe_batch([signal])[0]
+
+  def transcribe_many(self, paths):
+    """Transcribe wav files in batches of files of similar length
+
+    Returns:
+      list of transcribe results in the order of paths
+    """
+    signals = [wave.read(path)[1] for path in paths]
+    order = sorted(range(len(signals)), key=lambda i: len(signals[i]))
+    results = [None] * len(signals)
+    for start in range(0, len(order), self.batch_size):
+      batch = order[start:start + self.batch_size]
+      for i, result in zip(batch, self.transcribe_batch([signals[i] for i in batch])):
+        results[i] = result
+    return results
+
+
 def offline_inference(config, encoder, decoder, audio_file,
-                      lm_path=None, beam_width=200, alpha=3, beta=0.1):
-  MODEL_YAML = config
-  CHECKPOINT_ENCODER = encoder
-  CHECKPOINT_DECODER = decoder
+                      lm_path=None, beam_width=200, alpha=3, beta=0.1, device='gpu'):
+  """Transcribe audio_file with a new InferenceSession, use the session
+  directly to transcribe several files
+  """
   sample_rate, signal = wave.read(audio_file)
+  session = InferenceSession(config, encoder, decoder, lm_path=lm_path,
+                             beam_width=beam_width, alpha=alpha, beta=beta,
+                             device=device)
+  result = session.transcribe(signal)
 
-  # get labels (vocab)
-  yaml = YAML(typ="safe")
-  with open(MODEL_YAML) as f:
-    model_definition = yaml.load(f)
-  labels = model_definition['labels']
-
-  # build neural factory and neural modules
-  neural_factory = nemo.core.NeuralModuleFactory(
-    placement=nemo.core.DeviceType.GPU,
-    backend=nemo.core.Backend.PyTorch)
-
-  # AudioDataLayer
-  class AudioDataLayer(DataLayerNM):
-    @property
-    def output_ports(self):
-        return {
-          'audio_signal': NeuralType(('B', 'T'), AudioSignal(freq=self._sample_rate)),
-          'a_sig_length': NeuralType(tuple('B'), LengthsType()),
-        }
-
-    def __init__(self, sample_rate):
-        super().__init__()
-        self._sample_rate = sample_rate
-        self.output = True
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if not self.output:
-            raise StopIteration
-        self.output = False
-        return torch.as_tensor(self.signal, dtype=torch.float32), \
-               torch.as_tensor(self.signal_shape, dtype=torch.int64)
-
-    def set_signal(self, signal):
-        self.signal = np.reshape(signal.astype(np.float32)/32768., [1, -1])
-        self.signal_shape = np.expand_dims(self.signal.size, 0).astype(np.int64)
-        self.output = True
-
-    def __len__(self):
-        return 1
-
-    @property
-    def dataset(self):
-        return None
-
-    @property
-    def data_iterator(self):
-        return self
-
-  # Instantiate necessary neural modules
-  data_layer = AudioDataLayer(sample_rate=model_definition['sample_rate'])
-
-  data_preprocessor = nemo_asr.AudioToMelSpectrogramPreprocessor(
-    **model_definition['AudioToMelSpectrogramPreprocessor'])
-
-  jasper_encoder = nemo_asr.JasperEncoder(
-    feat_in=model_definition['AudioToMelSpectrogramPreprocessor']['features'],
-    **model_definition['JasperEncoder'])
-
-  jasper_decoder = nemo_asr.JasperDecoderForCTC(
-    feat_in=model_definition['JasperEncoder']['jasper'][-1]['filters'],
-    num_classes=len(model_definition['labels']))
-
-  greedy_decoder = nemo_asr.GreedyCTCDecoder()
-
-  # load model
-  jasper_encoder.restore_from(CHECKPOINT_ENCODER)
-  jasper_decoder.restore_from(CHECKPOINT_DECODER)
-
-  # Define inference DAG
-  audio_signal, audio_signal_len = data_layer()
-  processed_signal, processed_signal_len = data_preprocessor(
-    input_signal=audio_signal,
-    length=audio_signal_len)
-  encoded, encoded_len = jasper_encoder(audio_signal=processed_signal,
-                                        length=processed_signal_len)
-  log_probs = jasper_decoder(encoder_output=encoded)
-  predictions = greedy_decoder(log_probs=log_probs)
-
-  inf_array = [
-    audio_signal,
-    processed_signal,
-    encoded,
-    log_probs,
-    predictions]
-
-  # language model
-  if lm_path:
-    beam_search_with_lm = nemo_asr.BeamSearchDecoderWithLM(
-      vocab=labels,
-      beam_width=beam_width,
-      alpha=alpha,
-      beta=beta,
-      lm_path=lm_path,
-      num_cpus=max(os.cpu_count(), 1))
-    beam_predictions = beam_search_with_lm(log_probs=log_probs,
-                                           log_probs_length=encoded_len)
-    inf_array.append(beam_predictions)
-
-  # inference
-  data_layer.set_signal(signal)
-  tensors = neural_factory.infer(inf_array, verbose=False)
-
-  # results
-  audio = tensors[0][0][0].cpu().numpy()
-  features = tensors[1][0][0].cpu().numpy()
-  encoded_features = tensors[2][0][0].cpu().numpy(),
-  probs = tensors[3][0][0].cpu().numpy()
-  preds = tensors[4][0]
-  transcript = post_process_predictions([preds], labels)
-
+  transcript = [result['transcript']]
+  probs = result['probs']
   if lm_path:
-      beam_preds = tensors[5][0][0][0][1]
+      beam_preds = result['beam_transcript']
       return transcript, probs, beam_preds
   else:
         return transcript, probs
@@ -0,0 +1,100 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import os
+import json
+
+import numpy as np
+import torch
+
+from nemo.backends.pytorch.nm import DataLayerNM
+from nemo.core.neural_types import NeuralType, MelSpectrogramType, LengthsType
+from tools.array_store import content_key
+from tools.NeMo.bucketing import BucketSampler
+
+"""Cache of the log-mel features of eval datasets: the preprocessor runs
+once per dataset and later runs feed the cached features to the encoder.
+Features are stored with tools.array_store (one memory mapped file per
+dataset, T x D per utterance).
+"""
+
+
+def feature_cache_key(eval_datasets, jasper_params):
+    """Key of the features of (comma separated) eval manifests: audio paths
+    and mtimes, preprocessor and data layer configs
+    """
+    audio_files = []
+    for manifest in eval_datasets.split(','):
+        with open(manifest) as f:
+            for line in f:
+                if line.strip():
+                    audio_file = json.loads(line)['audio_filepath']
+                    audio_files.append([audio_file, os.path.getmtime(audio_file)])
+    return content_key(objects=[
+        jasper_params['sample_rate'],
+        jasper_params['AudioToMelSpectrogramPreprocessor'],
+        jasper_params['AudioToTextDataLayer'],
+        audio_files])
+
+
+def unbatch_features(features, lengths):
+    """Per utterance float32 features (T x D) from batches (B x D x T) of
+    the preprocessor
+    """
+    utterances = []
+    for batch, batch_lengths in zip(features, lengths):
+        batch = batch.float().cpu().numpy()
+        for j in range(batch.shape[0]):
+            utterances.append(batch[j, :, :int(batch_lengths[j])].T)
+    return utterances
+
+
+class FeatureDataLayer(DataLayerNM):
+    """Data layer of cached features, replaces the audio data layer and the
+    preprocessor in the inference DAG
+    Arguments:
+      store: ArrayStore of per utterance features (T x D)
+      batch_size: batch size
+      pad_to: batches are padded to a multiple of pad_to frames (as the
+              preprocessor does)
+      sort: batches of utterances sorted by length (order gives the
+            utterance of each output)
+    """
+
+    @property
+    def output_ports(self):
+        return {
+          'processed_signal': NeuralType(('B', 'D', 'T'), MelSpectrogramType()),
+          'processed_length': NeuralType(tuple('B'), LengthsType()),
+        }
+
+    def __init__(self, store, batch_size, pad_to=16, sort=False):
+        super().__init__()
+        self._store = store
+        self._pad_to = pad_to or 1
+        lengths = [len(features) for features in store]
+        if sort:
+            self._batches = BucketSampler(lengths, batch_size).batches()
+        else:
+            self._batches = [list(range(i, min(i + batch_size, len(store))))
+                             for i in range(0, len(store), batch_size)]
+        self.order = [i for batch in self._batches for i in batch]
+
+    def _iterate(self):
+        for batch in self._batches:
+            features = [self._store[i] for i in batch]
+            lengths = np.array([len(f) for f in features], dtype=np.int64)
+            max_len = -(-lengths.max() // self._pad_to) * self._pad_to
+            signal = np.zeros([len(batch), features[0].shape[1], max_len], dtype=np.float32)
+            for j, f in enumerate(features):
+                signal[j, :, :len(f)] = f.T
+            yield torch.as_tensor(signal), torch.as_tensor(lengths)
+
+    def __len__(self):
+        return len(self._store)
+
+    @property
+    def dataset(self):
+        return None
+
+    @property
+    def data_iterator(self):
+        return self._iterate()
@@ -0,0 +1,198 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/NeMo/inference_server.py --model_config=model.yaml --encoder=JasperEncoder.pt --decoder=JasperDecoderForCTC.pt
+# curl --data-binary @sample.wav http://localhost:8000/transcribe
+import io
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import scipy.io.wavfile as wave
+
+from tools.NeMo.demo_inference import InferenceSession
+
+"""Local transcription service: concurrent requests are collected into
+padded batches of at most max_batch_size signals, a batch is closed after
+max_wait_ms even if it is not full.
+"""
+
+
+class MicroBatcher(object):
+  """Collects signals submitted from many threads into batches for infer_fn
+  Arguments:
+    infer_fn: function (list of signals -> list of results)
+    max_batch_size: max signals per batch
+    max_wait_ms: max time the first signal of a batch waits for others
+    max_queue_size: max signals waiting, submit raises queue.Full beyond
+  """
+
+  def __init__(self, infer_fn, max_batch_size=16, max_wait_ms=10, max_queue_size=256):
+    self.infer_fn = infer_fn
+    self.max_batch_size = max_batch_size
+    self.max_wait = max_wait_ms / 1000.
+    self._queue = queue.Queue(max_queue_size)
+    self._metrics_lock = threading.Lock()
+    self._requests = 0
+    self._batches = 0
+    self._max_queue_depth = 0
+    self._batch_sizes = {}
+    self._queue_wait = 0.
+    self._infer_time = 0.
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  def submit(self, signal):
+    """Queue a signal, returns a Future of its result"""
+    future = Future()
+    self._queue.put_nowait((signal, future, time.time()))
+    with self._metrics_lock:
+      self._requests += 1
+      self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+    return future
+
+  def close(self):
+    self._queue.put(None)
+    self._thread.join()
+
+  def _run(self):
+    stop = False
+    while not stop:
+      item = self._queue.get()
+      if item is None:
+        break
+      batch = [item]
+      deadline = time.time() + self.max_wait
+      while len(batch) < self.max_batch_size:
+        timeout = deadline - time.time()
+        if timeout <= 0:
+          break
+        try:
+          item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+          break
+        if item is None:
+          stop = True
+          break
+        batch.append(item)
+      self._process(batch)
+
+  def _process(self, batch):
+    start = time.time()
+    try:
+      results = self.infer_fn([signal for signal, _, _ in batch])
+    except Exception as e:
+      for _, future, _ in batch:
+        future.set_exception(e)
+      return
+    end = time.time()
+    for (_, future, _), result in zip(batch, results):
+      future.set_result(result)
+    with self._metrics_lock:
+      self._batches += 1
+      self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+      self._queue_wait += sum(start - t for _, _, t in batch)
+      self._infer_time += end - start
+
+  def metrics(self):
+    """Queue depth and batch size metrics"""
+    with self._metrics_lock:
+      processed = sum(size * count for size, count in self._batch_sizes.items())
+      return {
+        'requests': self._requests,
+        'batches': self._batches,
+        'queue_depth': self._queue.qsize(),
+        'max_queue_depth': self._max_queue_depth,
+        'batch_sizes': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+        'mean_batch_size': processed / self._batches if self._batches else 0.,
+        'mean_queue_wait_ms': 1000 * self._queue_wait / processed if processed else 0.,
+        'mean_batch_infer_ms': 1000 * self._infer_time / self._batches if self._batches else 0.,
+      }
+
+
+class TranscriptionHandler(BaseHTTPRequestHandler):
+  """POST /transcribe with a wav body, GET /metrics"""
+
+  def _reply(self, code, body):
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    self.send_response(code)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_GET(self):
+    if self.path != '/metrics':
+      return self._reply(404, {'error': 'not found'})
+    self._reply(200, self.server.batcher.metrics())
+
+  def do_POST(self):
+    if self.path != '/transcribe':
+      return self._reply(404, {'error': 'not found'})
+    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    try:
+      sample_rate, signal = wave.read(io.BytesIO(body))
+    except Exception:
+      return self._reply(400, {'error': 'body is not a wav file'})
+    if sample_rate != self.server.sample_rate:
+      return self._reply(400, {'error': 'sample rate {} Hz, the model expects {} Hz'.format(
+        sample_rate, self.server.sample_rate)})
+    if signal.ndim > 1:
+      return self._reply(400, {'error': 'audio must be mono'})
+    try:
+      future = self.server.batcher.submit(signal)
+    except queue.Full:
+      return self._reply(503, {'error': 'server busy'})
+    try:
+      result = future.result()
+    except Exception as e:
+      return self._reply(500, {'error': str(e)})
+    self._reply(200, {k: v for k, v in result.items() if k != 'probs'})
+
+  def log_message(self, format, *args):
+    pass
+
+
+def make_server(infer_fn, sample_rate=16000, host='localhost', port=8000,
+                max_batch_size=16, max_wait_ms=10, max_queue_size=256):
+  """HTTP server around a MicroBatcher of infer_fn (call serve_forever),
+  requests must be mono wavs at sample_rate"""
+  server = ThreadingHTTPServer((host, port), TranscriptionHandler)
+  server.daemon_threads = True
+  server.sample_rate = sample_rate
+  server.batcher = MicroBatcher(infer_fn, max_batch_size=max_batch_size,
+                                max_wait_ms=max_wait_ms,
+                                max_queue_size=max_queue_size)
+  return server
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Micro-batching transcription server')
+  parser.add_argument('--model_config', type=str, required=True)
+  parser.add_argument('--encoder', type=str, required=True)
+  parser.add_argument('--decoder', type=str, required=True)
+  parser.add_argument('--lm_path', type=str, default=None)
+  parser.add_argument('--device', type=str, default='gpu', choices=['gpu', 'cpu'])
+  parser.add_argument('--host', type=str, default='localhost')
+  parser.add_argument('--port', type=int, default=8000)
+  parser.add_argument('--max_batch_size', type=int, default=16)
+  parser.add_argument('--max_wait_ms', type=float, default=10)
+  parser.add_argument('--max_queue_size', type=int, default=256)
+  args = parser.parse_args()
+
+  session = InferenceSession(args.model_config, args.encoder, args.decoder,
+                             lm_path=args.lm_path, device=args.device)
+  server = make_server(session.transcribe_batch, sample_rate=session.sample_rate,
+                       host=args.host, port=args.port,
+                       max_batch_size=args.max_batch_size,
+                       max_wait_ms=args.max_wait_ms,
+                       max_queue_size=args.max_queue_size)
+  print('Serving on http://{}:{}/transcribe'.format(args.host, args.port))
+  try:
+    server.serve_forever()
+  finally:
+    server.batcher.close()
+
+if __name__ == "__main__":
+  main()
@@ -5,105 +5,110 @@
 import argparse
 import copy
 import os
+import re
+import sys
+import glob
 import json
+import time
 import pickle
+import tempfile
+import subprocess
 
 import numpy as np
+import torch
 from ruamel.yaml import YAML
 
 import nemo
 import nemo.collections.asr as nemo_asr
 from nemo.collections.asr.helpers import post_process_predictions, \
-                                         post_process_transcripts, \
-                                         word_error_rate
+                                         post_process_transcripts
 from tools.filetools import mkdir_p, rm_rf, file_exists
+from tools.array_store import ArrayCache, ArrayStore, content_key
+from tools.wer_tools import WERScorer, error_rate, SUB, DEL, INS
+from tools.results_store import utterances_path, write_utterance_results
+from tools.results_index import index_results
+from tools.NeMo.beam_search import LMGridSearch, grid_points, \
+                                   logprobs_to_probs, unbatch_logprobs
+from tools.NeMo.bucketing import BucketingDataLayer, restore_order
+from tools.NeMo.feature_cache import FeatureDataLayer, feature_cache_key, \
+                                     unbatch_features
 
-def main():
-    parser = argparse.ArgumentParser(description='Jasper')
-    # model params
-    parser.add_argument("--model_config", type=str, required=True)
-    parser.add_argument("--eval_datasets", type=str, required=True)
-    parser.add_argument("--load_dir", type=str, required=True)
-    parser.add_argument("--model_id", type=str, required=True) # new
-    # run params
-    parser.add_argument("--local_rank", default=None, type=int)
-    parser.add_argument("--batch_size", default=64, type=int)
-    parser.add_argument("--amp_opt_level", default="O0", type=str) # new
-    # store results
-    parser.add_argument("--save_results", default=None, type=str) # new
-    parser.add_argument("--save_logprob", default=None, type=str)
+# modules restored from --load_dir
+CHECKPOINT_MODULES = ['JasperEncoder', 'JasperDecoderForCTC']
 
-    # lm inference parameters
-    parser.add_argument("--lm_path", default=None, type=str)
-    parser.add_argument(
-        '--alpha', default=2., type=float,
-        help='value of LM weight',
-        required=False)
-    parser.add_argument(
-        '--alpha_max', type=float,
-        help='maximum value of LM weight (for a grid search in \'eval\' mode)',
-        required=False)
-    parser.add_argument(
-        '--alpha_step', type=float,
-        help='step for LM weight\'s tuning in \'eval\' mode',
-        required=False, default=0.1)
-    parser.add_argument(
-        '--beta', default=1.5, type=float,
-        help='value of word count weight',
-        required=False)
-    parser.add_argument(
-        '--beta_max', type=float,
-        help='maximum value of word count weight (for a grid search in \
-          \'eval\' mode',
-        required=False)
-    parser.add_argument(
-        '--beta_step', type=float,
-        help='step for word count weight\'s tuning in \'eval\' mode',
-        required=False, default=0.1)
-    parser.add_argument(
-        "--beam_width", default=128, type=int)
 
-    args = parser.parse_args()
+def checkpoint_files(load_dir, module_names):
+    """Latest checkpoint of each module in load_dir (the files infer restores)"""
+    files = []
+    for name in module_names:
+        candidates = glob.glob(os.path.join(load_dir, name + '-STEP-*.pt'))
+        if not candidates:
+            candidates = glob.glob(os.path.join(load_dir, name + '*.pt'))
+        if not candidates:
+            raise ValueError('No {} checkpoint in {}'.format(name, load_dir))
+        files.append(max(candidates, key=_checkpoint_step))
+    return files
+
+
+def _checkpoint_step(path):
+    step = re.search(r'-STEP-(\d+)', os.path.basename(path))
+    return int(step.group(1)) if step else -1
+
+
+def acoustic_model_outputs(args, jasper_params, eval_datasets):
+    """Run the acoustic model over eval_datasets
+
+    Returns:
+      per utterance log-probs, greedy hypotheses, references
+    """
     batch_size = args.batch_size
     load_dir = args.load_dir
 
-    if args.local_rank is not None:
-        if args.lm_path:
-            raise NotImplementedError(
-                "Beam search decoder with LM does not currently support "
-                "evaluation on multi-gpu.")
-        device = nemo.core.DeviceType.AllGpu
+    if args.device == 'cpu':
+        device = nemo.core.DeviceType.CPU
     else:
         device = nemo.core.DeviceType.GPU
+        if args.local_rank is not None:
+            # one shard per rank, no data parallel inference
+            torch.cuda.set_device(args.local_rank)
 
     # Instantiate Neural Factory with supported backend
     neural_factory = nemo.core.NeuralModuleFactory(
         backend=nemo.core.Backend.PyTorch,
-        local_rank=args.local_rank,
         optimization_level=args.amp_opt_level,
         placement=device)
 
-    if args.local_rank is not None:
-        nemo.logging.info('Doing ALL GPU')
-
-    yaml = YAML(typ="safe")
-    with open(args.model_config) as f:
-        jasper_params = yaml.load(f)
     vocab = jasper_params['labels']
     sample_rate = jasper_params['sample_rate']
 
-    # single eval dataset
-    eval_datasets = args.eval_datasets
-    eval_dl_params = copy.deepcopy(jasper_params["AudioToTextDataLayer"])
-    eval_dl_params.update(jasper_params["AudioToTextDataLayer"]["eval"])
-    del eval_dl_params["train"]
-    del eval_dl_params["eval"]
-    data_layer = nemo_asr.AudioToTextDataLayer(
-        manifest_filepath=eval_datasets,
-        sample_rate=sample_rate,
-        labels=vocab,
-        batch_size=batch_size,
-        **eval_dl_params)
+    # log-mel features of a dataset already evaluated with this preprocessor
+    feature_store = None
+    if args.feature_cache:
+        feature_cache = ArrayCache(args.feature_cache)
+        feature_key = feature_cache_key(eval_datasets, jasper_params)
+        feature_store = feature_cache.get(feature_key)
+
+    if feature_store is not None:
+        nemo.logging.info('Loaded features of {} examples from {}'.format(
+            len(feature_store), feature_store.path))
+        data_layer = FeatureDataLayer(
+            feature_store, batch_size,
+            pad_to=jasper_params["AudioToMelSpectrogramPreprocessor"].get("pad_to", 16),
+            sort=args.bucket_batches)
+    else:
+        eval_dl_params = copy.deepcopy(jasper_params["AudioToTextDataLayer"])
+        eval_dl_params.update(jasper_params["AudioToTextDataLayer"]["eval"])
+        del eval_dl_params["train"]
+        del eval_dl_params["eval"]
+        data_layer = nemo_asr.AudioToTextDataLayer(
+            manifest_filepath=eval_datasets,
+            sample_rate=sample_rate,
+            labels=vocab,
+            batch_size=batch_size,
+            **eval_dl_params)
+        if args.bucket_batches:
+            # sorted batches, outputs are put back in dataset order below
+            data_layer = BucketingDataLayer(data_layer, shuffle=False)
 
     N = len(data_layer)
     nemo.logging.info('Evaluating {0} examples'.format(N))
@@ -130,19 +135,25 @@ def main():
     nemo.logging.info('================================')
 
     # Define inference DAG
-    audio_signal_e1, a_sig_length_e1, transcript_e1, transcript_len_e1 =\
-        data_layer()
-    processed_signal_e1, p_length_e1 = data_preprocessor(
-        input_signal=audio_signal_e1,
-        length=a_sig_length_e1)
+    if feature_store is not None:
+        processed_signal_e1, p_length_e1 = data_layer()
+    else:
+        audio_signal_e1, a_sig_length_e1, transcript_e1, transcript_len_e1 =\
+            data_layer()
+        processed_signal_e1, p_length_e1 = data_preprocessor(
+            input_signal=audio_signal_e1,
+            length=a_sig_length_e1)
     encoded_e1, encoded_len_e1 = jasper_encoder(
         audio_signal=processed_signal_e1,
         length=p_length_e1)
     log_probs_e1 = jasper_decoder(encoder_output=encoded_e1)
     predictions_e1 = greedy_decoder(log_probs=log_probs_e1)
 
-    eval_tensors = [log_probs_e1, predictions_e1,
-                    transcript_e1, transcript_len_e1, encoded_len_e1]
+    eval_tensors = [log_probs_e1, predictions_e1, encoded_len_e1]
+    if feature_store is None:
+        eval_tensors += [transcript_e1, transcript_len_e1]
+        if args.feature_cache:
+            eval_tensors += [processed_signal_e1, p_length_e1]
 
     # inference
     evaluated_tensors = neural_factory.infer(
@@ -151,65 +162,375 @@ def main():
         cache=False)
 
     greedy_hypotheses = post_process_predictions(evaluated_tensors[1], vocab)
-    references = post_process_transcripts(
-        evaluated_tensors[2], evaluated_tensors[3], vocab)
+    logprobs = unbatch_logprobs(evaluated_tensors[0], evaluated_tensors[2])
+    if feature_store is not None:
+        references = feature_store.meta['references']
+    else:
+        references = post_process_transcripts(
+            evaluated_tensors[3], evaluated_tensors[4], vocab)
+    if args.bucket_batches:
+        order = data_layer.order if feature_store is not None else data_layer.sampler.order
+        logprobs = restore_order(logprobs, order)
+        greedy_hypotheses = restore_order(greedy_hypotheses, order)
+        if feature_store is None:
+            references = restore_order(references, order)
 
-    wer = word_error_rate(hypotheses=greedy_hypotheses, references=references)
-    nemo.logging.info("Greedy WER {:.2f}%".format(wer*100))
+    if args.feature_cache and feature_store is None:
+        features = unbatch_features(evaluated_tensors[5], evaluated_tensors[6])
+        if args.bucket_batches:
+            features = restore_order(features, order)
+        feature_cache.put(feature_key, features, meta={'references': references})
+        nemo.logging.info('Saved features to {}'.format(feature_cache.path(feature_key)))
+    return logprobs, greedy_hypotheses, references
 
-    # language model
+
+def eval_shard(args):
+    """(shard_id, num_shards) of this process: --shard_id/--num_shards or the
+    rank of torch.distributed.launch
+    """
+    if args.num_shards is not None:
+        return args.shard_id, args.num_shards
+    if args.local_rank is not None:
+        return int(os.environ.get('RANK', args.local_rank)), \
+            int(os.environ.get('WORLD_SIZE', 1))
+    return 0, 1
+
+
+def write_shard_manifest(eval_datasets, shard_id, num_shards, path):
+    """Write the contiguous slice shard_id of the (comma separated) eval
+    manifests, shards are gathered in order by concatenation
+
+    Returns:
+      number of entries in the shard
+    """
+    manifests = eval_datasets.split(',')
+    num_lines = 0
+    for manifest in manifests:
+        with open(manifest) as f:
+            num_lines += sum(1 for line in f if line.strip())
+    start = num_lines * shard_id // num_shards
+    end = num_lines * (shard_id + 1) // num_shards
+    i = 0
+    with open(path, 'w') as fout:
+        for manifest in manifests:
+            with open(manifest) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if start <= i < end:
+                        fout.write(line.rstrip('\n') + '\n')
+                    i += 1
+    return end - start
+
+
+def manifest_audio(eval_datasets, num_utterances):
+    """Audio paths and durations of the (comma separated) eval manifests, in
+    the order of the evaluated utterances (None if the data layer dropped
+    entries and the manifests do not match the outputs)
+    """
+    audio_filepaths, durations = [], []
+    for manifest in eval_datasets.split(','):
+        with open(manifest) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    audio_filepaths.append(entry['audio_filepath'])
+                    durations.append(entry['duration'])
+    if len(audio_filepaths) != num_utterances:
+        nemo.logging.warning('{} manifest entries for {} utterances, audio paths '
+                             'are not saved'.format(len(audio_filepaths), num_utterances))
+        return [None] * num_utterances, [None] * num_utterances
+    return audio_filepaths, durations
+
+
+def beam_search_grid(args, vocab, logprobs, num_cpus):
+    """Beam hypotheses of every (alpha, beta) of the grid
+
+    Returns:
+      dict (alpha, beta) -> hypotheses
+    """
+    points = grid_points(args.alpha, args.alpha_max, args.alpha_step,
+                         args.beta, args.beta_max, args.beta_step)
+    if len(logprobs) == 0:
+        return {point: [] for point in points}
+    nemo.logging.info('Beam search over {} (alpha, beta) pairs'.format(len(points)))
+    # the acoustic model already ran, decode its cached outputs for every
+    # (alpha, beta) with a single LM instance
+    lm_search = LMGridSearch(vocab, args.lm_path, beam_width=args.beam_width,
+                             num_cpus=num_cpus)
+    return dict(lm_search.search(logprobs_to_probs(logprobs), points))
+
+
+def evaluate(args, jasper_params, eval_datasets, num_cpus):
+    """Acoustic model (or log-probs cache) and LM grid over eval_datasets
+
+    Returns:
+      log-probs, greedy hypotheses, references, beam hypotheses per (alpha, beta)
+    """
+    vocab = jasper_params['labels']
+
+    # log-probs of a checkpoint, model config and dataset already evaluated
+    store = None
+    if args.logprob_cache:
+        cache = ArrayCache(args.logprob_cache)
+        cache_key = content_key(
+            files=checkpoint_files(args.load_dir, CHECKPOINT_MODULES) +
+            eval_datasets.split(','),
+            objects=[jasper_params, args.amp_opt_level])
+        store = cache.get(cache_key)
+        if store is not None:
+            nemo.logging.info('Loaded log-probs of {} examples from {}'.format(
+                len(store), store.path))
+
+    if store is not None:
+        logprobs = store
+        greedy_hypotheses = store.meta['greedy_hypotheses']
+        references = store.meta['references']
+    else:
+        logprobs, greedy_hypotheses, references = acoustic_model_outputs(
+            args, jasper_params, eval_datasets)
+        if args.logprob_cache:
+            cache.put(cache_key, logprobs, dtype=args.logprob_dtype,
+                      meta={'model_id': args.model_id,
+                            'dataset': eval_datasets,
+                            'greedy_hypotheses': greedy_hypotheses,
+                            'references': references})
+            nemo.logging.info('Saved log-probs to {}'.format(cache.path(cache_key)))
+
+    beam_hypotheses = {}
     if args.lm_path:
-        if args.alpha_max is None:
-            args.alpha_max = args.alpha
-        # include alpha_max in tuning range
-        args.alpha_max += args.alpha_step/10.0
+        beam_hypotheses = beam_search_grid(args, vocab, logprobs, num_cpus)
+    return logprobs, greedy_hypotheses, references, beam_hypotheses
 
-        if args.beta_max is None:
-            args.beta_max = args.beta
-        # include beta_max in tuning range
-        args.beta_max += args.beta_step/10.0
 
-        beam_wers = []
+def shard_name(shard_id, num_shards):
+    return 'shard{}of{}'.format(shard_id, num_shards)
+
+
+def save_shard(shard_dir, shard_id, num_shards, outputs):
+    """Write the outputs of evaluate for one shard (atomically)"""
+    logprobs, greedy_hypotheses, references, beam_hypotheses = outputs
+    ArrayCache(shard_dir).put(
+        shard_name(shard_id, num_shards), logprobs, dtype=np.float32,
+        meta={'greedy_hypotheses': greedy_hypotheses,
+              'references': references,
+              'beam': [[alpha, beta, hyps] for (alpha, beta), hyps
+                       in beam_hypotheses.items()]})
+
+
+def gather_shards(shard_dir, num_shards, poll_secs=5):
+    """Wait for all shards and concatenate their outputs in shard order"""
+    cache = ArrayCache(shard_dir)
+    stores = []
+    for shard_id in range(num_shards):
+        store = cache.get(shard_name(shard_id, num_shards))
+        while store is None:
+            nemo.logging.info('Waiting for shard {}/{}'.format(shard_id, num_shards))
+            time.sleep(poll_secs)
+            store = cache.get(shard_name(shard_id, num_shards))
+        stores.append(store)
+
+    logprobs, greedy_hypotheses, references = [], [], []
+    beam_hypotheses = {}
+    for store in stores:
+        logprobs.extend(store)
+        greedy_hypotheses.extend(store.meta['greedy_hypotheses'])
+        references.extend(store.meta['references'])
+        for alpha, beta, hyps in store.meta['beam']:
+            beam_hypotheses.setdefault((alpha, beta), []).extend(hyps)
+    return logprobs, greedy_hypotheses, references, beam_hypotheses
+
+
+def launch_workers(args, num_cpus):
+    """Run --num_workers shard processes of this script on the local machine
+    (one GPU each, or num_cpus/num_workers cpus each with --device=cpu)
+    """
+    cpus_per_worker = max(num_cpus // args.num_workers, 1)
+    devices = None
+    if args.device != 'cpu':
+        # worker i gets the i-th GPU this process may use
+        if 'CUDA_VISIBLE_DEVICES' in os.environ:
+            devices = [d for d in os.environ['CUDA_VISIBLE_DEVICES'].split(',')
+                       if d.strip()]
+        else:
+            devices = [str(i) for i in range(torch.cuda.device_count())]
+        if args.num_workers > len(devices):
+            raise ValueError('--num_workers={} but {} GPUs are visible'.format(
+                args.num_workers, len(devices)))
+    argv = []
+    skip = False
+    for a in sys.argv[1:]:
+        if skip or a.startswith('--num_workers='):
+            skip = False
+        elif a == '--num_workers':
+            skip = True
+        else:
+            argv.append(a)
+    procs = []
+    for shard_id in range(args.num_workers):
+        env = dict(os.environ, OMP_NUM_THREADS=str(cpus_per_worker))
+        if devices is not None:
+            env['CUDA_VISIBLE_DEVICES'] = devices[shard_id]
+        cmd = [sys.executable, os.path.abspath(__file__)] + argv + [
+            '--shard_id={}'.format(shard_id),
+            '--num_shards={}'.format(args.num_workers),
+            '--num_cpus={}'.format(cpus_per_worker),
+            '--shard_dir={}'.format(args.shard_dir),
+            '--no_gather']
+        procs.append(subprocess.Popen(cmd, env=env))
+    for shard_id, proc in enumerate(procs):
+        if proc.wait() != 0:
+            raise RuntimeError('Shard {} failed with exit code {}'.format(
+                shard_id, proc.returncode))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Jasper')
+    # model params
+    parser.add_argument("--model_config", type=str, required=True)
+    parser.add_argument("--eval_datasets", type=str, required=True)
+    parser.add_argument("--load_dir", type=str, required=True)
+    parser.add_argument("--model_id", type=str, required=True) # new
+    # run params
+    parser.add_argument("--local_rank", default=None, type=int)
+    parser.add_argument("--batch_size", default=64, type=int)
+    parser.add_argument("--amp_opt_level", default="O0", type=str) # new
+    parser.add_argument("--bucket_batches", action='store_true',
+                        help="Run batches of clips sorted by duration")
+    # store results
+    parser.add_argument("--save_results", default=None, type=str) # new
+    parser.add_argument("--save_logprob", default=None, type=str)
+    parser.add_argument("--logprob_cache", default=None, type=str,
+                        help="log-probs cache directory, inference is skipped "
+                             "for a checkpoint/config/dataset already cached")
+    parser.add_argument("--logprob_dtype", default="float32", type=str,
+                        choices=["float32", "float16"])
+    parser.add_argument("--feature_cache", default=None, type=str,
+                        help="log-mel features cache directory, the preprocessor "
+                             "runs once per dataset and preprocessor config")
+
+    # lm inference parameters
+    parser.add_argument("--lm_path", default=None, type=str)
+    parser.add_argument(
+        '--alpha', default=2., type=float,
+        help='value of LM weight',
+        required=False)
+    parser.add_argument(
+        '--alpha_max', type=float,
+        help='maximum value of LM weight (for a grid search in \'eval\' mode)',
+        required=False)
+    parser.add_argument(
+        '--alpha_step', type=float,
+        help='step for LM weight\'s tuning in \'eval\' mode',
+        required=False, default=0.1)
+    parser.add_argument(
+        '--beta', default=1.5, type=float,
+        help='value of word count weight',
+        required=False)
+    parser.add_argument(
+        '--beta_max', type=float,
+        help='maximum value of word count weight (for a grid search in \
+          \'eval\' mode',
+        required=False)
+    parser.add_argument(
+        '--beta_step', type=float,
+        help='step for word count weight\'s tuning in \'eval\' mode',
+        required=False, default=0.1)
+    parser.add_argument(
+        "--beam_width", default=128, type=int)
+
+    # sharded evaluation
+    parser.add_argument("--device", default="gpu", type=str, choices=["gpu", "cpu"])
+    parser.add_argument("--num_workers", default=1, type=int,
+                        help="number of local shard processes")
+    parser.add_argument("--shard_id", default=0, type=int)
+    parser.add_argument("--num_shards", default=None, type=int,
+                        help="number of shards (default: world size of "
+                             "torch.distributed.launch)")
+    parser.add_argument("--shard_dir", default=None, type=str,
+                        help="shard outputs, shared by all shards (default: a "
+                             "directory of the run, required with --num_shards)")
+    parser.add_argument("--num_cpus", default=None, type=int,
+                        help="cpus for beam search (default: all cpus per "
+                             "process on the machine)")
+    # shard processes of --num_workers, gathered by the launching process
+    parser.add_argument("--no_gather", action="store_true", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    yaml = YAML(typ="safe")
+    with open(args.model_config) as f:
+        jasper_params = yaml.load(f)
 
-        for alpha in np.arange(args.alpha, args.alpha_max, args.alpha_step):
-            for beta in np.arange(args.beta, args.beta_max, args.beta_step):
-                nemo.logging.info('================================')
-                nemo.logging.info(f'Infering with (alpha, beta): ({alpha}, {beta})')
-                beam_search_with_lm = nemo_asr.BeamSearchDecoderWithLM(
-                    vocab=vocab,
-                    beam_width=args.beam_width,
-                    alpha=alpha,
-                    beta=beta,
-                    lm_path=args.lm_path,
-                    num_cpus=max(os.cpu_count(), 1))
-                beam_predictions_e1 = beam_search_with_lm(
-                    log_probs=log_probs_e1, log_probs_length=encoded_len_e1)
-
-                evaluated_tensors = neural_factory.infer(
-                    tensors=[beam_predictions_e1],
-                    use_cache=False,
-                    verbose=False
-                )
-
-                beam_hypotheses = []
-                # Over mini-batch
-                for i in evaluated_tensors[-1]:
-                    # Over samples
-                    for j in i:
-                        beam_hypotheses.append(j[0][1])
-                lm_wer = word_error_rate(
-                    hypotheses=beam_hypotheses, references=references)
-                nemo.logging.info("Beam WER {:.2f}%".format(lm_wer*100))
-                beam_wers.append(((alpha, beta), lm_wer*100))
+    shard_id, num_shards = eval_shard(args)
+    if args.shard_dir is None:
+        if num_shards > 1 and args.local_rank is None:
+            parser.error('--shard_dir is required by --num_shards')
+        # unique to this run, shards of an earlier run are never gathered:
+        # the launching process, or torch.distributed.launch of the ranks
+        run_id = str(os.getpid()) if args.local_rank is None else \
+            '{}-{}'.format(os.getppid(), os.environ.get('MASTER_PORT', ''))
+        dataset_name = args.eval_datasets.split("/")[-1].split(".")[0]
+        args.shard_dir = os.path.join(
+            tempfile.gettempdir(),
+            'jasper_eval__' + dataset_name + '__' + args.model_id + '__' + run_id)
+    num_cpus = args.num_cpus
+    if num_cpus is None:
+        procs_per_node = int(os.environ.get('LOCAL_WORLD_SIZE', num_shards)) \
+            if args.local_rank is not None else 1
+        num_cpus = max(os.cpu_count() // procs_per_node, 1)
+
+    if args.num_workers > 1:
+        # the shard dir belongs to this launch
+        if os.path.exists(args.shard_dir):
+            rm_rf(args.shard_dir)
+        launch_workers(args, num_cpus)
+        outputs = gather_shards(args.shard_dir, args.num_workers)
+    elif num_shards > 1:
+        mkdir_p(args.shard_dir)
+        shard_manifest = os.path.join(
+            args.shard_dir, 'manifest.' + shard_name(shard_id, num_shards) + '.json')
+        write_shard_manifest(args.eval_datasets, shard_id, num_shards, shard_manifest)
+        save_shard(args.shard_dir, shard_id, num_shards,
+                   evaluate(args, jasper_params, shard_manifest, num_cpus))
+        nemo.logging.info('Shard {}/{} done'.format(shard_id, num_shards))
+        if shard_id != 0 or args.no_gather:
+            return
+        outputs = gather_shards(args.shard_dir, num_shards)
+    else:
+        outputs = evaluate(args, jasper_params, args.eval_datasets, num_cpus)
+    logprobs, greedy_hypotheses, references, beam_hypotheses = outputs
+
+    # WER over all shards, references are tokenized once for the whole grid
+    nemo.logging.info('Evaluated {0} examples'.format(len(references)))
+    scorer = WERScorer(references, num_cpus=num_cpus)
+    counts = scorer.counts(greedy_hypotheses)
+    wer = error_rate(counts)
+    errors = {"substitutions": int(counts[:, SUB].sum()),
+              "deletions": int(counts[:, DEL].sum()),
+              "insertions": int(counts[:, INS].sum())}
+    nemo.logging.info("Greedy WER {:.2f}% ({})".format(wer*100, errors))
+
+    # language model
+    if args.lm_path:
+        beam_wers = []
+        for point in sorted(beam_hypotheses):
+            lm_wer = scorer.wer(beam_hypotheses[point])
+            beam_wers.append((point, lm_wer*100))
 
         nemo.logging.info('Beam WER for (alpha, beta)')
         nemo.logging.info('================================')
         nemo.logging.info('\n' + '\n'.join([str(e) for e in beam_wers]))
         nemo.logging.info('================================')
         best_beam_wer = min(beam_wers, key=lambda x: x[1])
+        beam_hypotheses = beam_hypotheses[best_beam_wer[0]]
+        beam_counts = scorer.counts(beam_hypotheses)
         nemo.logging.info('Best (alpha, beta): '
                     f'{best_beam_wer[0]}, '
                     f'WER: {best_beam_wer[1]:.2f}%')
+    else:
+        beam_hypotheses, beam_counts = None, None
+    scorer.close()
 
     # save results
     if args.save_results:
@@ -218,12 +539,10 @@ def main():
           "model_id": args.model_id,
           "dataset": selected_dataset,
           "wer": wer,
-          "transcript": ' '.join(greedy_hypotheses),
-          "gtruth": ' '.join(references)
+          "errors": errors,
         }
         if args.lm_path:
             results['alpha-beta'] = best_beam_wer[0]
-            results['beam transcript'] = ' '.join(beam_hypotheses)
             results['lm_wer'] = best_beam_wer[1]/100
         else:
             results['lm_wer'] = None
@@ -238,19 +557,27 @@ def main():
         filename = os.path.join(args.save_results,
                                 "results-" + inf_type + "__" \
                                 + dataset_name + "__" + model_name + ".json")
+        # transcripts and error counts per utterance (see tools/misc.py)
+        utterances = utterances_path(filename)
+        audio_filepaths, durations = manifest_audio(selected_dataset, len(references))
+        write_utterance_results(utterances, audio_filepaths, durations, references,
+                                greedy_hypotheses, counts,
+                                beam=beam_hypotheses, beam_counts=beam_counts)
+        results['utterances'] = os.path.basename(utterances)
         nemo.logging.info("Saving inference results to {}".format(filename))
         with open(filename, "w") as out_file:
             json.dump(results, out_file)
+        index_results(filename, results)
 
     # save logits
     if args.save_logprob:
-        # Convert logits to list of numpy arrays
-        logprob = []
-        for i, batch in enumerate(evaluated_tensors[0]):
-            for j in range(batch.shape[0]):
-                logprob.append(batch[j][: evaluated_tensors[4][i][j], :].cpu().numpy())
+        # list of numpy arrays
         with open(args.save_logprob, 'wb') as f:
-            pickle.dump(logprob, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump([np.array(l) for l in logprobs], f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    if num_shards > 1 or args.num_workers > 1:
+        rm_rf(args.shard_dir)
 
 
 if __name__ == "__main__":
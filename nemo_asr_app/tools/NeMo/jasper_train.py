@@ -13,6 +13,9 @@ import nemo.utils.argparse as nm_argparse
 from nemo.collections.asr.helpers import monitor_asr_train_progress, \
   process_evaluation_batch, process_evaluation_epoch
 from nemo.utils.lr_policies import CosineAnnealing
+from tools.NeMo.perturb import build_augmentor
+from tools.NeMo.bucketing import BucketingDataLayer
+from tools.NeMo.tarred_dataset import TarredAudioToTextDataLayer
 
 logging = nemo.logging
 
@@ -49,6 +52,12 @@ def parse_args():
     # Finetuning args
     parser.add_argument("--pretrained_decoder", default="", type=str)
     parser.add_argument("--pretrained_encoder", default="", type=str)
+    parser.add_argument("--bucket_batches", action='store_true',
+                        help="Batch training clips of similar duration (shuffled buckets)")
+    parser.add_argument("--tarred_audio_filepaths", default=None, type=str,
+                        help="Tar shards of train_dataset (tarred manifest), e.g. audio_{0..63}.tar")
+    parser.add_argument("--shuffle_n", default=2048, type=int,
+                        help="Sample shuffling buffer of each tarred data loader worker")
 
     args = parser.parse_args()
 
@@ -78,23 +87,34 @@ def create_all_dags(args, neural_factory):
     total_cpus = os.cpu_count()
     cpu_per_traindl = max(int(total_cpus / neural_factory.world_size), 1)
 
-    # perturb_config = jasper_params.get('perturb', None)
+    speed_perturb_config = jasper_params.get('SpeedPerturbation', None)
     train_dl_params = copy.deepcopy(jasper_params["AudioToTextDataLayer"])
     train_dl_params.update(jasper_params["AudioToTextDataLayer"]["train"])
     del train_dl_params["train"]
     del train_dl_params["eval"]
     # del train_dl_params["normalize_transcripts"]
 
-    data_layer = nemo_asr.AudioToTextDataLayer(
+    data_layer_class = nemo_asr.AudioToTextDataLayer
+    if args.tarred_audio_filepaths:
+        # train_dataset is the tarred manifest of the shards
+        data_layer_class = TarredAudioToTextDataLayer
+        train_dl_params.update(tarred_audio_filepaths=args.tarred_audio_filepaths,
+                               shuffle_n=args.shuffle_n)
+    data_layer = data_layer_class(
         manifest_filepath=args.train_dataset,
         sample_rate=sample_rate,
         labels=vocab,
         batch_size=args.batch_size,
         num_workers=cpu_per_traindl,
+        augmentor=build_augmentor(speed_perturb_config),
         **train_dl_params,
         # normalize_transcripts=False
     )
 
+    # streamed shards have no random access to bucket
+    if args.bucket_batches and not args.tarred_audio_filepaths:
+        data_layer = BucketingDataLayer(data_layer, shuffle=True)
+
     N = len(data_layer)
     steps_per_epoch = math.ceil(N / (args.batch_size * args.iter_per_step * args.num_gpus))
     logging.info('Have {0} examples to train on.'.format(N))
@@ -0,0 +1,51 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import os
+import random
+
+from nemo.collections.asr.parts.perturb import AudioAugmentor, Perturbation
+
+from tools.audio_tools import speed_perturb
+
+
+class SpeedPerturbation(Perturbation):
+    """Random speed (tempo and pitch) perturbation of decoded training audio.
+    It runs in the DataLoader workers and replaces the wav copies written by
+    speed_augment_dataset.py.
+    Arguments:
+      speeds: speed factors to sample from (1.0 keeps the audio unchanged)
+    """
+
+    def __init__(self, speeds=(0.9, 1.0, 1.1)):
+        self._speeds = [float(s) for s in speeds]
+        self._rng = None
+        self._pid = None
+
+    def _get_rng(self):
+        # DataLoader workers are forked with the same state, seed once per process
+        if self._pid != os.getpid():
+            self._rng = random.Random()
+            self._pid = os.getpid()
+        return self._rng
+
+    def max_augmentation_length(self, length):
+        return length / min(self._speeds)
+
+    def perturb(self, data):
+        speed = self._get_rng().choice(self._speeds)
+        if speed != 1.0:
+            data._samples = speed_perturb(data._samples, speed)
+
+
+def build_augmentor(config):
+    """AudioAugmentor for the training data layer from the SpeedPerturbation
+    section of the model yaml, None if the section is missing, e.g.
+
+    SpeedPerturbation:
+        prob: 1.0
+        speeds: [0.9, 1.0, 1.1]
+    """
+    if not config:
+        return None
+    config = dict(config)
+    prob = config.pop('prob', 1.0)
+    return AudioAugmentor(perturbations=[(prob, SpeedPerturbation(**config))])
@@ -24,6 +24,9 @@ import nemo.collections.asr as nemo_asr
 import nemo.utils.argparse as nm_argparse
 from nemo.collections.asr.helpers import monitor_asr_train_progress, process_evaluation_batch, process_evaluation_epoch
 from nemo.utils.lr_policies import *
+from tools.NeMo.perturb import build_augmentor
+from tools.NeMo.bucketing import BucketingDataLayer
+from tools.NeMo.tarred_dataset import TarredAudioToTextDataLayer
 
 
 logging = nemo.logging
@@ -71,6 +74,12 @@ def parse_args():
     parser.add_argument("--eval_freq", default=1000, type=int, help="Evaluation frequency")
     parser.add_argument("--pretrained_encoder", default="", type=str, help="encoder checkpoint to restore from")
     parser.add_argument("--pretrained_decoder", default="", type=str, help="decoder checkpoint to restore from")
+    parser.add_argument("--bucket_batches", action='store_true',
+                        help="Batch training clips of similar duration (shuffled buckets)")
+    parser.add_argument("--tarred_audio_filepaths", default=None, type=str,
+                        help="Tar shards of train_dataset (tarred manifest), e.g. audio_{0..63}.tar")
+    parser.add_argument("--shuffle_n", default=2048, type=int,
+                        help="Sample shuffling buffer of each tarred data loader worker")
 
     args = parser.parse_args()
     if args.max_steps is not None:
@@ -100,15 +109,29 @@ def create_all_dags(args, neural_factory):
     del train_dl_params["eval"]
     # del train_dl_params["normalize_transcripts"]
 
-    data_layer_train = nemo_asr.AudioToTextDataLayer(
+    # on-the-fly speed perturbation (only used for training) if its config is present
+    speed_perturb_config = quartz_params.get('SpeedPerturbation', None)
+
+    data_layer_class = nemo_asr.AudioToTextDataLayer
+    if args.tarred_audio_filepaths:
+        # train_dataset is the tarred manifest of the shards
+        data_layer_class = TarredAudioToTextDataLayer
+        train_dl_params.update(tarred_audio_filepaths=args.tarred_audio_filepaths,
+                               shuffle_n=args.shuffle_n)
+    data_layer_train = data_layer_class(
         manifest_filepath=args.train_dataset,
         sample_rate=sample_rate,
         labels=vocab,
         batch_size=args.batch_size,
         num_workers=cpu_per_traindl,
+        augmentor=build_augmentor(speed_perturb_config),
         **train_dl_params
     )
 
+    # streamed shards have no random access to bucket
+    if args.bucket_batches and not args.tarred_audio_filepaths:
+        data_layer_train = BucketingDataLayer(data_layer_train, shuffle=True)
+
     N = len(data_layer_train)
     steps_per_epoch = int(N / (args.batch_size * args.iter_per_step * args.num_gpus))
 
@@ -0,0 +1,137 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/NeMo/streaming_inference.py --model_config=model.yaml --encoder=JasperEncoder.pt --decoder=JasperDecoderForCTC.pt --audio_file=long.wav
+import argparse
+import numpy as np
+import scipy.io.wavfile as wave
+
+from tools.NeMo.demo_inference import InferenceSession
+
+"""Chunked transcription of long audio files: the wav is memory mapped and
+fixed windows with left/right context run through the acoustic model, only
+the log-prob frames of the window centers are kept and stitched. Memory
+does not depend on the file length.
+"""
+
+
+def samples_per_frame(model_definition):
+  """Audio samples per encoder output frame (preprocessor hop x encoder strides)"""
+  hop = int(round(model_definition['sample_rate'] *
+                  model_definition['AudioToMelSpectrogramPreprocessor']['window_stride']))
+  stride = 1
+  for block in model_definition['JasperEncoder']['jasper']:
+    stride *= block['stride'][0]
+  return hop * stride
+
+
+class GreedyCTCState(object):
+  """Greedy CTC decoding of log-probs given chunk by chunk, repeats are
+  collapsed across chunk boundaries
+  Arguments:
+    labels: model labels (blank is the last class)
+  """
+
+  def __init__(self, labels):
+    self.labels = labels
+    self.blank = len(labels)
+    self.last = self.blank
+
+  def decode(self, log_probs):
+    """Text of the next chunk of log-probs (T x V)"""
+    ids = np.argmax(log_probs, axis=-1)
+    text = []
+    for i in ids:
+      if i != self.last and i != self.blank:
+        text.append(self.labels[i])
+      self.last = i
+    return ''.join(text)
+
+
+class StreamingTranscriber(object):
+  """Chunked greedy transcription with a warm InferenceSession
+  Arguments:
+    session: InferenceSession
+    chunk_secs: audio kept from each window
+    context_secs: audio added on each side of a chunk, its frames are dropped
+    batch_size: windows per acoustic model call
+  """
+
+  def __init__(self, session, chunk_secs=20., context_secs=2., batch_size=1):
+    self.session = session
+    self.batch_size = batch_size
+    self.spf = samples_per_frame(session.model_definition)
+    sample_rate = session.sample_rate
+    self.chunk_frames = max(int(chunk_secs * sample_rate) // self.spf, 1)
+    self.context_frames = int(context_secs * sample_rate) // self.spf
+
+  def _windows(self, signal):
+    """(first kept frame, window start frame, window samples) of every chunk"""
+    num_frames = -(-len(signal) // self.spf)
+    for first in range(0, num_frames, self.chunk_frames):
+      start = max(first - self.context_frames, 0)
+      end = first + self.chunk_frames + self.context_frames
+      yield first, start, signal[start * self.spf:end * self.spf]
+
+  def stream(self, audio_file):
+    """Yield a dict per chunk as it is transcribed: start/end (secs), text of
+    the chunk (the concatenation of all texts is the transcript) and the
+    stitched log-probs of the chunk
+    """
+    _, signal = wave.read(audio_file, mmap=True)
+    if signal.ndim > 1:
+      signal = signal[:, 0]
+    greedy = GreedyCTCState(self.session.labels)
+    sample_rate = float(self.session.sample_rate)
+
+    batch = []
+    windows = self._windows(signal)
+    while True:
+      window = next(windows, None)
+      if window is not None:
+        batch.append(window)
+        if len(batch) < self.batch_size:
+          continue
+      if not batch:
+        break
+      results = self.session.transcribe_batch([samples for _, _, samples in batch])
+      for (first, start, _), result in zip(batch, results):
+        offset = first - start
+        log_probs = result['probs'][offset:offset + self.chunk_frames]
+        yield {
+          'start': first * self.spf / sample_rate,
+          'end': min((first + self.chunk_frames) * self.spf, len(signal)) / sample_rate,
+          'text': greedy.decode(log_probs),
+          'probs': log_probs}
+      batch = []
+      if window is None:
+        break
+
+  def transcribe(self, audio_file):
+    """Greedy transcript of a whole file"""
+    return ''.join(chunk['text'] for chunk in self.stream(audio_file))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Chunked transcription of long audio')
+  parser.add_argument('--model_config', type=str, required=True)
+  parser.add_argument('--encoder', type=str, required=True)
+  parser.add_argument('--decoder', type=str, required=True)
+  parser.add_argument('--audio_file', type=str, required=True)
+  parser.add_argument('--device', type=str, default='gpu', choices=['gpu', 'cpu'])
+  parser.add_argument('--chunk_secs', type=float, default=20.)
+  parser.add_argument('--context_secs', type=float, default=2.)
+  parser.add_argument('--batch_size', type=int, default=1)
+  args = parser.parse_args()
+
+  session = InferenceSession(args.model_config, args.encoder, args.decoder,
+                             device=args.device)
+  transcriber = StreamingTranscriber(session, chunk_secs=args.chunk_secs,
+                                     context_secs=args.context_secs,
+                                     batch_size=args.batch_size)
+  transcript = []
+  for chunk in transcriber.stream(args.audio_file):
+    transcript.append(chunk['text'])
+    print('[{:.1f}-{:.1f}s] {}'.format(chunk['start'], chunk['end'], chunk['text']), flush=True)
+  print(''.join(transcript))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,274 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import io
+import re
+import glob
+import json
+import random
+import tarfile
+
+import torch
+from torch.utils.data import DataLoader, IterableDataset
+
+import nemo
+from nemo.backends.pytorch.nm import DataLayerNM
+from nemo.core.neural_types import NeuralType, AudioSignal, LengthsType, LabelsType
+from nemo.collections.asr.parts import parsers
+from nemo.collections.asr.parts.segment import AudioSegment
+
+"""Training data layer that streams the tar shards written by
+create_datasets/create_tarred_dataset.py: shards are read sequentially,
+shuffled at the shard level and with a sample buffer.
+"""
+
+
+def expand_shard_paths(pattern):
+    """Shard paths of a brace range (audio_{0..63}.tar), a glob or a comma
+    separated list
+    """
+    paths = []
+    for part in pattern.split(','):
+        brace = re.search(r'\{(\d+)\.\.(\d+)\}', part)
+        if brace:
+            paths.extend(part[:brace.start()] + str(i) + part[brace.end():]
+                         for i in range(int(brace.group(1)), int(brace.group(2)) + 1))
+        else:
+            paths.extend(sorted(glob.glob(part)) or [part])
+    return paths
+
+
+def seq_collate_fn(batch):
+    """Zero padded batch of (audio, audio length, tokens, tokens length)"""
+    audio_lengths = torch.stack([b[1] for b in batch])
+    tokens_lengths = torch.stack([b[3] for b in batch])
+    audio = torch.zeros(len(batch), int(audio_lengths.max()))
+    tokens = torch.zeros(len(batch), int(tokens_lengths.max()), dtype=torch.long)
+    for i, (signal, signal_len, tokens_i, tokens_len) in enumerate(batch):
+        audio[i, :signal_len] = signal
+        tokens[i, :tokens_len] = tokens_i
+    return audio, audio_lengths, tokens, tokens_lengths
+
+
+class TarredAudioDataset(IterableDataset):
+    """Utterances of tar shards, each DataLoader worker of each rank reads its
+    own subset of the shards. Every rank yields len(entries) // world_size
+    utterances per epoch (shards are read again or cut short to get there)
+    Arguments:
+      manifest_filepath: tarred manifest (member names as audio_filepath)
+      shard_paths: list of tar shards
+      labels: model labels
+      sample_rate: target sample rate
+      int_values: read audio as int values
+      augmentor: AudioAugmentor applied to each utterance
+      min_duration, max_duration: duration filter (secs)
+      trim: trim leading and trailing silence
+      normalize: normalize transcripts (parser of AudioToTextDataLayer)
+      shuffle: shuffle the shard order every epoch
+      shuffle_n: size of the shuffling buffer of encoded samples (0: no
+                 shuffling)
+      seed: shuffling seed (the epoch is added)
+    """
+
+    def __init__(self, manifest_filepath, shard_paths, labels, sample_rate,
+                 int_values=False, augmentor=None, min_duration=None,
+                 max_duration=None, trim=False, normalize=True, shuffle=True,
+                 shuffle_n=0, seed=0):
+        self.shard_paths = shard_paths
+        self.sample_rate = sample_rate
+        self.int_values = int_values
+        self.augmentor = augmentor
+        self.trim = trim
+        self.shuffle = shuffle
+        self.shuffle_n = shuffle_n
+        self.seed = seed
+        self.epoch = 0
+        self.rank = 0
+        self.world_size = 1
+        if torch.distributed.is_initialized():
+            self.rank = torch.distributed.get_rank()
+            self.world_size = torch.distributed.get_world_size()
+
+        # same transcript parsing as AudioToTextDataLayer
+        parser = parsers.make_parser(labels=labels, name='en', unk_id=-1,
+                                     blank_id=-1, do_normalize=normalize)
+        self.entries = {}
+        with open(manifest_filepath) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if min_duration is not None and entry['duration'] < min_duration:
+                    continue
+                if max_duration is not None and entry['duration'] > max_duration:
+                    continue
+                tokens = parser(entry['text'])
+                if tokens is None:
+                    # transcript the normalizer cannot handle
+                    continue
+                self.entries[entry['audio_filepath']] = tokens
+
+    def _worker_shards(self):
+        """(shards, number of samples) of this DataLoader worker of this rank.
+        Every rank yields len(self) samples, whatever the shard sizes, so no
+        rank runs out of batches before the others under DDP.
+        """
+        shards = list(self.shard_paths)
+        if self.shuffle:
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        worker_info = torch.utils.data.get_worker_info()
+        num_workers = worker_info.num_workers if worker_info else 1
+        worker_id = worker_info.id if worker_info else 0
+        num_readers = self.world_size * num_workers
+        reader = self.rank * num_workers + worker_id
+        if len(shards) >= num_readers:
+            shards = shards[reader::num_readers]
+        else:
+            # fewer shards than readers, some readers share a shard
+            shards = [shards[reader % len(shards)]]
+        num_samples = len(self) // num_workers + (worker_id < len(self) % num_workers)
+        return shards, num_samples
+
+    def _read(self, shards, num_samples):
+        """num_samples encoded audio and tokens of the manifest entries of
+        shards, truncated or padded by reading the shards again
+        """
+        count = 0
+        while count < num_samples:
+            start = count
+            for shard in shards:
+                with tarfile.open(shard, mode='r|') as tar:
+                    for member in tar:
+                        tokens = self.entries.get(member.name)
+                        if tokens is None:
+                            continue
+                        yield tar.extractfile(member).read(), tokens
+                        count += 1
+                        if count == num_samples:
+                            return
+            if count == start:
+                raise RuntimeError('No manifest entry in shards {}'.format(shards))
+
+    def _decode(self, sample):
+        data, tokens = sample
+        segment = AudioSegment.from_file(
+            io.BytesIO(data), target_sr=self.sample_rate,
+            int_values=self.int_values, trim=self.trim)
+        if self.augmentor is not None:
+            self.augmentor.perturb(segment)
+        signal = torch.tensor(segment.samples, dtype=torch.float)
+        return signal, torch.tensor(signal.shape[0]).long(), \
+            torch.tensor(tokens).long(), torch.tensor(len(tokens)).long()
+
+    def __iter__(self):
+        samples = self._read(*self._worker_shards())
+        if not self.shuffle_n:
+            for sample in samples:
+                yield self._decode(sample)
+            return
+        worker_info = torch.utils.data.get_worker_info()
+        rng = random.Random(self.seed + self.epoch * 1000 + (worker_info.id if worker_info else 0))
+        # the buffer holds the encoded wav bytes, samples are decoded and
+        # augmented when they leave it
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_n:
+                buffer.append(sample)
+                continue
+            i = rng.randrange(self.shuffle_n)
+            yield self._decode(buffer[i])
+            buffer[i] = sample
+        rng.shuffle(buffer)
+        for sample in buffer:
+            yield self._decode(sample)
+
+    def __len__(self):
+        # samples of one rank
+        return len(self.entries) // self.world_size
+
+
+class _EpochLoader(object):
+    """DataLoader over a TarredAudioDataset that moves the dataset to the next
+    epoch (shard order) at every pass, set_epoch also works as sampler
+    """
+
+    def __init__(self, dataset, **loader_params):
+        self.dataset = dataset
+        self.sampler = self
+        self._loader = DataLoader(dataset=dataset, **loader_params)
+        self._epoch = None
+
+    def set_epoch(self, epoch):
+        self._epoch = epoch
+
+    def __iter__(self):
+        if self._epoch is not None:
+            self.dataset.epoch = self._epoch
+            self._epoch = None
+        it = iter(self._loader)
+        self.dataset.epoch += 1
+        return it
+
+    def __len__(self):
+        return len(self._loader)
+
+
+class TarredAudioToTextDataLayer(DataLayerNM):
+    """AudioToTextDataLayer reading tar shards instead of one wav per utterance
+    Arguments:
+      manifest_filepath: tarred manifest of create_tarred_dataset.py
+      tarred_audio_filepaths: shards (brace range, glob or comma separated)
+      labels: model labels
+      batch_size: batch size
+      sample_rate: target sample rate
+      int_values: read audio as int values
+      augmentor: AudioAugmentor (e.g. tools.NeMo.perturb.build_augmentor)
+      max_duration, min_duration: duration filter (secs)
+      trim_silence: trim leading and trailing silence
+      normalize_transcripts: normalize transcripts as AudioToTextDataLayer
+      shuffle: shuffle the shard order every epoch
+      shuffle_n: size of the sample shuffling buffer of each worker
+      num_workers: DataLoader workers
+      seed: shuffling seed
+    """
+
+    @property
+    def output_ports(self):
+        return {
+            'audio_signal': NeuralType(('B', 'T'), AudioSignal(freq=self._sample_rate)),
+            'a_sig_length': NeuralType(tuple('B'), LengthsType()),
+            'transcripts': NeuralType(('B', 'T'), LabelsType()),
+            'transcript_length': NeuralType(tuple('B'), LengthsType()),
+        }
+
+    def __init__(self, manifest_filepath, tarred_audio_filepaths, labels, batch_size,
+                 sample_rate=16000, int_values=False, augmentor=None,
+                 max_duration=None, min_duration=None, trim_silence=False,
+                 normalize_transcripts=True, shuffle=True, shuffle_n=2048,
+                 num_workers=0, seed=0):
+        super().__init__()
+        self._sample_rate = sample_rate
+        shard_paths = expand_shard_paths(tarred_audio_filepaths)
+        self._dataset = TarredAudioDataset(
+            manifest_filepath, shard_paths, labels, sample_rate,
+            int_values=int_values, augmentor=augmentor,
+            min_duration=min_duration, max_duration=max_duration,
+            trim=trim_silence, normalize=normalize_transcripts, shuffle=shuffle,
+            shuffle_n=shuffle_n if shuffle else 0, seed=seed)
+        if len(shard_paths) < self._dataset.world_size * max(num_workers, 1):
+            nemo.logging.warning('{} shards for {} readers, readers share shards'.format(
+                len(shard_paths), self._dataset.world_size * max(num_workers, 1)))
+        self._dataloader = _EpochLoader(
+            self._dataset, batch_size=batch_size, collate_fn=seq_collate_fn,
+            num_workers=num_workers)
+
+    def __len__(self):
+        # all ranks, as AudioToTextDataLayer (steps_per_epoch divides by the
+        # number of GPUs)
+        return len(self._dataset.entries)
+
+    @property
+    def dataset(self):
+        return None
+
+    @property
+    def data_iterator(self):
+        return self._dataloader
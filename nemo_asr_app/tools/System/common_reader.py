@@ -15,12 +15,17 @@
 import abc
 
 import os
+import copy
 import json
+import sqlite3
+from contextlib import contextmanager
 from easydict import EasyDict as edict
 
 from tools.filetools import mkdir_p, rm_rf
 from tools.System.autoloader import obj_to_class_str, str_to_class
 from tools.System.config import cfg
+from tools.System.manifest_store import ManifestCatalog, manifest_lock, \
+                                        merge_manifest
 
 
 class CommonReader(object):
@@ -42,9 +47,10 @@ class CommonReader(object):
     manifest_file = os.path.join(cfg.MANIFEST.PATH, str(obj_id) + '_' + cfg.MANIFEST.FILE)
 
     if os.path.exists(manifest_file) and os.path.isfile(manifest_file):
-      with open(manifest_file, 'r') as f:
-        manifest = edict(json.load(f))
-        return str_to_class(manifest.reader_type)(manifest)
+      with manifest_lock(manifest_file, shared=True):
+        with open(manifest_file, 'r') as f:
+          manifest = edict(json.load(f))
+      return str_to_class(manifest.reader_type)(manifest)
     else:
       raise IOError('Manifest file not found at %s' % manifest_file)
 
@@ -56,20 +62,92 @@ class CommonReader(object):
     """
     self.opened = False
     self.manifest = manifest
+    # nesting depth of batch() and the manifest as last saved (or loaded)
+    self._batch_depth = 0
+    self._saved_manifest = None
+    self._catalog = None
     if not self.manifest.is_built:
       self.manifest.reader_type = obj_to_class_str(self)
+    else:
+      self._saved_manifest = json.dumps(self.manifest, indent=4)
+
+  @staticmethod
+  def list_projects(reader_type=None):
+    """Ids of the saved projects (from the manifest catalog)
+
+    Args:
+      reader_type: only projects of this reader class (e.g. 'tools.System.reader.Reader')
+    """
+    return ManifestCatalog().list_projects(reader_type)
+
+  @property
+  def catalog(self):
+    """ManifestCatalog of the projects, opened on first use"""
+    if self._catalog is None:
+      self._catalog = ManifestCatalog()
+    return self._catalog
+
+  def _update_catalog(self, update):
+    try:
+      update(self.catalog)
+    except sqlite3.Error as e:
+      # the json manifest is the source of truth, only listing is affected
+      print('Manifest catalog not updated: {}'.format(e))
 
   def save_manifest(self):
-    """Save manifest file
+    """Save manifest file (deferred to the end of a batch(), skipped if the
+    manifest did not change). Changes saved by other readers of the project
+    since this one loaded or saved it are merged in.
     """
     # error check to make sure none of the dict items is empty:
     for k in self.manifest:
       if self.manifest[k] is None:
         raise AttributeError("No value set in manifest for key %s" % k)
+    if self._batch_depth:
+      return
     manifest_file = self.get_manifest_file_path()
-    mkdir_p(os.path.dirname(manifest_file))
-    with open(manifest_file, 'w') as f:
-      json.dump(self.manifest, f, indent=4)
+    with manifest_lock(manifest_file):
+      saved = self._saved_manifest
+      if self._saved_manifest is not None and os.path.isfile(manifest_file):
+        with open(manifest_file, 'r') as f:
+          saved = f.read()
+        if saved != self._saved_manifest:
+          self.manifest = edict(merge_manifest(json.loads(self._saved_manifest),
+                                               self.manifest, json.loads(saved)))
+      content = json.dumps(self.manifest, indent=4)
+      if content == saved:
+        # the file on disk is already this manifest
+        self._saved_manifest = saved
+        return
+      # readers never see a partly written manifest
+      tmp_file = '{}.tmp{}'.format(manifest_file, os.getpid())
+      with open(tmp_file, 'w') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+      os.replace(tmp_file, manifest_file)
+      self._saved_manifest = content
+    self._update_catalog(lambda catalog: catalog.update(self.manifest))
+
+  @contextmanager
+  def batch(self):
+    """Group manifest changes in one save at the end of the block, changes
+    are rolled back if the block raises
+
+      with reader.batch():
+        reader.set_am_batch_size(32)
+        reader.set_am_learning_rate(0.01)
+    """
+    backup = copy.deepcopy(self.manifest)
+    self._batch_depth += 1
+    try:
+      yield self
+    except:
+      self.manifest = backup
+      raise
+    finally:
+      self._batch_depth -= 1
+    self.save_manifest()
 
   def _ensure_opened(self):
     if not self.opened:
@@ -90,6 +168,7 @@ class CommonReader(object):
     """
     obj_folder = os.path.join(self.storage_base_path(), str(self.manifest.id))
     rm_rf(obj_folder)
+    self._update_catalog(lambda catalog: catalog.remove(self.manifest.id))
 
   def __enter__(self):
     """Context manager help - enter
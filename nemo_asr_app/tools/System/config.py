@@ -37,6 +37,7 @@ __C.DATASET.PATHS.INFERENCE = os.path.join(__C.DATASET.BASE_PATH,'inferences')
 __C.MANIFEST = edict()
 __C.MANIFEST.PATH = os.path.join(__C.DATASET.BASE_PATH, 'manifests')
 __C.MANIFEST.FILE = 'manifest.json'
+__C.MANIFEST.CATALOG = 'manifests.db'
 ##########################################################################
 # NeMo
 ##########################################################################
@@ -0,0 +1,143 @@
+# Copyright (c) 2019, NVIDIA CORPORATION. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import glob
+import json
+import time
+import fcntl
+import sqlite3
+from contextlib import contextmanager
+
+from tools.filetools import mkdir_p
+from tools.System.config import cfg
+
+"""Shared store of project manifests. The json manifests stay the source of
+truth and are read and written under a per-project file lock; a save merges
+the changes of the reader into the manifest on disk so concurrent readers of
+a project do not clobber each other. An SQLite catalog (WAL mode) keeps a
+copy of every manifest to list and query projects without opening each file.
+"""
+
+
+@contextmanager
+def manifest_lock(manifest_file, shared=False):
+  """Lock of a manifest file (shared for reads, exclusive for writes)"""
+  mkdir_p(os.path.dirname(manifest_file))
+  with open(manifest_file + '.lock', 'a') as f:
+    fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def merge_manifest(base, ours, theirs):
+  """Three-way merge of manifests (dicts of json values)
+  Arguments:
+    base: manifest both sides started from
+    ours: manifest of this reader
+    theirs: manifest saved by another reader since base
+
+  Returns:
+    theirs with the changes of ours over base (ours wins conflicting values,
+    items added to lists on both sides are kept)
+  """
+  if all(isinstance(m, list) for m in (base, ours, theirs)):
+    return [x for x in theirs if x in ours or x not in base] + \
+           [x for x in ours if x not in base and x not in theirs]
+  if not all(isinstance(m, dict) for m in (base, ours, theirs)):
+    return theirs if ours == base else ours
+  merged = dict(theirs)
+  for key in set(base) | set(ours):
+    if key not in ours:
+      # removed by this reader
+      merged.pop(key, None)
+    elif key not in base:
+      merged[key] = ours[key] if key not in theirs else \
+        merge_manifest({}, ours[key], theirs[key])
+    elif key in theirs:
+      merged[key] = merge_manifest(base[key], ours[key], theirs[key])
+    elif ours[key] != base[key]:
+      merged[key] = ours[key]
+  return merged
+
+
+class ManifestCatalog(object):
+  """SQLite catalog of the manifests of cfg.MANIFEST.PATH
+  Arguments:
+    path: catalog database
+  """
+
+  def __init__(self, path=None):
+    self.path = path or os.path.join(cfg.MANIFEST.PATH, cfg.MANIFEST.CATALOG)
+    mkdir_p(os.path.dirname(self.path))
+    new_catalog = not os.path.exists(self.path)
+    with self._connect() as db:
+      db.execute('CREATE TABLE IF NOT EXISTS projects ('
+                 'id TEXT PRIMARY KEY, reader_type TEXT, manifest_path TEXT, '
+                 'updated REAL, manifest TEXT)')
+    if new_catalog:
+      self.rebuild(os.path.dirname(self.path))
+
+  @contextmanager
+  def _connect(self):
+    db = sqlite3.connect(self.path, timeout=60)
+    try:
+      # readers do not block the writer
+      db.execute('PRAGMA journal_mode=WAL')
+      with db:
+        yield db
+    finally:
+      db.close()
+
+  def update(self, manifest):
+    """Insert or replace the catalog entry of a manifest"""
+    with self._connect() as db:
+      db.execute('INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?)',
+                 (str(manifest['id']), manifest.get('reader_type'),
+                  manifest.get('manifest_path'), time.time(), json.dumps(manifest)))
+
+  def remove(self, obj_id):
+    with self._connect() as db:
+      db.execute('DELETE FROM projects WHERE id = ?', (str(obj_id),))
+
+  def rebuild(self, manifest_dir=None):
+    """Catalog every manifest file of manifest_dir (projects saved before the
+    catalog existed)"""
+    manifest_dir = manifest_dir or cfg.MANIFEST.PATH
+    for manifest_file in glob.glob(os.path.join(manifest_dir, '*_' + cfg.MANIFEST.FILE)):
+      with manifest_lock(manifest_file, shared=True):
+        with open(manifest_file) as f:
+          self.update(json.load(f))
+
+  def list_projects(self, reader_type=None):
+    """Project ids, optionally of one reader class"""
+    query = 'SELECT id FROM projects'
+    params = ()
+    if reader_type is not None:
+      query += ' WHERE reader_type = ?'
+      params = (reader_type,)
+    with self._connect() as db:
+      return [row[0] for row in db.execute(query + ' ORDER BY id', params)]
+
+  def query(self, where='1', params=()):
+    """Manifests of the projects matching an SQL condition, manifest fields
+    are read with json_extract, e.g.
+      query("json_extract(manifest, '$.am.train_dataset_name') = ?", ('mcv_es',))
+    """
+    with self._connect() as db:
+      rows = db.execute('SELECT manifest FROM projects WHERE ' + where +
+                        ' ORDER BY id', params)
+      return [json.loads(row[0]) for row in rows]
@@ -22,6 +22,7 @@ from easydict import EasyDict as edict
 from tools.filetools import *
 from tools.System.config import cfg
 from tools.System.common_reader import CommonReader
+from tools.results_index import read_results_index
 
 import logging
 
@@ -59,6 +60,11 @@ class Reader(CommonReader):
     manifest.inference_params.beam_width = None
     manifest.inference_params.alpha = None
     manifest.inference_params.beta = None
+    manifest.inference_params.num_gpus = 1
+    manifest.inference_params.device = None
+    manifest.inference_params.num_workers = None
+    # bytes of the results index already added to manifest.inference
+    manifest.results_index_offset = 0
 
     # Acoustic model
     manifest.am = edict()
@@ -114,10 +120,11 @@ class Reader(CommonReader):
     """
     super(Reader, self).__init__(manifest)
     if not self.manifest.is_built:
-      self.load_am_config_file()
-      self.load_inf_config_file()
-      self.manifest.is_built = True
-      self.save_manifest()
+      # one manifest write for the whole setup
+      with self.batch():
+        self.load_am_config_file()
+        self.load_inf_config_file()
+        self.manifest.is_built = True
       print ('Manifest is saved', self.manifest.manifest_path, '\n')
     else:
       print ('Manifest restored from', self.manifest.manifest_path, '\n')
@@ -156,6 +163,8 @@ class Reader(CommonReader):
 
     # configs
     for key, value in self.manifest.inference_params.items():
+        if key == 'num_gpus':
+          continue
         if value is not None and value:
             config_changes.append('--' + key + '=' + str(value))
 
@@ -163,7 +172,10 @@ class Reader(CommonReader):
     config_changes.append('--eval_datasets=' + str(','.join(self.manifest.eval_datasets)))
     config_changes.append('--model_id='+ model_id)
 
-    no_gpus = 1
+    # each gpu evaluates a shard of the eval datasets
+    no_gpus = self.manifest.inference_params.get('num_gpus', 1)
+    if self.manifest.inference_params.get('device') == 'cpu':
+      no_gpus = 1
     inf_file = os.path.join(cfg.NEMO.TOOLS, 'jasper_eval.py')
 
     if no_gpus == 1:
@@ -180,6 +192,27 @@ class Reader(CommonReader):
     self.save_manifest()
     return cmd
 
+  def set_inference_num_gpus(self, num_gpus=1):
+    """Sets number of GPUs to use for inference, each GPU evaluates a shard
+    of the eval datasets
+    Arguments:
+      num_gpus: number of GPUs
+    """
+    self.manifest.inference_params.num_gpus = num_gpus
+    self.manifest.inference_params.device = None
+    self.manifest.inference_params.num_workers = None
+    self.save_manifest()
+
+  def set_inference_cpu_workers(self, num_workers=os.cpu_count()):
+    """Runs inference without GPU, sharded over CPU worker processes
+    Arguments:
+      num_workers: number of worker processes
+    """
+    self.manifest.inference_params.num_gpus = 1
+    self.manifest.inference_params.device = 'cpu'
+    self.manifest.inference_params.num_workers = num_workers
+    self.save_manifest()
+
   ##############################################################################
   # Add Results
   ##############################################################################
@@ -188,13 +221,13 @@ class Reader(CommonReader):
     Arguments:
        self - project manifest
     """
-    # list of inferences in project
-    inference_results = os.listdir(self.manifest.inference_params.save_results)
-    inference_results = [os.path.join(
-      self.manifest.inference_params.save_results, s) for s in inference_results]
+    # summaries of the results added since the last call
+    inference_results, offset = read_results_index(
+      self.manifest.inference_params.save_results,
+      self.manifest.get('results_index_offset', 0))
     # add results
-    for inf_file in inference_results:
-      inf = import_file_path(inf_file)
+    for inf in inference_results:
+      inf_file = inf['file']
 
       dataset = inf['dataset']
       if dataset not in self.manifest.inference.keys():
@@ -209,6 +242,7 @@ class Reader(CommonReader):
         print("Added results for model {} - {}.".format(model_id, dataset))
       else:
         print("Results for model '{}' already exists - to replace delete prior results).".format(model_id))
+    self.manifest.results_index_offset = offset
     self.save_manifest()
 
   def get_inf_path(self, dataset, model_id):
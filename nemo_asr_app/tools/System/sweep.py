@@ -0,0 +1,285 @@
+# Copyright (c) 2019, NVIDIA CORPORATION. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import copy
+import time
+import signal
+import socket
+import itertools
+import subprocess
+from easydict import EasyDict as edict
+
+from tools.filetools import mkdir_p
+
+"""Local scheduler of experiment sweeps: every point of a parameter grid is
+trained with the command of Reader.get_am_train_cmd and evaluated with the
+command of Reader.get_inference_cmd. Jobs are packed on the free GPUs (or
+CPU slots for evaluation only sweeps), failed jobs are retried and the
+results are added to the manifest.
+"""
+
+
+def sweep_grid(**values):
+  """Points of a parameter grid
+    sweep_grid(lr=[0.01, 0.001], batch_size=[16, 32]) -> 4 dicts
+  """
+  keys = sorted(values)
+  return [dict(zip(keys, point)) for point in itertools.product(*[values[k] for k in keys])]
+
+
+def visible_gpus():
+  """Ids of the GPUs jobs can use (CUDA_VISIBLE_DEVICES or nvidia-smi)"""
+  if 'CUDA_VISIBLE_DEVICES' in os.environ:
+    return [d for d in os.environ['CUDA_VISIBLE_DEVICES'].split(',') if d.strip()]
+  try:
+    out = subprocess.run(['nvidia-smi', '-L'], stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+  except OSError:
+    return []
+  return [str(i) for i, line in enumerate(out.splitlines()) if line.startswith('GPU')]
+
+
+def free_port():
+  """A TCP port free on this host"""
+  with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    s.bind(('', 0))
+    return s.getsockname()[1]
+
+
+class SweepJob(object):
+  """A shell command of a trial needing num_slots devices"""
+
+  def __init__(self, trial, stage, cmd, num_slots):
+    self.trial = trial
+    self.stage = stage
+    self.cmd = cmd
+    self.num_slots = num_slots
+    self.attempts = 0
+    self.slots = None
+    self.proc = None
+    self.log = None
+
+
+class SweepScheduler(object):
+  """Runs a grid of trials of a Reader project
+  Arguments:
+    reader: tools.System.reader.Reader of the project (datasets, configs and
+            the base parameters of every trial)
+    grid: list of parameter dicts (see sweep_grid), keys of
+          am.train_params or of inference_params
+    name: sweep name, trial work dirs are <work_dir>/<name>-<i>
+    train: train every trial, else only evaluate (e.g. a grid of load_dir)
+    evaluate: evaluate every trial on the eval datasets of the project
+    devices: GPU ids to use (default all visible GPUs)
+    cpu_slots: concurrent jobs without GPUs (evaluation only, on CPU)
+    max_concurrent: max running jobs
+    max_retries: restarts of a failed job
+    poll_secs: job polling interval
+  """
+
+  def __init__(self, reader, grid, name='sweep', train=True, evaluate=True,
+               devices=None, cpu_slots=None, max_concurrent=None,
+               max_retries=1, poll_secs=5):
+    self.reader = reader
+    self.grid = grid
+    self.name = name
+    self.train = train
+    self.evaluate = evaluate
+    self.max_retries = max_retries
+    self.poll_secs = poll_secs
+    self.slots = list(devices) if devices is not None else visible_gpus()
+    self.cpu = not self.slots
+    if self.cpu:
+      if train:
+        raise ValueError('Training needs GPUs, no GPU found')
+      self.slots = ['cpu{}'.format(i) for i in range(cpu_slots or os.cpu_count())]
+    self.max_concurrent = max_concurrent or len(self.slots)
+
+    base = reader.manifest.am.train_params.work_dir
+    self.log_dir = os.path.join(base, name + '-logs')
+    self.trials = []
+    for i, params in enumerate(grid):
+      for key in params:
+        if key not in reader.manifest.am.train_params and \
+           key not in reader.manifest.inference_params:
+          raise ValueError('Unknown parameter {}'.format(key))
+      trial = '{}-{}'.format(name, i)
+      self.trials.append(edict(name=trial, params=params, status='pending',
+                               work_dir=os.path.join(base, trial)))
+
+  def _trial_cmds(self, trial):
+    """Train and inference commands of a trial, the project manifest is left
+    unchanged"""
+    manifest = self.reader.manifest
+    saved = copy.deepcopy(manifest)
+    cmds = {}
+    with self.reader.batch():
+      try:
+        for key, value in trial.params.items():
+          if key in manifest.am.train_params:
+            manifest.am.train_params[key] = value
+          if key in manifest.inference_params:
+            manifest.inference_params[key] = value
+        manifest.am.train_params.work_dir = trial.work_dir
+        manifest.am.train_params.exp_name = trial.name
+        if self.train:
+          cmds['train'] = self.reader.get_am_train_cmd()
+          manifest.inference_params.load_dir = os.path.join(trial.work_dir, 'checkpoints')
+        if self.evaluate:
+          if self.cpu:
+            # one worker per CPU slot, its beam search and WER pools only use
+            # the CPUs of the slot
+            manifest.inference_params.device = 'cpu'
+            manifest.inference_params.num_workers = 1
+            manifest.inference_params.num_cpus = self._cpus_per_slot()
+          cmds['eval'] = self.reader.get_inference_cmd(trial.name)
+      finally:
+        self.reader.manifest = saved
+    return cmds
+
+  def _cpus_per_slot(self):
+    return max(os.cpu_count() // len(self.slots), 1)
+
+  def _num_slots(self, stage):
+    if self.cpu:
+      return 1
+    params = self.reader.manifest.am.train_params if stage == 'train' \
+      else self.reader.manifest.inference_params
+    return params.get('num_gpus', 1) or 1
+
+  def _start(self, job, free):
+    job.slots = free[:job.num_slots]
+    del free[:job.num_slots]
+    job.attempts += 1
+    env = dict(os.environ)
+    if self.cpu:
+      env['CUDA_VISIBLE_DEVICES'] = ''
+      env['OMP_NUM_THREADS'] = str(self._cpus_per_slot())
+    else:
+      env['CUDA_VISIBLE_DEVICES'] = ','.join(job.slots)
+    # concurrent distributed jobs need their own rendezvous port,
+    # torch.distributed.launch ignores MASTER_PORT and defaults to 29500
+    port = free_port()
+    env['MASTER_PORT'] = str(port)
+    cmd = job.cmd.replace('torch.distributed.launch',
+                          'torch.distributed.launch --master_port={}'.format(port), 1)
+    log_file = os.path.join(self.log_dir, '{}.{}.{}.log'.format(job.trial.name, job.stage, job.attempts))
+    job.log = open(log_file, 'w')
+    # own process group, the shell and its children are stopped together
+    job.proc = subprocess.Popen(cmd, shell=True, env=env, stdout=job.log,
+                                stderr=subprocess.STDOUT, start_new_session=True)
+    job.trial.status = job.stage
+    print('{} {} started on {} (attempt {}), log {}'.format(
+      job.trial.name, job.stage, ','.join(job.slots), job.attempts, log_file))
+
+  def _stop(self, job, timeout=30):
+    """Terminates the process group of a running job"""
+    try:
+      os.killpg(job.proc.pid, signal.SIGTERM)
+      job.proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+      os.killpg(job.proc.pid, signal.SIGKILL)
+      job.proc.wait()
+    except ProcessLookupError:
+      job.proc.wait()
+    job.log.close()
+    job.trial.status = 'stopped'
+    print('{} {} stopped'.format(job.trial.name, job.stage))
+
+  def run(self):
+    """Runs every trial, returns the trials (name, params, status and the
+    WER of the evaluated ones)"""
+    mkdir_p(self.log_dir)
+    pending = []
+    for trial in self.trials:
+      cmds = self._trial_cmds(trial)
+      trial.cmds = cmds
+      stages = [s for s in ('train', 'eval') if cmds.get(s)]
+      if not stages:
+        trial.status = 'skipped'
+        continue
+      trial.stages = stages
+      pending.append(SweepJob(trial, stages[0], cmds[stages[0]], self._num_slots(stages[0])))
+    for job in pending:
+      if job.num_slots > len(self.slots):
+        raise ValueError('{} needs {} devices, {} available'.format(
+          job.trial.name, job.num_slots, len(self.slots)))
+
+    free = list(self.slots)
+    running = []
+    try:
+      while pending or running:
+        # first fit: smaller jobs fill the devices a larger job cannot use yet
+        for job in list(pending):
+          if len(running) >= self.max_concurrent:
+            break
+          if job.num_slots <= len(free):
+            pending.remove(job)
+            self._start(job, free)
+            running.append(job)
+
+        time.sleep(self.poll_secs)
+        for job in list(running):
+          returncode = job.proc.poll()
+          if returncode is None:
+            continue
+          running.remove(job)
+          job.log.close()
+          free.extend(job.slots)
+          trial = job.trial
+          if returncode != 0:
+            if job.attempts <= self.max_retries:
+              print('{} {} failed ({}), retrying'.format(trial.name, job.stage, returncode))
+              pending.insert(0, job)
+            else:
+              print('{} {} failed ({})'.format(trial.name, job.stage, returncode))
+              trial.status = 'failed'
+            continue
+          next_stage = trial.stages.index(job.stage) + 1
+          if next_stage < len(trial.stages):
+            stage = trial.stages[next_stage]
+            # finish started trials first
+            pending.insert(0, SweepJob(trial, stage, trial.cmds[stage], self._num_slots(stage)))
+          else:
+            trial.status = 'done'
+            print('{} done'.format(trial.name))
+    finally:
+      # interrupted or failed scheduler: no job is left running
+      for job in running:
+        self._stop(job)
+
+    self._collect()
+    return self.trials
+
+  def _collect(self):
+    """Adds the inference results and the trials to the manifest"""
+    with self.reader.batch():
+      if self.evaluate:
+        self.reader.add_inference_results()
+      if 'sweeps' not in self.reader.manifest:
+        self.reader.manifest.sweeps = edict()
+      self.reader.manifest.sweeps[self.name] = [
+        {'name': t.name, 'params': t.params, 'status': t.status, 'work_dir': t.work_dir}
+        for t in self.trials]
+      self.reader.save_manifest()
+    for trial in self.trials:
+      trial.wer = {dataset: results[trial.name].get('lm_wer') or results[trial.name].wer
+                   for dataset, results in self.reader.manifest.inference.items()
+                   if trial.name in results}
+
+
+def run_sweep(reader, grid, **kwargs):
+  """Runs a sweep of reader (see SweepScheduler), returns its trials"""
+  return SweepScheduler(reader, grid, **kwargs).run()
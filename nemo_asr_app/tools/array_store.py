@@ -0,0 +1,136 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from tools.filetools import mkdir_p
+
+"""Content-addressed on-disk store of variable length 2D arrays (one per
+utterance), e.g. log-probs or features. The arrays are concatenated along
+the first axis in one .npy file read with a memory map, an offsets index
+gives each array back as a zero-copy view.
+"""
+
+STORE_VERSION = 1
+DATA_FILE = 'data.npy'
+INDEX_FILE = 'index.npy'
+META_FILE = 'meta.json'
+
+
+def content_key(files=(), objects=()):
+  """sha1 of the content of files and of json serializable objects
+  Arguments:
+    files: paths whose bytes are hashed (checkpoints, manifests)
+    objects: json serializable objects (configs, parameters)
+  """
+  sha = hashlib.sha1()
+  sha.update(str(STORE_VERSION).encode())
+  for path in files:
+    with open(path, 'rb') as f:
+      for block in iter(lambda: f.read(1 << 20), b''):
+        sha.update(block)
+  for obj in objects:
+    sha.update(json.dumps(obj, sort_keys=True).encode())
+  return sha.hexdigest()
+
+
+class ArrayStore(object):
+  """Read only view of a store written by ArrayStore.write
+  Arguments:
+    path: store directory
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.data = np.load(os.path.join(path, DATA_FILE), mmap_mode='r')
+    self.index = np.load(os.path.join(path, INDEX_FILE))
+    with open(os.path.join(path, META_FILE)) as f:
+      self.meta = json.load(f)
+
+  def __len__(self):
+    return len(self.index)
+
+  def __getitem__(self, i):
+    start, end = self.index[i]
+    return self.data[start:end]
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  @staticmethod
+  def write(path, arrays, dtype=np.float32, meta=None):
+    """Write a store, readers see it complete or not at all (a crash leaves
+    no partial store behind). An existing store is replaced, if a concurrent
+    writer moves its store in first that one is kept.
+    Arguments:
+      path: store directory
+      arrays: sequence of 2D arrays with the same number of columns
+      dtype: on-disk dtype (float16 halves the size)
+      meta: json serializable dict stored alongside
+    """
+    lengths = np.array([a.shape[0] for a in arrays], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    index = np.stack([ends - lengths, ends], axis=1)
+    num_cols = arrays[0].shape[1] if len(arrays) else 0
+
+    tmp_path = path + '.tmp{}'.format(os.getpid())
+    mkdir_p(tmp_path)
+    data = np.lib.format.open_memmap(os.path.join(tmp_path, DATA_FILE), mode='w+',
+                                     dtype=dtype, shape=(int(lengths.sum()), num_cols))
+    for (start, end), a in zip(index, arrays):
+      data[start:end] = a
+    data.flush()
+    del data
+    np.save(os.path.join(tmp_path, INDEX_FILE), index)
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+      json.dump(dict(meta or {}, version=STORE_VERSION), f)
+    # opened before the renames, the memory map survives them
+    store = ArrayStore(tmp_path)
+    store.path = path
+    # move the previous store aside, the directory rename cannot replace it
+    old_path = path + '.old{}'.format(os.getpid())
+    try:
+      os.rename(path, old_path)
+    except FileNotFoundError:
+      pass
+    try:
+      os.rename(tmp_path, path)
+    except OSError:
+      if not os.path.exists(os.path.join(path, META_FILE)):
+        raise
+      # written by a concurrent writer meanwhile
+      shutil.rmtree(tmp_path)
+    if os.path.exists(old_path):
+      shutil.rmtree(old_path)
+    return store
+
+
+class ArrayCache(object):
+  """Directory of ArrayStores addressed by content_key
+  Arguments:
+    cache_dir: cache directory
+  """
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+
+  def path(self, key):
+    return os.path.join(self.cache_dir, key)
+
+  def get(self, key):
+    """ArrayStore of key or None if it was never written"""
+    path = self.path(key)
+    if not os.path.exists(os.path.join(path, META_FILE)):
+      return None
+    try:
+      return ArrayStore(path)
+    except FileNotFoundError:
+      # being replaced by a writer
+      return None
+
+  def put(self, key, arrays, dtype=np.float32, meta=None):
+    """Write the arrays of key, returns the ArrayStore"""
+    mkdir_p(self.cache_dir)
+    return ArrayStore.write(self.path(key), arrays, dtype=dtype, meta=meta)
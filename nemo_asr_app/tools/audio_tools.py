@@ -0,0 +1,157 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import os
+import subprocess
+
+"""Audio conversion tools used to build NeMo datasets
+"""
+
+SAMPLE_RATE = 16000
+
+
+class SoxConverter(object):
+  """Convert audio with sox/soxi shell calls (one process per call)
+  Arguments:
+    sample_rate: output sample rate
+    volume: optional volume factor passed to sox -v
+  """
+  name = 'sox'
+
+  def __init__(self, sample_rate=SAMPLE_RATE, volume=None):
+    self.sample_rate = sample_rate
+    self.volume = volume
+
+  def convert(self, src, dst):
+    """Convert src to a mono wav file at dst if it does not exist yet
+
+    Returns:
+      float: duration of dst in seconds
+    """
+    if not os.path.exists(dst):
+      volume = "-v {} ".format(self.volume) if self.volume else ""
+      subprocess.check_output("sox {0}{1} -c 1 -r {2} {3}".format(
+        volume, src, self.sample_rate, dst), shell=True)
+    return self.duration(dst)
+
+  def duration(self, path):
+    """Duration of an audio file in seconds"""
+    return float(subprocess.check_output("soxi -D {0}".format(path), shell=True))
+
+
+class PythonConverter(object):
+  """Convert audio in-process: decode, resample to mono and write a 16 bit wav.
+  The duration is computed from the number of samples, no soxi call is needed.
+  Arguments:
+    sample_rate: output sample rate
+    volume: optional volume factor (same meaning as sox -v)
+  """
+  name = 'python'
+
+  def __init__(self, sample_rate=SAMPLE_RATE, volume=None):
+    # imported here so the sox backend works without these packages
+    import librosa
+    import soundfile
+    self._librosa = librosa
+    self._soundfile = soundfile
+    self.sample_rate = sample_rate
+    self.volume = volume
+
+  def convert(self, src, dst):
+    """Convert src to a mono wav file at dst if it does not exist yet
+
+    Returns:
+      float: duration of dst in seconds
+    """
+    if os.path.exists(dst):
+      return self.duration(dst)
+    signal, _ = self._librosa.load(src, sr=self.sample_rate, mono=True)
+    if self.volume:
+      signal = signal * self.volume
+    self._soundfile.write(dst, signal, self.sample_rate, subtype='PCM_16')
+    return len(signal) / float(self.sample_rate)
+
+  def duration(self, path):
+    """Duration of an audio file in seconds, read from its header"""
+    info = self._soundfile.info(path)
+    return info.frames / float(info.samplerate)
+
+
+CONVERTERS = {
+  SoxConverter.name: SoxConverter,
+  PythonConverter.name: PythonConverter,
+}
+
+
+def get_converter(backend='auto', sample_rate=SAMPLE_RATE, volume=None):
+  """Build an audio converter
+  Arguments:
+    backend: 'python', 'sox' or 'auto' (python if its packages are
+             installed, otherwise sox)
+    sample_rate: output sample rate
+    volume: optional volume factor
+  """
+  if backend == 'auto':
+    try:
+      return PythonConverter(sample_rate=sample_rate, volume=volume)
+    except ImportError:
+      print("librosa/soundfile not available - falling back to sox")
+      backend = SoxConverter.name
+  if backend not in CONVERTERS:
+    raise ValueError("Unknown audio backend '{}' - use one of {}".format(
+      backend, ', '.join(['auto'] + sorted(CONVERTERS))))
+  return CONVERTERS[backend](sample_rate=sample_rate, volume=volume)
+
+
+# one converter per (worker) process, built on first use
+_converters = {}
+
+
+def convert_audio(src, dst, backend='auto', sample_rate=SAMPLE_RATE, volume=None):
+  """Convert src to a mono wav file at dst using a per-process converter.
+  Safe to call from multiprocessing workers.
+
+  Returns:
+    float: duration of dst in seconds
+  """
+  key = (backend, sample_rate, volume)
+  if key not in _converters:
+    _converters[key] = get_converter(backend, sample_rate=sample_rate, volume=volume)
+  return _converters[key].convert(src, dst)
+
+
+def load_audio(path):
+  """Read an audio file as float32 samples
+
+  Returns:
+    (signal, sample_rate)
+  """
+  import soundfile
+  return soundfile.read(path, dtype='float32')
+
+
+def write_audio(path, signal, sample_rate):
+  """Write float samples to a 16 bit wav file"""
+  import soundfile
+  soundfile.write(path, signal, sample_rate, subtype='PCM_16')
+
+
+def audio_duration(path):
+  """Duration of an audio file in seconds, read from its header"""
+  import soundfile
+  info = soundfile.info(path)
+  return info.frames / float(info.samplerate)
+
+
+def speed_perturb(signal, speed, max_denominator=100):
+  """Change speed (tempo and pitch) of a signal like sox's speed effect, by
+  resampling: the output has len(signal) / speed samples at the same rate.
+  Arguments:
+    signal: 1d array of samples
+    speed: speed factor, e.g. 0.9 or 1.1
+    max_denominator: precision of the rational resampling factor
+  """
+  if speed == 1.0:
+    return signal
+  from fractions import Fraction
+  from scipy.signal import resample_poly
+  ratio = Fraction(speed).limit_denominator(max_denominator)
+  return resample_poly(signal, ratio.denominator, ratio.numerator).astype(signal.dtype)
@@ -0,0 +1,53 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_audio_convert.py --clips=/data/asr/MCV_ES/cv-corpus-5.1-2020-06-22/es/clips --num_clips=2000
+import os
+import time
+import argparse
+import tempfile
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from tools.audio_tools import convert_audio
+from tools.filetools import rm_rf
+
+"""Compare clips/sec of the audio conversion backends used by the dataset builders
+"""
+
+def convert_clip(mp3_file, out_dir, backend):
+  wav_file = os.path.join(out_dir, os.path.basename(mp3_file).replace(".mp3", ".wav"))
+  return convert_audio(mp3_file, wav_file, backend=backend)
+
+def run_backend(clips, backend, num_workers):
+  out_dir = tempfile.mkdtemp(prefix='bench_' + backend + '_')
+  try:
+    start = time.time()
+    with Pool(num_workers) as p:
+      durations = p.map(partial(convert_clip, out_dir=out_dir, backend=backend),
+                        clips, chunksize=16)
+    elapsed = time.time() - start
+  finally:
+    rm_rf(out_dir)
+  return elapsed, sum(durations)
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark audio conversion backends')
+  parser.add_argument('--clips', type=str, required=True,
+                      help='Directory with mp3 clips')
+  parser.add_argument('--num_clips', type=int, default=1000,
+                      help='Number of clips to convert per backend')
+  parser.add_argument('--num_workers', type=int, default=cpu_count(),
+                      help='Number of worker processes')
+  parser.add_argument('--backends', type=str, default='python,sox',
+                      help='Comma separated list of backends to compare')
+  args = parser.parse_args()
+
+  clips = sorted(f for f in os.listdir(args.clips) if f.endswith('.mp3'))
+  clips = [os.path.join(args.clips, f) for f in clips[:args.num_clips]]
+  print('Converting {} clips with {} workers'.format(len(clips), args.num_workers))
+
+  for backend in args.backends.split(','):
+    elapsed, total_duration = run_backend(clips, backend, args.num_workers)
+    print('{:>8}: {:.1f} clips/sec ({:.1f} secs, {:.2f} hrs of audio)'.format(
+      backend, len(clips) / elapsed, elapsed, total_duration / 3600))
+
+if __name__ == "__main__":
+  main()
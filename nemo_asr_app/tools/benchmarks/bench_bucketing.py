@@ -0,0 +1,85 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_bucketing.py --dataset=dev.json --model_config=tools/NeMo/example_configs/quartznet15x5-es.yaml --load_dir=checkpoints
+import copy
+import json
+import time
+import argparse
+import numpy as np
+from ruamel.yaml import YAML
+import nemo
+import nemo.collections.asr as nemo_asr
+from tools.NeMo.bucketing import BucketSampler, BucketingDataLayer, padding_fraction
+
+"""Padding fraction of plain and duration bucketed batches of a manifest,
+and acoustic model throughput over both with --load_dir
+"""
+
+def read_durations(dataset):
+  with open(dataset) as f:
+    return [json.loads(line)['duration'] for line in f if line.strip()]
+
+def report_padding(durations, batch_size):
+  n = len(durations)
+  plain = [np.arange(i, min(i + batch_size, n)) for i in range(0, n, batch_size)]
+  shuffled = np.random.RandomState(0).permutation(n)
+  shuffled = [shuffled[i:i + batch_size] for i in range(0, n, batch_size)]
+  print('padding fraction (batch size {}):'.format(batch_size))
+  print('  plain batches:           {:.1%}'.format(padding_fraction(durations, plain)))
+  print('  shuffled plain batches:  {:.1%}'.format(padding_fraction(durations, shuffled)))
+  print('  sorted batches (eval):   {:.1%}'.format(
+    padding_fraction(durations, BucketSampler(durations, batch_size).batches())))
+  print('  shuffled buckets (train):{:.1%}'.format(
+    padding_fraction(durations, BucketSampler(durations, batch_size, shuffle=True).batches())))
+
+def time_inference(args, params, bucket):
+  vocab = params['labels']
+  dl_params = copy.deepcopy(params["AudioToTextDataLayer"])
+  dl_params.update(params["AudioToTextDataLayer"]["eval"])
+  del dl_params["train"]
+  del dl_params["eval"]
+  data_layer = nemo_asr.AudioToTextDataLayer(
+    manifest_filepath=args.dataset, sample_rate=params['sample_rate'],
+    labels=vocab, batch_size=args.batch_size, **dl_params)
+  if bucket:
+    data_layer = BucketingDataLayer(data_layer, shuffle=False)
+  preprocessor = nemo_asr.AudioToMelSpectrogramPreprocessor(
+    sample_rate=params['sample_rate'], **params["AudioToMelSpectrogramPreprocessor"])
+  encoder = nemo_asr.JasperEncoder(
+    feat_in=params["AudioToMelSpectrogramPreprocessor"]["features"], **params["JasperEncoder"])
+  decoder = nemo_asr.JasperDecoderForCTC(
+    feat_in=params["JasperEncoder"]["jasper"][-1]["filters"], num_classes=len(vocab))
+
+  audio, audio_len, _, _ = data_layer()
+  processed, processed_len = preprocessor(input_signal=audio, length=audio_len)
+  encoded, _ = encoder(audio_signal=processed, length=processed_len)
+  log_probs = decoder(encoder_output=encoded)
+
+  start = time.time()
+  args.neural_factory.infer(tensors=[log_probs], checkpoint_dir=args.load_dir, cache=False)
+  return len(data_layer) / (time.time() - start)
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark duration bucketing')
+  parser.add_argument('--dataset', type=str, required=True)
+  parser.add_argument('--batch_size', type=int, default=64)
+  parser.add_argument('--model_config', type=str, default=None)
+  parser.add_argument('--load_dir', type=str, default=None,
+                      help='checkpoints, measures inference throughput')
+  args = parser.parse_args()
+
+  report_padding(read_durations(args.dataset), args.batch_size)
+  if args.load_dir is None:
+    return
+
+  args.neural_factory = nemo.core.NeuralModuleFactory(
+    backend=nemo.core.Backend.PyTorch, placement=nemo.core.DeviceType.GPU)
+  yaml = YAML(typ="safe")
+  with open(args.model_config) as f:
+    params = yaml.load(f)
+  plain = time_inference(args, params, bucket=False)
+  bucketed = time_inference(args, params, bucket=True)
+  print('plain batches:    {:.1f} utterances/sec'.format(plain))
+  print('bucketed batches: {:.1f} utterances/sec ({:.2f}x)'.format(bucketed, bucketed / plain))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,58 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_inference_latency.py --model_config=tools/NeMo/example_configs/quartznet15x5-es.yaml --encoder=JasperEncoder-STEP-100.pt --decoder=JasperDecoderForCTC-STEP-100.pt --audio_file=sample.wav
+import time
+import argparse
+import numpy as np
+import scipy.io.wavfile as wave
+from tools.NeMo.demo_inference import InferenceSession, offline_inference
+
+"""Latency of offline_inference (model built per call) against a warm
+InferenceSession: first call and steady state
+"""
+
+def percentiles(latencies):
+  return 'mean {:.1f} ms, p50 {:.1f} ms, p99 {:.1f} ms'.format(
+    1000 * np.mean(latencies), 1000 * np.percentile(latencies, 50),
+    1000 * np.percentile(latencies, 99))
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark inference latency')
+  parser.add_argument('--model_config', type=str, required=True)
+  parser.add_argument('--encoder', type=str, required=True)
+  parser.add_argument('--decoder', type=str, required=True)
+  parser.add_argument('--audio_file', type=str, required=True)
+  parser.add_argument('--lm_path', type=str, default=None)
+  parser.add_argument('--device', type=str, default='gpu', choices=['gpu', 'cpu'])
+  parser.add_argument('--num_calls', type=int, default=50)
+  parser.add_argument('--num_cold_calls', type=int, default=3,
+                      help='offline_inference calls (rebuilds the model each time)')
+  args = parser.parse_args()
+
+  _, signal = wave.read(args.audio_file)
+
+  cold = []
+  for _ in range(args.num_cold_calls):
+    start = time.time()
+    offline_inference(args.model_config, args.encoder, args.decoder,
+                      args.audio_file, lm_path=args.lm_path, device=args.device)
+    cold.append(time.time() - start)
+  print('offline_inference: {}'.format(percentiles(cold)))
+
+  start = time.time()
+  session = InferenceSession(args.model_config, args.encoder, args.decoder,
+                             lm_path=args.lm_path, device=args.device)
+  load = time.time() - start
+  start = time.time()
+  session.transcribe(signal)
+  first = time.time() - start
+  print('InferenceSession load {:.1f} ms, first call {:.1f} ms'.format(1000 * load, 1000 * first))
+
+  steady = []
+  for _ in range(args.num_calls):
+    start = time.time()
+    session.transcribe(signal)
+    steady.append(time.time() - start)
+  print('InferenceSession steady state: {}'.format(percentiles(steady)))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,86 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_inference_server.py --audio_file=sample.wav --model_config=model.yaml --encoder=JasperEncoder.pt --decoder=JasperDecoderForCTC.pt --device=cpu
+# python tools/benchmarks/bench_inference_server.py --audio_file=sample.wav --url=http://localhost:8000
+import json
+import time
+import argparse
+import threading
+import urllib.request
+import numpy as np
+
+"""Loopback load generator for tools/NeMo/inference_server.py: concurrent
+clients post the same wav, reports latency percentiles, throughput and the
+server batching metrics
+"""
+
+def post(url, data):
+  req = urllib.request.Request(url + '/transcribe', data=data,
+                               headers={'Content-Type': 'audio/wav'})
+  with urllib.request.urlopen(req) as resp:
+    return json.loads(resp.read().decode('utf-8'))
+
+def run_clients(url, data, concurrency, num_requests):
+  latencies = []
+  lock = threading.Lock()
+  counter = iter(range(num_requests))
+
+  def client():
+    while True:
+      with lock:
+        if next(counter, None) is None:
+          return
+      start = time.time()
+      post(url, data)
+      with lock:
+        latencies.append(time.time() - start)
+
+  threads = [threading.Thread(target=client) for _ in range(concurrency)]
+  start = time.time()
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  return latencies, time.time() - start
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the transcription server')
+  parser.add_argument('--audio_file', type=str, required=True)
+  parser.add_argument('--url', type=str, default=None,
+                      help='running server, otherwise one is started in process')
+  parser.add_argument('--model_config', type=str)
+  parser.add_argument('--encoder', type=str)
+  parser.add_argument('--decoder', type=str)
+  parser.add_argument('--device', type=str, default='cpu', choices=['gpu', 'cpu'])
+  parser.add_argument('--max_batch_size', type=int, default=16)
+  parser.add_argument('--max_wait_ms', type=float, default=10)
+  parser.add_argument('--concurrency', type=str, default='1,4,16',
+                      help='Comma separated numbers of concurrent clients')
+  parser.add_argument('--num_requests', type=int, default=200)
+  args = parser.parse_args()
+
+  url = args.url
+  if url is None:
+    from tools.NeMo.demo_inference import InferenceSession
+    from tools.NeMo.inference_server import make_server
+    session = InferenceSession(args.model_config, args.encoder, args.decoder,
+                               device=args.device)
+    server = make_server(session.transcribe_batch, sample_rate=session.sample_rate, port=0,
+                         max_batch_size=args.max_batch_size,
+                         max_wait_ms=args.max_wait_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://localhost:{}'.format(server.server_address[1])
+
+  with open(args.audio_file, 'rb') as f:
+    data = f.read()
+  post(url, data)  # warm up
+
+  for concurrency in [int(c) for c in args.concurrency.split(',')]:
+    latencies, elapsed = run_clients(url, data, concurrency, args.num_requests)
+    print('{:>3} clients: p50 {:.1f} ms, p99 {:.1f} ms, {:.1f} requests/sec'.format(
+      concurrency, 1000 * np.percentile(latencies, 50),
+      1000 * np.percentile(latencies, 99), len(latencies) / elapsed))
+  with urllib.request.urlopen(url + '/metrics') as resp:
+    print('server metrics: {}'.format(resp.read().decode('utf-8')))
+
+if __name__ == "__main__":
+  main()
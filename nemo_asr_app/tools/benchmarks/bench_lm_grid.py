@@ -0,0 +1,60 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_lm_grid.py --logprob=dev_logprob.pkl --model_config=tools/NeMo/example_configs/quartznet15x5-es.yaml --lm_path=6-gram.binary
+import os
+import time
+import pickle
+import argparse
+from ruamel.yaml import YAML
+from tools.NeMo.beam_search import LMGridSearch, grid_points, logprobs_to_probs
+
+"""LM (alpha, beta) grid search over cached log-probs (jasper_eval.py
+--save_logprob): one Scorer per grid point (previous jasper_eval) against the
+shared Scorer and process pool of LMGridSearch
+"""
+
+def reload_per_point(probs, vocab, lm_path, points, beam_width):
+  from ctc_decoders import Scorer, ctc_beam_search_decoder_batch
+  for alpha, beta in points:
+    scorer = Scorer(alpha, beta, model_path=lm_path, vocabulary=vocab)
+    ctc_beam_search_decoder_batch(probs, vocab, beam_size=beam_width,
+                                  num_processes=os.cpu_count(),
+                                  ext_scoring_func=scorer,
+                                  cutoff_prob=1.0, cutoff_top_n=40)
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark LM grid search')
+  parser.add_argument('--logprob', type=str, required=True,
+                      help='log-probs pickle of jasper_eval.py --save_logprob')
+  parser.add_argument('--model_config', type=str, required=True,
+                      help='model configuration file: model.yaml')
+  parser.add_argument('--lm_path', type=str, required=True)
+  parser.add_argument('--grid', type=int, default=10,
+                      help='grid of grid x grid (alpha, beta) pairs')
+  parser.add_argument('--beam_width', type=int, default=128)
+  args = parser.parse_args()
+
+  yaml = YAML(typ="safe")
+  with open(args.model_config) as f:
+    vocab = yaml.load(f)['labels']
+  with open(args.logprob, 'rb') as f:
+    probs = logprobs_to_probs(pickle.load(f))
+  step = 0.25
+  points = grid_points(1.0, 1.0 + step * (args.grid - 1), step,
+                       0.5, 0.5 + step * (args.grid - 1), step)
+  print('{} utterances, {} (alpha, beta) pairs'.format(len(probs), len(points)))
+
+  start = time.time()
+  reload_per_point(probs, vocab, args.lm_path, points[:1], args.beam_width)
+  one_point = time.time() - start
+  print('single point (LM load + beam pass): {:.2f} secs'.format(one_point))
+  print('reloading per point (estimated): {:.2f} secs'.format(one_point * len(points)))
+
+  start = time.time()
+  lm_search = LMGridSearch(vocab, args.lm_path, beam_width=args.beam_width)
+  for _ in lm_search.search(probs, points):
+    pass
+  grid = time.time() - start
+  print('LMGridSearch: {:.2f} secs ({:.2f} secs per point)'.format(grid, grid / len(points)))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,64 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_speed_perturb.py --model_config=tools/NeMo/example_configs/quartznet15x5-es.yaml --dataset=/data/asr/MCV_ES/cv-corpus-5.1-2020-06-22/es/dev.json
+import os
+import copy
+import time
+import argparse
+from ruamel.yaml import YAML
+import nemo
+import nemo.collections.asr as nemo_asr
+from tools.NeMo.perturb import build_augmentor
+
+"""Training data layer throughput (samples/sec) with on-the-fly speed
+perturbation on and off
+"""
+
+def run(args, params, augmentor):
+  dl_params = copy.deepcopy(params["AudioToTextDataLayer"])
+  dl_params.update(params["AudioToTextDataLayer"]["train"])
+  del dl_params["train"]
+  del dl_params["eval"]
+  data_layer = nemo_asr.AudioToTextDataLayer(
+    manifest_filepath=args.dataset,
+    sample_rate=params['sample_rate'],
+    labels=params['labels'],
+    batch_size=args.batch_size,
+    num_workers=args.num_workers,
+    augmentor=augmentor,
+    **dl_params)
+
+  num_samples = 0
+  start = time.time()
+  for i, batch in enumerate(data_layer.data_iterator):
+    if i == args.num_batches:
+      break
+    num_samples += batch[0].shape[0]
+  return num_samples / (time.time() - start)
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark on-the-fly speed perturbation')
+  parser.add_argument('--model_config', type=str, required=True,
+                      help='model configuration file: model.yaml')
+  parser.add_argument('--dataset', type=str, required=True,
+                      help='NeMo manifest (.json) to read')
+  parser.add_argument('--batch_size', type=int, default=32)
+  parser.add_argument('--num_batches', type=int, default=50)
+  parser.add_argument('--num_workers', type=int, default=os.cpu_count())
+  parser.add_argument('--speeds', type=str, default='0.9,1.0,1.1',
+                      help='Comma separated speed factors')
+  args = parser.parse_args()
+
+  nemo.core.NeuralModuleFactory(backend=nemo.core.Backend.PyTorch,
+                                placement=nemo.core.DeviceType.CPU)
+  yaml = YAML(typ="safe")
+  with open(args.model_config) as f:
+    params = yaml.load(f)
+
+  speeds = [float(s) for s in args.speeds.split(',')]
+  off = run(args, params, None)
+  on = run(args, params, build_augmentor({'prob': 1.0, 'speeds': speeds}))
+  print('speed perturbation off: {:.1f} samples/sec'.format(off))
+  print('speed perturbation on:  {:.1f} samples/sec ({:+.1f}%)'.format(on, 100 * (on / off - 1)))
+
+if __name__ == "__main__":
+  main()
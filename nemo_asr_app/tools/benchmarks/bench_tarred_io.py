@@ -0,0 +1,64 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_tarred_io.py --dataset=train.json --tarred_dir=/data/asr/train_tarred
+import io
+import json
+import glob
+import time
+import random
+import tarfile
+import argparse
+import soundfile as sf
+from tools.NeMo.create_datasets.create_tarred_dataset import TARRED_MANIFEST
+
+"""Read throughput (utterances/sec and audio hours/sec) of a dataset read one
+wav per utterance in shuffled order, as the training data layer does, and
+of the same dataset streamed from its tar shards. Drop the page cache
+between runs (echo 3 > /proc/sys/vm/drop_caches) to measure cold reads.
+"""
+
+def read_files(dataset, limit):
+  with open(dataset) as f:
+    entries = [json.loads(line) for line in f if line.strip()]
+  random.Random(0).shuffle(entries)
+  entries = entries[:limit]
+  duration = 0.
+  start = time.time()
+  for entry in entries:
+    signal, sr = sf.read(entry['audio_filepath'], dtype='float32')
+    duration += len(signal) / sr
+  return len(entries), duration, time.time() - start
+
+def read_shards(tarred_dir, limit):
+  shards = sorted(glob.glob(tarred_dir + '/audio_*.tar'))
+  random.Random(0).shuffle(shards)
+  count, duration = 0, 0.
+  start = time.time()
+  for shard in shards:
+    with tarfile.open(shard, mode='r|') as tar:
+      for member in tar:
+        signal, sr = sf.read(io.BytesIO(tar.extractfile(member).read()), dtype='float32')
+        duration += len(signal) / sr
+        count += 1
+        if count >= limit:
+          return count, duration, time.time() - start
+  return count, duration, time.time() - start
+
+def report(name, count, duration, secs):
+  print('{:<14} {:>8} utts {:>9.1f} utts/sec {:>8.3f} audio hours/sec'.format(
+    name, count, count / secs, duration / 3600 / secs))
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark per file and tar shard reads')
+  parser.add_argument('--dataset', type=str, required=True, help='NeMo manifest (.json)')
+  parser.add_argument('--tarred_dir', type=str, required=True,
+                      help='Output of create_tarred_dataset.py for the dataset')
+  parser.add_argument('--limit', type=int, default=10000, help='Utterances read per run')
+  args = parser.parse_args()
+
+  with open('{}/{}'.format(args.tarred_dir, TARRED_MANIFEST)) as f:
+    print('{} packed utterances'.format(sum(1 for line in f if line.strip())))
+  report('per file', *read_files(args.dataset, args.limit))
+  report('tar shards', *read_shards(args.tarred_dir, args.limit))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,72 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_text_normalize.py --num_sentences=1000000
+import time
+import random
+import argparse
+import unidecode
+import pandas as pd
+from tools.transcript_tools import TextNormalizer
+
+"""Compare the shared TextNormalizer with the per-character loops it replaced
+"""
+
+# vocabulary of the Spanish dataset builders
+VALID_CHARS = (" ", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "'", "á", "é", "í", "ó", "ú", "ñ", "ü")
+
+WORDS = ["el", "siguiente", "diagrama", "muestra", "localidades", "más", "próximas",
+         "Monterey", "¿Qué", "está", "pasando?", "¡Niño!", "Ça", "Zürich", "“Hola”",
+         "año", "über", "canción", "coração", "l'été", "Straße", "…", "-", "œuvre"]
+
+def legacy_normalize_str(txt) -> str:
+  """Per-character normalize_str of the dataset builders (reference)"""
+  new_txt = txt.lower().strip()
+  res_arr = []
+  for c in new_txt:
+    if c in VALID_CHARS:
+      res_arr.append(c)
+    else:
+      # remove accent and see if it is valid
+      non_accent_c = unidecode.unidecode(c)
+      if non_accent_c in VALID_CHARS:
+        res_arr.append(non_accent_c)
+      # a character we don't know
+      else:
+        res_arr.append(' ')
+  res = ''.join(res_arr).strip()
+  return ' '.join(res.split())
+
+def make_corpus(num_sentences, seed=0):
+  rng = random.Random(seed)
+  return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+          for _ in range(num_sentences)]
+
+def timed(name, fn, n):
+  start = time.time()
+  out = fn()
+  elapsed = time.time() - start
+  print('{:>28}: {:.2f} secs, {:.0f} sentences/sec'.format(name, elapsed, n / elapsed))
+  return out
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark transcript normalization')
+  parser.add_argument('--num_sentences', type=int, default=1000000,
+                      help='Number of sentences in the synthetic corpus')
+  args = parser.parse_args()
+
+  corpus = make_corpus(args.num_sentences)
+  series = pd.Series(corpus)
+  normalizer = TextNormalizer(VALID_CHARS)
+  n = len(corpus)
+  print('Normalizing {} sentences'.format(n))
+
+  reference = timed('per-character loop', lambda: [legacy_normalize_str(t) for t in corpus], n)
+  single = timed('TextNormalizer (str)', lambda: [normalizer(t) for t in corpus], n)
+  batch = timed('TextNormalizer (list)', lambda: normalizer(corpus), n)
+  frame = timed('TextNormalizer (Series)', lambda: normalizer(series), n)
+
+  assert single == reference and batch == reference and list(frame) == reference, \
+    "normalizer output differs from the reference"
+  print('Outputs are identical')
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,71 @@
+# Copyright (c) 2019 NVIDIA Corporation
+# python tools/benchmarks/bench_wer.py --num_utterances=20000 --grid_points=20
+import time
+import random
+import argparse
+from tools.wer_tools import WERScorer
+
+"""Time of the WER of a grid of hypotheses sets: per utterance Levenshtein
+on re-split strings (as nemo.collections.asr.helpers.word_error_rate) and
+WERScorer with references tokenized once, over a synthetic set.
+"""
+
+try:
+  # what NeMo uses
+  import editdistance
+except ImportError:
+  editdistance = None
+
+def levenshtein(a, b):
+  if editdistance is not None:
+    return editdistance.eval(a, b)
+  d = list(range(len(b) + 1))
+  for i in range(1, len(a) + 1):
+    prev, d[0] = d[:], i
+    for j in range(1, len(b) + 1):
+      d[j] = min(prev[j] + 1, d[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+  return d[-1]
+
+def plain_wer(hypotheses, references):
+  scores = sum(levenshtein(h.split(), r.split()) for h, r in zip(hypotheses, references))
+  return scores / sum(len(r.split()) for r in references)
+
+def synthetic_set(num_utterances, words_per_utterance, error_rate, seed=0):
+  rng = random.Random(seed)
+  vocab = ['w{}'.format(i) for i in range(5000)]
+  references, hypotheses = [], []
+  for _ in range(num_utterances):
+    ref = [rng.choice(vocab) for _ in range(rng.randint(1, 2 * words_per_utterance))]
+    hyp = [rng.choice(vocab) if rng.random() < error_rate else w for w in ref
+           if rng.random() > error_rate / 3]
+    references.append(' '.join(ref))
+    hypotheses.append(' '.join(hyp))
+  return references, hypotheses
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark WER computation')
+  parser.add_argument('--num_utterances', type=int, default=20000)
+  parser.add_argument('--grid_points', type=int, default=10)
+  parser.add_argument('--num_cpus', type=int, default=None)
+  args = parser.parse_args()
+
+  references, hypotheses = synthetic_set(args.num_utterances, 15, 0.15)
+  grid = [hypotheses] * args.grid_points
+  print('{} utterances, {} grid points'.format(len(references), len(grid)))
+
+  start = time.time()
+  plain = [plain_wer(h, references) for h in grid]
+  plain_secs = time.time() - start
+
+  start = time.time()
+  with WERScorer(references, num_cpus=args.num_cpus) as scorer:
+    scored = [scorer.wer(h) for h in grid]
+  scorer_secs = time.time() - start
+
+  assert all(abs(a - b) < 1e-9 for a, b in zip(plain, scored))
+  print('per utterance Levenshtein: {:.2f} s'.format(plain_secs))
+  print('WERScorer:                 {:.2f} s ({:.1f}x), WER {:.2%}'.format(
+    scorer_secs, plain_secs / scorer_secs, scored[0]))
+
+if __name__ == "__main__":
+  main()
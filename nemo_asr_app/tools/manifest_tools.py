@@ -0,0 +1,270 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import os
+import json
+import codecs
+import shutil
+import threading
+from multiprocessing import Pool
+
+"""Tools to stream NeMo json manifests
+"""
+
+class DurationStats(object):
+  """Running duration aggregates of a manifest (no per-entry storage)"""
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+
+  def add(self, duration):
+    """Add the duration (secs) of one manifest entry"""
+    self.count += 1
+    self.total += duration
+    if self.min is None or duration < self.min:
+      self.min = duration
+    if self.max is None or duration > self.max:
+      self.max = duration
+
+  def merge(self, other):
+    """Merge aggregates of another DurationStats into this one"""
+    if other.count == 0:
+      return self
+    self.count += other.count
+    self.total += other.total
+    self.min = other.min if self.min is None else min(self.min, other.min)
+    self.max = other.max if self.max is None else max(self.max, other.max)
+    return self
+
+  @property
+  def hours(self):
+    return self.total / 3600
+
+  def __str__(self):
+    return 'Total duration {} Hrs, min_duration {} secs, max_duration {} secs'.format(
+      self.hours, self.min, self.max)
+
+
+# default bound of the items in flight of imap_bounded
+MAX_PENDING = 4096
+
+
+def imap_bounded(pool, func, iterable, chunksize=1, max_pending=None, ordered=False):
+  """Pool.imap_unordered (or Pool.imap) that keeps at most max_pending items
+  in flight. Pool.imap_unordered alone drains the whole input iterable into
+  its task queue, this throttles the feeder so memory stays bounded.
+  Arguments:
+    pool: multiprocessing Pool
+    func: function applied to each item
+    iterable: (lazy) iterable of items
+    chunksize: items sent to a worker at once
+    max_pending: max items submitted but not yet returned
+                 (default 8 chunks per cpu, at most MAX_PENDING items)
+    ordered: return results in input order (Pool.imap)
+  """
+  if max_pending is None:
+    max_pending = min(8 * chunksize * os.cpu_count(), MAX_PENDING)
+  max_pending = max(max_pending, 2 * chunksize)
+  pending = threading.Semaphore(max_pending)
+  stopped = threading.Event()
+
+  def feed():
+    # runs in the task handler thread of the pool, it must not block
+    # forever once the consumer is gone
+    for item in iterable:
+      while not pending.acquire(timeout=0.1):
+        if stopped.is_set():
+          return
+      yield item
+
+  imap = pool.imap if ordered else pool.imap_unordered
+  try:
+    for result in imap(func, feed(), chunksize):
+      pending.release()
+      yield result
+  finally:
+    stopped.set()
+
+
+class ManifestWriter(object):
+  """Thread-safe writer of a json lines manifest that keeps DurationStats
+  Arguments:
+    path: output manifest file
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.stats = DurationStats()
+    self._lock = threading.Lock()
+    self._fout = codecs.open(path, 'w', encoding='utf-8')
+
+  def write(self, entry):
+    """Write one manifest entry (dict with a duration key)"""
+    line = json.dumps(entry, ensure_ascii=False) + '\n'
+    with self._lock:
+      self._fout.write(line)
+      self.stats.add(entry['duration'])
+
+  def close(self):
+    self._fout.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+class ConversionJournal(object):
+  """Append-only json lines log of finished clips, used to resume and to
+  incrementally update dataset builds. Each record is flushed as soon as
+  it is added, so a crash loses at most the clips still in flight. The
+  journal is compacted to one record per clip when it is opened.
+  Arguments:
+    path: journal file, created if it does not exist
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self._records = {}
+    self._lock = threading.Lock()
+    compact = False
+    if os.path.exists(path):
+      with codecs.open(path, 'r', encoding='utf-8') as fin:
+        for line in fin:
+          try:
+            record = json.loads(line)
+          except ValueError:
+            # torn last line of an interrupted run
+            compact = True
+            continue
+          # replaced records and a last line without newline are dropped
+          compact |= record['key'] in self._records or not line.endswith('\n')
+          self._records[record['key']] = record
+    if compact:
+      self._compact()
+    self._fout = codecs.open(path, 'a', encoding='utf-8')
+    print('Journal {} has {} finished clips'.format(path, len(self._records)))
+
+  def _compact(self):
+    """Rewrite the journal with the latest record of each key"""
+    tmp_path = '{}.tmp{}'.format(self.path, os.getpid())
+    with codecs.open(tmp_path, 'w', encoding='utf-8') as fout:
+      for record in self._records.values():
+        fout.write(json.dumps(record, ensure_ascii=False) + '\n')
+      fout.flush()
+      os.fsync(fout.fileno())
+    os.replace(tmp_path, self.path)
+
+  def __len__(self):
+    return len(self._records)
+
+  def get(self, key):
+    """Journal record for key or None"""
+    return self._records.get(key)
+
+  def add(self, key, record):
+    """Add (or replace) the record of key"""
+    record = dict(record, key=key)
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    with self._lock:
+      self._records[key] = record
+      self._fout.write(line)
+      self._fout.flush()
+
+  def close(self):
+    self._fout.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+def shard_ranges(path, num_shards):
+  """Split a file into at most num_shards byte ranges aligned to lines
+
+  Returns:
+    list of (start, end) byte offsets
+  """
+  size = os.path.getsize(path)
+  bounds = [0]
+  with open(path, 'rb') as f:
+    for i in range(1, num_shards):
+      pos = size * i // num_shards
+      if pos <= bounds[-1]:
+        continue
+      # move to the start of the next line
+      f.seek(pos - 1)
+      f.readline()
+      pos = f.tell()
+      if bounds[-1] < pos < size:
+        bounds.append(pos)
+  bounds.append(size)
+  return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def read_lines_range(path, start, end):
+  """Yield the (utf-8) lines of the byte range [start, end) of a file"""
+  with open(path, 'rb') as f:
+    f.seek(start)
+    pos = start
+    while pos < end:
+      line = f.readline()
+      if not line:
+        break
+      pos += len(line)
+      yield line.decode('utf-8')
+
+
+def _process_shard(job):
+  process_record, path_in, start, end, shard_out = job
+  stats = DurationStats()
+  with open(shard_out, 'w') as tgt_f:
+    for line in read_lines_range(path_in, start, end):
+      new_record = process_record(json.loads(line))
+      if new_record is not None:
+        stats.add(new_record['duration'])
+        tgt_f.write(json.dumps(new_record, ensure_ascii=False) + '\n')
+  return stats
+
+
+def process_manifests_parallel(process_record, manifest_pairs, num_workers,
+                               shards_per_worker=4):
+  """Apply process_record to every entry of several manifests with a process
+  pool. Each input manifest is split into byte-range shards, shard outputs
+  are concatenated in input order.
+  Arguments:
+    process_record: picklable function (record dict -> new record or None
+                    to drop the entry)
+    manifest_pairs: list of (input manifest, output manifest)
+    num_workers: number of worker processes
+    shards_per_worker: shards per worker and manifest (load balancing)
+
+  Returns:
+    list of DurationStats, one per manifest pair
+  """
+  jobs = []
+  for pair_id, (path_in, path_out) in enumerate(manifest_pairs):
+    ranges = shard_ranges(path_in, num_workers * shards_per_worker)
+    for shard_id, (start, end) in enumerate(ranges):
+      shard_out = '{}.shard{}'.format(path_out, shard_id)
+      jobs.append((pair_id, (process_record, path_in, start, end, shard_out)))
+
+  with Pool(num_workers) as p:
+    shard_stats = p.map(_process_shard, [job for _, job in jobs], chunksize=1)
+
+  all_stats = [DurationStats() for _ in manifest_pairs]
+  for pair_id, (_, path_out) in enumerate(manifest_pairs):
+    with open(path_out, 'wb') as fout:
+      for (job_pair_id, job), stats in zip(jobs, shard_stats):
+        if job_pair_id != pair_id:
+          continue
+        shard_out = job[-1]
+        with open(shard_out, 'rb') as fin:
+          shutil.copyfileobj(fin, fout)
+        os.remove(shard_out)
+        all_stats[pair_id].merge(stats)
+  return all_stats
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import pandas as pd
 import matplotlib
@@ -6,6 +7,7 @@ import json
 import difflib
 
 from tools.filetools import import_file_path
+from tools.results_store import read_utterance_results
 """Miscellaneous tools
 """
 
@@ -30,6 +32,11 @@ def show_diff(text, n_text):
       raise (RuntimeError, "unexpected opcode")
   return ''.join(output)
 
+def _utterance_column(path, inf, column):
+  """Column of the per utterance results of the results json path"""
+  utterances = os.path.join(os.path.dirname(path), inf['utterances'])
+  return read_utterance_results(utterances, columns=[column])[column].tolist()
+
 def get_transcript(path, lm=False):
   """Get transcript from inference results
     Arguments:
@@ -37,6 +44,9 @@ def get_transcript(path, lm=False):
       lm: True if want beam transcript
   """
   inf = import_file_path(path)
+  if 'utterances' in inf:
+    return ' '.join(_utterance_column(path, inf, 'beam' if lm else 'greedy'))
+  # results saved before per utterance results
   if lm:
     return inf['beam transcript']
   else:
@@ -48,8 +58,22 @@ def get_gtruth(path):
   path: path to inference results
   """
   inf = import_file_path(path)
+  if 'utterances' in inf:
+    return ' '.join(_utterance_column(path, inf, 'reference'))
   return inf['gtruth']
 
+def get_worst_utterances(path, n=20, lm=False):
+  """Utterances with the most errors of inference results (DataFrame of
+  audio path, reference, hypotheses and error counts)
+  Arguments:
+    path: path to inference results
+    n: number of utterances
+    lm: rank by the beam (LM) errors
+  """
+  inf = import_file_path(path)
+  utterances = os.path.join(os.path.dirname(path), inf['utterances'])
+  return read_utterance_results(utterances, worst=n, lm=lm)
+
 
 def show_values_on_bars(axs):
   """Show bar values on barplot"""
@@ -112,16 +136,9 @@ def create_lm_dataset(json_path, out_txt):
       json_path: Path to json dataset
       out_txt: Path to output lm dataset (txt)
     """
-    # read list of dicts
-    lines = []
-    for line in open(json_path, 'r'):
-        lines.append(json.loads(line))
-
-    # get text of each dict
-    texts= [l['text'] for l in lines]
-
-    # save output
-    with open(out_txt, 'w') as filehandle:
-        for listitem in texts:
-            filehandle.write('%s\n' % listitem)
+    # stream the text of each line of the manifest
+    with open(json_path, 'r') as f, open(out_txt, 'w') as filehandle:
+        for line in f:
+            if line.strip():
+                filehandle.write('%s\n' % json.loads(line)['text'])
     print("Created lm dataset {}".format(out_txt))
@@ -0,0 +1,93 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import os
+import json
+import fcntl
+
+"""Index of the inference results of a results directory: one json line per
+results file with its summary fields (dataset, model_id, wer, lm_wer),
+appended by jasper_eval.py when it saves results. Readers keep the offset
+they read up to, so registering results only reads the new lines.
+"""
+
+RESULTS_INDEX = 'results_index.jsonl'
+SUMMARY_KEYS = ['dataset', 'model_id', 'wer', 'lm_wer']
+
+
+def index_path(results_dir):
+  return os.path.join(results_dir, RESULTS_INDEX)
+
+
+def _entry(results_file, results):
+  entry = {k: results.get(k) for k in SUMMARY_KEYS}
+  entry['file'] = os.path.basename(results_file)
+  return json.dumps(entry) + '\n'
+
+
+def _scan(results_dir):
+  lines = []
+  for name in sorted(os.listdir(results_dir)):
+    if name.endswith('.json'):
+      with open(os.path.join(results_dir, name)) as f:
+        lines.append(_entry(name, json.load(f)))
+  return lines
+
+
+def _append(results_dir, lines):
+  with open(index_path(results_dir), 'a') as f:
+    # concurrent evaluations append whole lines
+    fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+      if os.fstat(f.fileno()).st_size == 0:
+        # new index: every results file of the directory, lines included
+        lines = _scan(results_dir)
+      f.write(''.join(lines))
+      f.flush()
+    finally:
+      fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def index_results(results_file, results):
+  """Add a results file to the index of its directory (the index of a
+  directory without one starts with all its results files)
+  Arguments:
+    results_file: path of the saved results json
+    results: the saved results
+  """
+  _append(os.path.dirname(results_file) or '.', [_entry(results_file, results)])
+
+
+def build_results_index(results_dir):
+  """Index the results files of a directory written before the index
+  existed (reads every results file once)"""
+  _append(results_dir, [])
+
+
+def read_results_index(results_dir, offset=0):
+  """Index entries added after offset
+  Arguments:
+    results_dir: results directory
+    offset: byte offset of the index read up to (0: all entries)
+
+  Returns:
+    entries (with file as a path in results_dir), new offset
+  """
+  path = index_path(results_dir)
+  if not os.path.exists(path):
+    if not os.path.isdir(results_dir):
+      return [], 0
+    build_results_index(results_dir)
+  if offset > os.path.getsize(path):
+    # index rebuilt since
+    offset = 0
+  entries = []
+  with open(path, 'rb') as f:
+    f.seek(offset)
+    for line in f:
+      if not line.endswith(b'\n'):
+        # line being written
+        break
+      offset += len(line)
+      entry = json.loads(line)
+      entry['file'] = os.path.join(results_dir, entry['file'])
+      entries.append(entry)
+  return entries, offset
@@ -0,0 +1,91 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+"""Per utterance inference results in a Parquet file next to the results
+json of jasper_eval.py: audio path, duration, reference, greedy and beam
+hypotheses and their error counts. Columns are read on their own and the
+file is written in row groups, so a transcript or the worst utterances are
+loaded without reading the whole file.
+"""
+
+ROW_GROUP_SIZE = 10000
+
+# columns of the error counts of each decoding
+ERROR_COLUMNS = ['sub', 'del', 'ins']
+
+
+def utterances_path(results_path):
+  """Parquet file of the results json results_path"""
+  return os.path.splitext(results_path)[0] + '.parquet'
+
+
+def write_utterance_results(path, audio_filepaths, durations, references,
+                            greedy, greedy_counts, beam=None, beam_counts=None):
+  """Write per utterance results (dataset order)
+  Arguments:
+    path: output .parquet
+    audio_filepaths, durations: manifest entries of the utterances
+    references: reference transcripts
+    greedy: greedy hypotheses
+    greedy_counts: tools.wer_tools counts (N x 4: REF_LEN, SUB, DEL, INS)
+    beam, beam_counts: hypotheses and counts of the best (alpha, beta)
+  """
+  greedy_counts = np.asarray(greedy_counts)
+  columns = {
+    'audio_filepath': pa.array(audio_filepaths, pa.string()),
+    'duration': pa.array(durations, pa.float32()),
+    'reference': pa.array(references, pa.string()),
+    'ref_len': pa.array(greedy_counts[:, 0], pa.int32()),
+    'greedy': pa.array(greedy, pa.string()),
+  }
+  for k, name in enumerate(ERROR_COLUMNS):
+    columns['greedy_' + name] = pa.array(greedy_counts[:, k + 1], pa.int32())
+  if beam is not None:
+    beam_counts = np.asarray(beam_counts)
+    columns['beam'] = pa.array(beam, pa.string())
+    for k, name in enumerate(ERROR_COLUMNS):
+      columns['beam_' + name] = pa.array(beam_counts[:, k + 1], pa.int32())
+  pq.write_table(pa.table(columns), path, row_group_size=ROW_GROUP_SIZE)
+
+
+def read_utterance_results(path, columns=None, worst=None, lm=False):
+  """Per utterance results as a DataFrame (index: utterance in dataset order)
+  Arguments:
+    path: .parquet of write_utterance_results
+    columns: columns to load (default all)
+    worst: only the worst utterances by error count (ties: longer
+           references first)
+    lm: rank the worst utterances by the beam errors
+  """
+  pfile = pq.ParquetFile(path)
+  if worst is None:
+    df = pfile.read(columns=columns).to_pandas()
+    df.index.name = 'utterance'
+    return df
+
+  # rank on the count columns, then read the row groups of the selected rows
+  prefix = 'beam_' if lm else 'greedy_'
+  if lm and prefix + ERROR_COLUMNS[0] not in pfile.schema_arrow.names:
+    raise ValueError('{}: results have no LM (beam) errors'.format(path))
+  counts = pfile.read(columns=['ref_len'] + [prefix + c for c in ERROR_COLUMNS]).to_pandas()
+  errors = counts[[prefix + c for c in ERROR_COLUMNS]].sum(axis=1)
+  order = np.lexsort((-counts['ref_len'].values, -errors.values))[:worst]
+  starts = np.cumsum([0] + [pfile.metadata.row_group(g).num_rows
+                            for g in range(pfile.num_row_groups)])
+  group_of = np.searchsorted(starts, order, side='right') - 1
+  groups = sorted(set(group_of))
+  table = pfile.read_row_groups(groups, columns=columns).to_pandas()
+  # row of each selected utterance in the concatenated row groups
+  offsets, total = {}, 0
+  for g in groups:
+    offsets[g] = total - starts[g]
+    total += starts[g + 1] - starts[g]
+  rows = [i + offsets[g] for i, g in zip(order, group_of)]
+  df = table.iloc[rows].copy()
+  df.index = order
+  df.index.name = 'utterance'
+  df['errors'] = errors.values[order]
+  return df
@@ -1,89 +1,223 @@
 # Utility functions to display and parse transcripts
 import json
 import os
+import re
+import unidecode
+from functools import lru_cache, partial
+from multiprocessing import Pool
 from num2words import num2words
+from tools.manifest_tools import imap_bounded
 
-def to_lower(transcript):
-  """Send string or list of strings to lowercase"""
+def _lazy_map(fn, strings):
+  for string in strings:
+    if not isinstance(string, str):
+      raise TypeError("Only accepts strings or list of strings")
+    yield fn(string)
+
+def _map_transcript(fn, transcript):
+  """Apply fn to a string, to a list of strings (returns a list) or lazily to
+  any other iterable of strings such as a generator or an open file (returns a
+  generator, so large corpora can be processed as a stream)"""
   if isinstance(transcript, str):
-    return transcript.lower()
-  elif all(isinstance(item, str) for item in transcript):
-    return [w.lower() for w in transcript]
-  else:
+    return fn(transcript)
+  strings = iter(transcript)
+  if hasattr(transcript, '__len__'):
+    if all(isinstance(item, str) for item in transcript):
+      return [fn(string) for string in transcript]
     raise TypeError("Only accepts strings or list of strings")
+  return _lazy_map(fn, strings)
+
+def to_lower(transcript):
+  """Send string, list of strings or iterable of strings to lowercase"""
+  return _map_transcript(str.lower, transcript)
+
+class _VocabTable(dict):
+  """str.translate table filled on first use of each character:
+  vocabulary characters are kept, other characters are replaced by their
+  accent folded version if it is in the vocabulary, or by a space"""
+
+  def __init__(self, vocab):
+    super(_VocabTable, self).__init__()
+    self.vocab = frozenset(vocab)
+
+  def __missing__(self, code):
+    c = chr(code)
+    if c in self.vocab:
+      value = c
+    else:
+      # remove accent and see if it is valid
+      non_accent_c = unidecode.unidecode(c)
+      value = non_accent_c if non_accent_c in self.vocab else ' '
+    self[code] = value
+    return value
+
+class TextNormalizer(object):
+  """Normalize transcripts to the characters of a language vocabulary in one
+  pass: lowercase, accent folding of out of vocabulary characters, removal of
+  unknown characters and whitespace collapsing.
+  Arguments:
+    vocab: valid characters (including the space)
+    lowercase: lowercase and strip the text first
+    fold_all: unidecode the whole text before checking the vocabulary
+  """
+
+  def __init__(self, vocab, lowercase=True, fold_all=False):
+    self.vocab = tuple(vocab)
+    self.lowercase = lowercase
+    self.fold_all = fold_all
+    self._table = _VocabTable(self.vocab)
+
+  def normalize(self, txt):
+    """Normalize a single string"""
+    if self.lowercase:
+      txt = txt.lower().strip()
+    if self.fold_all:
+      txt = unidecode.unidecode(txt)
+    return ' '.join(txt.translate(self._table).split())
+
+  def normalize_batch(self, texts):
+    """Normalize a pandas Series (NaN entries are kept) or an iterable of
+    strings (returns a list)"""
+    if hasattr(texts, 'str'):
+      if self.lowercase:
+        texts = texts.str.lower()
+      if self.fold_all:
+        texts = texts.map(unidecode.unidecode, na_action='ignore')
+      return texts.str.translate(self._table).str.split().str.join(' ')
+    return [self.normalize(txt) for txt in texts]
+
+  def __call__(self, text):
+    """Normalize a string, a pandas Series or a list of strings"""
+    if isinstance(text, str):
+      return self.normalize(text)
+    return self.normalize_batch(text)
+
+@lru_cache(maxsize=None)
+def _cached_normalizer(vocab, lowercase, fold_all):
+  return TextNormalizer(vocab, lowercase=lowercase, fold_all=fold_all)
+
+def vocab_normalizer(vocab, lowercase=True, fold_all=False):
+  """Shared TextNormalizer for a vocabulary (built once per process)"""
+  return _cached_normalizer(tuple(vocab), lowercase, fold_all)
+
+# hyphens are replaced by a space, any other punctuation is deleted
+_PUNCTUATIONS = '''!()-[]{};:"\\,<>./?@#$%^&*_~“„’´ʻ…–'''
+_SPACED_PUNCTUATIONS = '''-–'''
+
+def _punct_table(punctuations):
+  deleted = ''.join(p for p in punctuations if p not in _SPACED_PUNCTUATIONS)
+  return str.maketrans(_SPACED_PUNCTUATIONS, ' ' * len(_SPACED_PUNCTUATIONS), deleted)
+
+# one translation table per all_p mode (all_p also removes ')
+_PUNCT_TABLES = {
+  False: _punct_table(_PUNCTUATIONS),
+  True: _punct_table(_PUNCTUATIONS + "'"),
+}
 
 def del_p(string, all_p=False):
   """Delete punctuation"""
-  punctuations ='''!()-[]{};:"\,<>./?@#$%^&*_~“„’´ʻ…–'''
-  if all_p:
-    # also remove '
-    punctuations ='''!()-[]{};:'"\,<>./?@#$%^&*_~“„’´ʻ…–'''
-  for x in string:
-    if x in punctuations:
-      if x in '''-–''':
-        string = string.replace(x, " ")
-      else:
-        string = string.replace(x, "")
-  return string
+  return string.translate(_PUNCT_TABLES[bool(all_p)])
 
 def remove_punct(transcript, all_p=False):
-  """Remove punctuation from string or list of strings"""
-  # string, list of strings
-  if isinstance(transcript, str):
-    return del_p(transcript, all_p)
-  elif all(isinstance(item, str) for item in transcript):
-    return [del_p(string, all_p) for string in transcript]
-  else:
-    raise TypeError("Only accepts strings or list of strings")
+  """Remove punctuation from string, list of strings or iterable of strings"""
+  table = _PUNCT_TABLES[bool(all_p)]
+  return _map_transcript(lambda string: string.translate(table), transcript)
+
+# max number of distinct (token, lang) expansions kept by dig_to_words
+NUM_CACHE_SIZE = 100000
+# whitespace separated tokens that contain a digit
+_DIGIT_TOKEN = re.compile(r'\S*\d\S*')
+
+def _number_token_words(word, ln):
+  """Words of a token with digits, e.g. 3d -> three d"""
+  if word.isdigit():
+    # digits only
+    return num2words(word, lang=ln).replace("-"," ").replace(",","")
+  # digits with letters, e.g. 3d
+  # identify letters/digits and split
+  numbers = ''.join([x for x in word if x.isdigit()])
+  chars = ''.join([x for x in word if not x.isdigit()])
+  num_tmp = num2words(numbers, lang=ln).replace("-"," ").replace(",","")
+  return num_tmp + " " + chars
+
+_expand_number_token = lru_cache(maxsize=NUM_CACHE_SIZE)(_number_token_words)
+# cache hits and misses of the remove_digits pool workers
+_worker_cache_stats = [0, 0]
+
+def number_cache_info():
+  """Hits, misses, maxsize and currsize of the dig_to_words cache. Hits and
+  misses include the pool workers of remove_digits, currsize is the cache
+  of the current process"""
+  info = _expand_number_token.cache_info()
+  return info._replace(hits=info.hits + _worker_cache_stats[0],
+                       misses=info.misses + _worker_cache_stats[1])
+
+def set_number_cache_size(maxsize):
+  """Resize (and clear) the dig_to_words cache"""
+  global _expand_number_token
+  _expand_number_token = lru_cache(maxsize=maxsize)(_number_token_words)
+  _worker_cache_stats[:] = [0, 0]
 
 def dig_to_words(string, ln='en'):
   """Convert digits to words"""
-  punctuations = '''!()-[]{};:"\,<>./?@#$%^&*_~'''
-  #print(string)
-  words = string.split()
-  for i, word in enumerate(words):
-    if any(i.isdigit() for i in word):
-      if word.isdigit():
-        # digits only
-        num =  num2words(word, lang=ln).replace("-"," ").replace(",","")
-        if word[-1] in punctuations:
-          # digit ends with punctuation must still add it back
-          words[i] = num + word[-1]
-        else:
-          words[i] = num
-      else:
-        # digits with letters, e.g. 3d
-        # identify letters/digits and split
-        numbers = [x for x in word if x.isdigit()]
-        numbers = ''.join(numbers)
-        chars = [x for x in word if not x.isdigit()]
-        chars = ''.join(chars)
-        num_tmp =  num2words(numbers, lang=ln).replace("-"," ").replace(",","")
-        words[i] = num_tmp + " " + chars
-  return ' '.join(words)
-
-def remove_digits(transcript, lang='en'):
-  """Convert digits to words from string or list of strings.
-  You can specify what language to use."""
-  # string, list of strings
-  if isinstance(transcript, str):
-    return dig_to_words(transcript, ln=lang)
-  elif all(isinstance(item, str) for item in transcript):
-    return [dig_to_words(string, ln=lang) for string in transcript]
-  else:
-    raise TypeError("Only accepts strings or list of strings")
+  string = ' '.join(string.split())
+  # only tokens with digits are expanded, repeated tokens come from the cache
+  return _DIGIT_TOKEN.sub(lambda m: _expand_number_token(m.group(0), ln), string)
+
+def _dig_to_words_chunk(strings, ln):
+  """dig_to_words of a chunk in a pool worker, with the cache hits and misses
+  of the chunk"""
+  before = _expand_number_token.cache_info()
+  words = [dig_to_words(string, ln) for string in strings]
+  after = _expand_number_token.cache_info()
+  return words, after.hits - before.hits, after.misses - before.misses
+
+def _chunks(strings, chunksize):
+  chunk = []
+  for string in strings:
+    chunk.append(string)
+    if len(chunk) == chunksize:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+def _add_worker_stats(results):
+  for words, hits, misses in results:
+    _worker_cache_stats[0] += hits
+    _worker_cache_stats[1] += misses
+    yield words
+
+def remove_digits(transcript, lang='en', num_workers=1, chunksize=1000):
+  """Convert digits to words from string, list of strings or iterable of strings.
+  You can specify what language to use.
+  With num_workers > 1 lists and iterables are converted by a process pool,
+  in order (iterables are still consumed lazily)."""
+  if num_workers <= 1 or isinstance(transcript, str):
+    return _map_transcript(partial(dig_to_words, ln=lang), transcript)
+  fn = partial(_dig_to_words_chunk, ln=lang)
+  if hasattr(transcript, '__len__'):
+    if not all(isinstance(item, str) for item in transcript):
+      raise TypeError("Only accepts strings or list of strings")
+    with Pool(num_workers) as p:
+      results = p.map(fn, _chunks(transcript, chunksize))
+    return [words for chunk in _add_worker_stats(results) for words in chunk]
+  return _parallel_map(fn, transcript, num_workers, chunksize)
+
+def _parallel_map(fn, strings, num_workers, chunksize):
+  with Pool(num_workers) as p:
+    results = imap_bounded(p, fn, _chunks(_lazy_map(str, strings), chunksize),
+                           ordered=True)
+    for chunk in _add_worker_stats(results):
+      for words in chunk:
+        yield words
 
 
 def remove_abbrv(transcript, old, new):
-  """Remove abbreviations from string or list of strings."""
-  # string, list of strings
-  if isinstance(transcript, str):
-    return transcript.replace(old, new)
-  elif all(isinstance(item, str) for item in transcript):
-    return [string.replace(old, new) for string in transcript]
-  else:
-    raise TypeError("Only accepts strings or list of strings")
+  """Remove abbreviations from string, list of strings or iterable of strings."""
+  return _map_transcript(lambda string: string.replace(old, new), transcript)
 
 def normalize(text, lang='en'):
-  """Function to Normalize text (English digit convertion)"""
+  """Function to Normalize text (English digit convertion).
+  Iterables other than lists are normalized lazily."""
   return remove_digits(remove_punct(to_lower(text)), lang=lang)
@@ -0,0 +1,191 @@
+# Copyright (c) 2019 NVIDIA Corporation
+import os
+from multiprocessing import Pool
+import numpy as np
+
+"""Word/character error rates with per utterance substitution, deletion and
+insertion counts. Edit distances of a batch of utterances of similar lengths
+are computed together with NumPy, one reference token at a time (the
+insertion chain of a row is a running minimum), and the edit paths are
+traced back for the whole batch at once. References are tokenized once so a
+grid of hypotheses sets only tokenizes the hypotheses, and large sets are
+spread over a process pool.
+"""
+
+# columns of the counts arrays
+REF_LEN, SUB, DEL, INS = range(4)
+
+# utterances per pool task, smaller sets are scored in process
+CHUNK_SIZE = 2000
+
+# max cells of the distance matrices of one batch
+BATCH_CELLS = 1 << 22
+
+# shared with the forked pool workers, set by WERScorer
+_scorer_state = {}
+
+
+def tokenize(text, use_cer=False):
+  """Words of a transcript, or its characters (spaces included, as NeMo's
+  word_error_rate with use_cer)"""
+  return list(text) if use_cer else text.split()
+
+
+def _pad(seqs, value):
+  # at least one column, the path trace reads a token of empty sequences
+  width = max(1, max(len(s) for s in seqs))
+  padded = np.full((len(seqs), width), value, dtype=np.int64)
+  for b, s in enumerate(seqs):
+    padded[b, :len(s)] = s
+  return padded
+
+
+def batch_edit_ops(refs, hyps):
+  """Substitutions, deletions and insertions (B x 3) of a minimum edit path
+  between each pair of int arrays"""
+  batch = np.arange(len(refs))
+  n = np.array([len(r) for r in refs])
+  m = np.array([len(h) for h in hyps])
+  # pads never compare equal, cells past the lengths are not used
+  ref = _pad(refs, -2)
+  hyp = _pad(hyps, -3)
+  cols = np.arange(max(m) + 1)
+  d = np.empty((len(refs), max(n) + 1, max(m) + 1), dtype=np.int32)
+  d[:, 0] = cols
+  for i in range(1, max(n) + 1):
+    prev = d[:, i - 1]
+    row = np.empty_like(prev)
+    row[:, 0] = i
+    # deletion or substitution/match, then the chain of insertions along
+    # the row: row[j] = min_k(row[k] + j - k)
+    row[:, 1:] = np.minimum(prev[:, 1:] + 1,
+                            prev[:, :-1] + (hyp != ref[:, i - 1:i]))
+    d[:, i] = np.minimum.accumulate(row - cols, axis=1) + cols
+
+  ops = np.zeros((len(refs), 3), dtype=np.int64)
+  i, j = n.copy(), m.copy()
+  while True:
+    active = (i > 0) | (j > 0)
+    if not active.any():
+      return ops
+    im, jm = np.maximum(i - 1, 0), np.maximum(j - 1, 0)
+    cell = d[batch, i, j]
+    neq = ref[batch, im] != hyp[batch, jm]
+    diag = (i > 0) & (j > 0) & (cell == d[batch, im, jm] + neq)
+    dele = ~diag & (i > 0) & (cell == d[batch, im, j] + 1)
+    ins = active & ~diag & ~dele
+    ops[:, 0] += diag & neq
+    ops[:, 1] += dele
+    ops[:, 2] += ins
+    i = i - (diag | dele)
+    j = j - (diag | ins)
+
+
+def edit_ops(ref, hyp):
+  """(substitutions, deletions, insertions) of a minimum edit path between
+  two int arrays"""
+  return tuple(int(c) for c in batch_edit_ops([ref], [hyp])[0])
+
+
+def _encode(tokens, token_ids):
+  # hypothesis tokens out of the references get -1, which matches no
+  # reference token
+  return np.array([token_ids.get(t, -1) for t in tokens], dtype=np.int64)
+
+
+def _count_chunk(chunk):
+  start, hypotheses = chunk
+  state = _scorer_state
+  refs = state['references'][start:start + len(hypotheses)]
+  hyps = [_encode(tokenize(h, state['use_cer']), state['token_ids'])
+          for h in hypotheses]
+  counts = np.zeros((len(hyps), 4), dtype=np.int64)
+  counts[:, REF_LEN] = [len(r) for r in refs]
+  # batches of similar lengths keep the padded matrices small
+  order = sorted(range(len(hyps)), key=lambda k: (len(refs[k]), len(hyps[k])))
+  batch, max_n, max_m = [], 0, 0
+  for k in order + [None]:
+    if k is not None:
+      n, m = max(max_n, len(refs[k])), max(max_m, len(hyps[k]))
+      if not batch or (len(batch) + 1) * (n + 1) * (m + 1) <= BATCH_CELLS:
+        batch.append(k)
+        max_n, max_m = n, m
+        continue
+    counts[batch, 1:] = batch_edit_ops([refs[b] for b in batch],
+                                       [hyps[b] for b in batch])
+    if k is not None:
+      batch, max_n, max_m = [k], len(refs[k]), len(hyps[k])
+  return counts
+
+
+class WERScorer(object):
+  """Error counts of hypotheses sets against fixed references
+  Arguments:
+    references: reference transcripts
+    use_cer: character error rate instead of word error rate
+    num_cpus: processes for sets of more than CHUNK_SIZE hypotheses
+              (default all cpus)
+  """
+
+  def __init__(self, references, use_cer=False, num_cpus=None):
+    self.use_cer = use_cer
+    self.num_cpus = num_cpus or os.cpu_count()
+    self.token_ids = {}
+    self.references = []
+    for text in references:
+      tokens = tokenize(text, use_cer)
+      for t in tokens:
+        self.token_ids.setdefault(t, len(self.token_ids))
+      self.references.append(_encode(tokens, self.token_ids))
+    self._pool = None
+
+  def counts(self, hypotheses):
+    """Per utterance counts (N x 4: REF_LEN, SUB, DEL, INS)"""
+    if len(hypotheses) != len(self.references):
+      raise ValueError("In word error rate calculation, hypotheses and reference"
+                       " lists must have the same number of elements.")
+    _scorer_state.update(references=self.references, token_ids=self.token_ids,
+                         use_cer=self.use_cer)
+    chunks = [(start, hypotheses[start:start + CHUNK_SIZE])
+              for start in range(0, len(hypotheses), CHUNK_SIZE)]
+    if len(chunks) < 2 or self.num_cpus < 2:
+      results = [_count_chunk(chunk) for chunk in chunks]
+    else:
+      if self._pool is None:
+        # forked workers see _scorer_state, only hypotheses are sent
+        self._pool = Pool(min(self.num_cpus, len(chunks)))
+      results = self._pool.map(_count_chunk, chunks)
+    if not results:
+      return np.zeros((0, 4), dtype=np.int64)
+    return np.concatenate(results)
+
+  def wer(self, hypotheses):
+    """Corpus error rate of a hypotheses set"""
+    return error_rate(self.counts(hypotheses))
+
+  def close(self):
+    if self._pool is not None:
+      self._pool.close()
+      self._pool.join()
+      self._pool = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def error_rate(counts):
+  """Corpus error rate (S + D + I) / N of per utterance counts"""
+  counts = np.asarray(counts)
+  n = counts[:, REF_LEN].sum()
+  errors = counts[:, SUB:].sum()
+  # as NeMo: inf without reference words
+  return float(errors) / n if n else float('inf')
+
+
+def word_error_rate(hypotheses, references, use_cer=False):
+  """Drop-in for nemo.collections.asr.helpers.word_error_rate"""
+  with WERScorer(references, use_cer=use_cer) as scorer:
+    return scorer.wer(hypotheses)